@@ -0,0 +1,9 @@
+"""Run the backend: `python -m backend`.
+
+Kept tiny on purpose: multiprocessing children skip a `__main__` module
+they would otherwise re-run, so spawned workers import only their own
+module, not app.py (see `app.main`).
+"""
+from .app import main
+
+main()
@@ -1,4 +1,6 @@
 import os
+import json
+import atexit
 import time
 import threading
 import shutil
@@ -21,40 +23,74 @@ except Exception:
             return 0
     GPIO = _MockGPIO()
 
+# Only probe for the DHT driver here; the sensor itself is opened inside the
+# DHT worker process (see dht_worker.py).
 try:
-    import board
-    import adafruit_dht as adafruit_circ_dht
+    import board  # noqa: F401
+    import adafruit_dht  # noqa: F401
     _DHT_LIB = 'circuitpython'
 except Exception:
-    adafruit_circ_dht = None
-    board = None
     _DHT_LIB = 'mock'
 
-from flask import Flask, render_template_string, jsonify, request, send_from_directory, redirect, session
+from flask import Flask, Response, g, render_template_string, jsonify, request, send_from_directory, redirect, session
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import create_engine, text, Table, Column, Integer, String, MetaData
+from werkzeug.utils import secure_filename
+from sqlalchemy import create_engine, event, inspect, text, Table, Column, Integer, BigInteger, String, MetaData, Index
 from sqlalchemy.engine import Engine
 
+try:
+    from .sensor_hub import SensorHub
+    from .sensor_store import SensorStore
+    from .motion_source import MotionDebouncer, GPIOEdgeSource, PollingSource
+    from .dht_worker import DHTWorker, CircuitPythonDHT, MIN_READ_INTERVAL
+    from .metrics import registry as metrics_registry
+    from .profiler import RequestProfiler
+    from .media_catalog import MediaCatalog, device_dir
+    from .media_thumbs import ThumbnailWorker
+    from .media_variants import ImageOptimizer
+    from .mp4_faststart import faststart_tree
+    from .media_uploads import UploadManager
+    from .media_blobs import BlobStore
+    from .media_fetch import FetchQueue
+    from .media_admission import UploadAdmission
+except ImportError:
+    from sensor_hub import SensorHub  # fallback when running app.py directly
+    from sensor_store import SensorStore
+    from motion_source import MotionDebouncer, GPIOEdgeSource, PollingSource
+    from dht_worker import DHTWorker, CircuitPythonDHT, MIN_READ_INTERVAL
+    from metrics import registry as metrics_registry
+    from profiler import RequestProfiler
+    from media_catalog import MediaCatalog, device_dir
+    from media_thumbs import ThumbnailWorker
+    from media_variants import ImageOptimizer
+    from mp4_faststart import faststart_tree
+    from media_uploads import UploadManager
+    from media_blobs import BlobStore
+    from media_fetch import FetchQueue
+    from media_admission import UploadAdmission
+
 PIR_PIN = 17
 DHT_PIN = 4
 DHT_TYPE = 'DHT11'
-_dht_sensor_obj = None
-if _DHT_LIB == 'circuitpython':
-    try:
-        if board is not None:
-            board_pin = getattr(board, f'D{DHT_PIN}')
-            _dht_sensor_obj = adafruit_circ_dht.DHT11(board_pin) if DHT_TYPE == 'DHT11' else adafruit_circ_dht.DHT22(board_pin)
-    except Exception:
-        _dht_sensor_obj = None
+DHT_INTERVAL_SEC = 10
 PIR_ACTIVE_VALUE = 1
-PIR_DEBOUNCE_READS = 2
+PIR_DEBOUNCE_SEC = 0.2
+PIR_POLL_INTERVAL_SEC = 0.5
+STATUS_STREAM_HEARTBEAT_SEC = 15
+STATUS_LONG_POLL_MAX_SEC = 30
+SENSOR_HISTORY_SAMPLES = 17280  # 48 h of 10 s DHT reads, incl. motion edges
+STATUS_HISTORY_MAX_BUCKETS = 1440
+MEDIA_DISPLAY_SIZE = tuple(int(v) for v in os.environ.get('SSSNL_DISPLAY_SIZE', '1920x1080').lower().split('x'))
+MEDIA_VARIANT_FORMAT = os.environ.get('SSSNL_VARIANT_FORMAT', 'jpeg')  # or 'webp'
 
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(PIR_PIN, GPIO.IN)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-sssnl')
+# Largest request body accepted (bigger files go through /api/media/uploads).
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('SSSNL_MAX_UPLOAD_BYTES', str(2 << 30)))
 
 # Configure CORS to allow web/mobile dev origins with credentials
 _cors_origins = os.environ.get('CORS_ORIGINS', '')
@@ -82,6 +118,38 @@ os.makedirs(DATA_DIR, exist_ok=True)
 USERS_DB_PATH = os.path.join(DATA_DIR, 'users.db')
 DB_URI = os.environ.get('DB_URI') or f"sqlite:///{USERS_DB_PATH}"
 _db_engine: Engine = create_engine(DB_URI, pool_pre_ping=True, future=True)
+
+# Metrics
+_http_requests = metrics_registry.counter('sssnl_http_requests_total', 'HTTP requests by route and status.', ('method', 'route', 'status'))
+_http_latency = metrics_registry.histogram('sssnl_http_request_duration_seconds', 'Time to produce a response.', ('method', 'route'))
+_db_query_latency = metrics_registry.histogram('sssnl_db_query_duration_seconds', 'SQL statement execution time.', ('op',))
+_password_verify_latency = metrics_registry.histogram('sssnl_password_verify_duration_seconds', 'Password/secret hash verification time.', buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+_sensor_read_latency = metrics_registry.histogram('sssnl_sensor_read_duration_seconds', 'Sensor driver read time.', ('sensor',))
+_sensor_read_failures = metrics_registry.counter('sssnl_sensor_read_failures_total', 'Failed sensor reads.', ('sensor',))
+_playback_first_frame = metrics_registry.histogram('sssnl_playback_first_frame_seconds', 'Dashboard time from motion to the first playlist item on screen.', buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+_playback_gap = metrics_registry.histogram('sssnl_playback_transition_gap_seconds', 'Dashboard time from one playlist item ending to the next on screen.', buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+@event.listens_for(_db_engine, 'before_cursor_execute')
+def _db_before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(_db_engine, 'after_cursor_execute')
+def _db_after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    op = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    _db_query_latency.observe(time.perf_counter() - started, (op,))
+
+@event.listens_for(_db_engine, 'handle_error')
+def _db_execute_error(ctx):
+    if ctx.connection is not None and ctx.connection.info.get('query_start'):
+        ctx.connection.info['query_start'].pop()
+
+def _verify_password(pwhash: str, password: str) -> bool:
+    started = time.perf_counter()
+    try:
+        return check_password_hash(pwhash, password)
+    finally:
+        _password_verify_latency.observe(time.perf_counter() - started)
 _metadata = MetaData()
 users_table = Table(
     'users', _metadata,
@@ -108,6 +176,45 @@ devices_table = Table(
     Column('pairing_expires', Integer, nullable=True),
 )
 
+# Per-device kiosk resolution used to size image variants
+device_displays_table = Table(
+    'device_displays', _metadata,
+    Column('device_id', String(64), primary_key=True),
+    Column('width', Integer, nullable=False),
+    Column('height', Integer, nullable=False),
+)
+
+# Media library: one row per file under static/media/<owner>[/<device_mac>]
+media_items_table = Table(
+    'media_items', _metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('owner', String(255), nullable=False),
+    Column('device_mac', String(64), nullable=False, default=''),
+    Column('filename', String(255), nullable=False),
+    Column('type', String(16), nullable=False),
+    Column('size', BigInteger, nullable=False),
+    Column('sha256', String(64), nullable=True),
+    Column('width', Integer, nullable=True),
+    Column('height', Integer, nullable=True),
+    Column('duration_ms', Integer, nullable=True),
+    Column('mtime', Integer, nullable=False),
+    Column('sort_order', Integer, nullable=False, default=0),
+    Column('variant', String(255), nullable=True),
+    Index('ix_media_items_owner_device', 'owner', 'device_mac', 'filename', unique=True),
+)
+
+# Running totals of media_items per (owner, device dir), kept by the catalog
+media_usage_table = Table(
+    'media_usage', _metadata,
+    Column('owner', String(255), primary_key=True),
+    Column('device_mac', String(64), primary_key=True, default=''),
+    Column('files', Integer, nullable=False, default=0),
+    Column('bytes', BigInteger, nullable=False, default=0),
+)
+
+# Sensor history: raw samples plus 1m/1h rollups, written in batches
+sensor_store = SensorStore(_db_engine, _metadata)
+
 def _gen_device_id() -> str:
     import secrets, string
     base = ''.join(secrets.choice(string.ascii_lowercase + string.digits) for _ in range(10))
@@ -120,6 +227,44 @@ def _gen_pairing_code() -> str:
 def _db_connect():
     return _db_engine.connect()
 
+# media_items index of static/media, shared with the media blueprint
+media_blobs = BlobStore(os.path.join(STATIC_DIR, 'blobs'))
+media_catalog = MediaCatalog(_db_engine, os.path.join(STATIC_DIR, 'media'), blobs=media_blobs)
+app.extensions['media_catalog'] = media_catalog
+media_thumbs = ThumbnailWorker(os.path.join(STATIC_DIR, 'thumbs'))
+media_catalog.add_listener(media_thumbs.submit)
+media_catalog.add_reclaim_listener(media_thumbs.discard)
+app.extensions['media_thumbs'] = media_thumbs
+
+def _display_size_for(owner, device_dir_name) -> tuple[int, int]:
+    """Configured display size of the owner's device whose media dir is `device_dir_name`."""
+    if owner and device_dir_name:
+        with _db_engine.connect() as conn:
+            rows = conn.execute(text('SELECT d.mac, x.width, x.height FROM devices d JOIN device_displays x '
+                                     'ON x.device_id=d.device_id WHERE d.owner_username=:o'), {'o': owner}).fetchall()
+        for mac, width, height in rows:
+            if device_dir(mac) == device_dir_name:
+                return width, height
+    return MEDIA_DISPLAY_SIZE
+
+media_variants = ImageOptimizer(os.path.join(STATIC_DIR, 'variants'), target_for=_display_size_for,
+                                on_variant=media_catalog.set_variant, fmt=MEDIA_VARIANT_FORMAT)
+media_catalog.add_listener(media_variants.submit)
+media_catalog.add_reclaim_listener(media_variants.discard)
+
+# Resumable upload sessions (state survives restarts)
+media_uploads = UploadManager(os.path.join(DATA_DIR, 'uploads'))
+app.extensions['media_uploads'] = media_uploads
+
+# Background downloads for /api/media/fetch
+media_fetches = FetchQueue(workers=int(os.environ.get('SSSNL_FETCH_WORKERS', '2')),
+                           max_bytes=int(os.environ.get('SSSNL_FETCH_MAX_BYTES', str(2 << 30))))
+app.extensions['media_fetches'] = media_fetches
+# Upload bodies admitted at once: total declared bytes and requests per user.
+media_admission = UploadAdmission(max_inflight_bytes=int(os.environ.get('SSSNL_UPLOAD_INFLIGHT_BYTES', str(512 << 20))),
+                                  per_user=int(os.environ.get('SSSNL_UPLOADS_PER_USER', '2')))
+app.extensions['media_admission'] = media_admission
+
 # Register media blueprint (supports running as module or script)
 try:
     from .media_admin import bp as media_uploader_bp
@@ -131,88 +276,158 @@ except Exception:
     except Exception as e:
         print('Warning: media_uploader blueprint not registered:', e)
 
-current_temp = "--"
-current_hum = "--"
-motion_active = False
-motion_status_msg = "No motion"
-last_dht_time = None
-last_dht_success = False
-last_motion_raw = None
-last_motion_change = None
 mock_motion_override = None
 mock_dht_override = None
 
-dht_lock = threading.Lock()
+# Live sensor state. Writers call the hub's record_* methods; readers take
+# one snapshot per response and never block.
+sensor_hub = SensorHub(SENSOR_HISTORY_SAMPLES)
+sensor_hub.add_listener(sensor_store.enqueue)
+
+# Real DHT hardware is read in a supervised child process
+dht_worker = DHTWorker(CircuitPythonDHT(DHT_PIN, DHT_TYPE), interval=DHT_INTERVAL_SEC, min_interval=MIN_READ_INTERVAL[DHT_TYPE]) if _DHT_LIB == 'circuitpython' else None
 
 # Sensor threads
 
+_dht_prev_failures = 0
+
+def _on_dht_reading(reading):
+    global _dht_prev_failures
+    if 'latency' in reading:
+        _sensor_read_latency.observe(reading['latency'], ('dht',))
+        failures = reading['failures']
+        # The worker's counts restart from zero when the child is respawned.
+        _sensor_read_failures.inc(failures - _dht_prev_failures if failures >= _dht_prev_failures else failures, ('dht',))
+        _dht_prev_failures = failures
+    if mock_dht_override is not None:
+        sensor_hub.record_dht(mock_dht_override.get('temp'), mock_dht_override.get('hum'), time.time())
+    else:
+        sensor_hub.record_dht(reading['temp'], reading['hum'], reading['ts'])
+
+
 def read_dht_sensor():
-    global current_temp, current_hum, motion_status_msg
-    global last_dht_time, last_dht_success
+    if dht_worker is not None:
+        dht_worker.run(_on_dht_reading)
+        return
+    import random
     while True:
-        humidity = None
-        temperature = None
-        try:
-            with dht_lock:
-                if mock_dht_override is not None:
-                    temperature = mock_dht_override.get('temp')
-                    humidity = mock_dht_override.get('hum')
-                elif _DHT_LIB == 'circuitpython' and _dht_sensor_obj is not None:
-                    try:
-                        temperature = _dht_sensor_obj.temperature
-                        humidity = _dht_sensor_obj.humidity
-                    except Exception:
-                        temperature = None
-                        humidity = None
-                else:
-                    import random
-                    temperature = 20.0 + random.random() * 6.0
-                    humidity = 40.0 + random.random() * 20.0
-        except Exception:
-            humidity, temperature = None, None
-        if humidity is not None and temperature is not None:
-            current_temp = f"{temperature:.1f}°C"
-            current_hum = f"{humidity:.1f}%"
-            last_dht_time = time.time()
-            last_dht_success = True
-        else:
-            last_dht_success = False
-        motion_status_msg = "Motion detected" if motion_active else "No motion"
-        time.sleep(10)
+        reading = {'ts': time.time(), 'temp': 20.0 + random.random() * 6.0, 'hum': 40.0 + random.random() * 20.0}
+        _on_dht_reading(reading)
+        time.sleep(DHT_INTERVAL_SEC)
 
 
-def motion_detector():
-    global motion_active, motion_status_msg, last_motion_raw, last_motion_change
-    consecutive = 0
-    last_state = None
-    while True:
-        raw = GPIO.input(PIR_PIN)
-        last_motion_raw = raw
-        is_motion = (raw == PIR_ACTIVE_VALUE)
-        if mock_motion_override is not None:
-            is_motion = bool(mock_motion_override)
-        if last_state is None:
-            last_state = is_motion
-            consecutive = 1
-        else:
-            if is_motion == last_state:
-                consecutive += 1
-            else:
-                consecutive = 1
-                last_state = is_motion
-        if consecutive >= PIR_DEBOUNCE_READS:
-            if is_motion and not motion_active:
-                motion_active = True
-                motion_status_msg = "Motion detected"
-                last_motion_change = time.time()
-            elif not is_motion and motion_active:
-                motion_active = False
-                motion_status_msg = "No motion"
-                last_motion_change = time.time()
-        time.sleep(0.5)
+# Last level committed by the debouncer; it only reports edges, so clearing
+# the mock override replays this instead of waiting for the next one.
+_real_motion_active = False
+
+def _on_motion_change(is_motion, raw, ts):
+    global _real_motion_active
+    _real_motion_active = is_motion
+    sensor_hub.record_motion_raw(raw)
+    if mock_motion_override is None:
+        sensor_hub.record_motion(is_motion, ts)
+
+
+def motion_detector(source=None):
+    """Run the PIR debouncer, preferring edge callbacks over polling."""
+    debouncer = MotionDebouncer(_on_motion_change, settle_sec=PIR_DEBOUNCE_SEC, active_value=PIR_ACTIVE_VALUE)
+    if source is None:
+        source = GPIOEdgeSource(GPIO, PIR_PIN)
+        try:
+            if not _HAS_GPIO:
+                raise RuntimeError('RPi.GPIO not available')
+            source.start(debouncer)
+        except Exception as e:
+            print('PIR edge detection unavailable, polling instead:', e)
+            source = PollingSource(lambda: GPIO.input(PIR_PIN), interval=PIR_POLL_INTERVAL_SEC)
+            source.start(debouncer)
+    else:
+        source.start(debouncer)
+    debouncer.run()
 
 # Dashboard HTML same as original
-HTML_TEMPLATE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>Shirdi Sai Samaj - Autoplay</title><meta name="viewport" content="width=device-width,initial-scale=1"><style>html,body{height:100%;margin:0;background:black;color:white;font-family:Inter,Arial,sans-serif}.container{position:relative;width:100%;height:100vh;overflow:hidden;background:black;display:flex;align-items:center;justify-content:center}#media-wrapper{position:relative;width:100%;height:100%;background:black}#pl-video,#pl-image{position:absolute;top:0;left:0;width:100%;height:100%;display:none;background:black}#pl-video{object-fit:cover}#pl-image{object-fit:contain}#status-bar{position:fixed;top:12px;left:12px;z-index:60;background:rgba(0,0,0,.50);color:#fff;padding:10px 16px;border-radius:10px;font-size:1.35em;line-height:1.2;box-shadow:0 4px 16px rgba(0,0,0,.65)}.top-msg{position:fixed;top:12px;right:12px;z-index:60;color:#ff6b6b;font-weight:700;font-size:2.4em;background:rgba(0,0,0,.40);padding:16px 24px;border-radius:14px;box-shadow:0 4px 18px rgba(0,0,0,.55)}#pl-video,#pl-image{position:absolute;top:100px;left:0;width:100%;height:calc(100% - 100px);display:none;background:black}.hidden{display:none !important}.center-msg{position:absolute;color:#ddd;font-size:1.2em;text-align:center;left:50%;top:50%;transform:translate(-50%,-50%)}@media (max-width:600px){#status-bar{font-size:1.05em;padding:8px 12px}.top-msg{font-size:1.8em;padding:12px 16px}#pl-video,#pl-image{top:90px;height:calc(100% - 90px)}}</style></head><body><div id="status-bar">Temp: <span id="temp">{{temp}}</span> | Humidity: <span id="hum">{{hum}}</span> | Motion: <span id="motion_txt">{{motion_status}}</span></div><div class="top-msg">🌼 Don't forget to turn off Diyas & close doors 🌼</div><div class="container"><div id="media-wrapper"><video id="pl-video" playsinline muted preload="auto"></video><img id="pl-image" alt="media"/><div id="idle-msg" class="center-msg">Awaiting motion...</div></div></div><script>let playlist=[];const IMAGE_DISPLAY_MS=6000;let playing=false;let motionTriggered=false;function showIdle(yes){const idle=document.getElementById('idle-msg');const vid=document.getElementById('pl-video');const img=document.getElementById('pl-image');if(yes){vid.style.display='none';vid.pause();img.style.display='none';idle.style.display='block'}else{idle.style.display='none'}}function showVideo(){document.getElementById('pl-image').style.display='none';const v=document.getElementById('pl-video');v.style.display='block'}function showImage(){document.getElementById('pl-video').style.display='none';const i=document.getElementById('pl-image');i.style.display='block'}function wait(ms){return new Promise(r=>setTimeout(r,ms))}function waitVideoEnd(videoEl){return new Promise((resolve)=>{let settled=false;function cleanup(){videoEl.removeEventListener('ended',onEnd);videoEl.removeEventListener('error',onError);videoEl.removeEventListener('loadedmetadata',onLoaded);if(timeout)clearTimeout(timeout)}function onEnd(){if(settled)return;settled=true;cleanup();resolve()}function onError(e){if(settled)return;settled=true;cleanup();resolve()}function onLoaded(){setupTimeout()}let timeout=null;function setupTimeout(){if(timeout){clearTimeout(timeout);timeout=null}try{const dur=Number(videoEl.duration)||0;if(dur>0&&isFinite(dur)){timeout=setTimeout(()=>{if(settled)return;settled=true;cleanup();resolve()},(dur*1000)+2500)}}catch(e){}}videoEl.addEventListener('ended',onEnd);videoEl.addEventListener('error',onError);videoEl.addEventListener('loadedmetadata',onLoaded);timeout=setTimeout(()=>{if(settled)return;settled=true;cleanup();resolve()},45000);if(videoEl.ended){onEnd()}})}async function playPlaylistOnce(){if(playing)return;playing=true;motionTriggered=true;showIdle(false);const vid=document.getElementById('pl-video');const img=document.getElementById('pl-image');try{const r=await fetch('/playlist',{cache:'no-store'});if(r.ok){const data=await r.json();playlist=Array.isArray(data.playlist)?data.playlist:[]}else{playlist=[]}}catch(e){playlist=[]}for(const item of playlist){if(item.type==='video'){try{showVideo();vid.muted=true;vid.src=item.src;vid.currentTime=0;try{await vid.play()}catch(e){}await waitVideoEnd(vid)}catch(e){}finally{try{vid.pause();vid.removeAttribute('src');vid.load()}catch(e){}}}else{showImage();img.src=item.src;const ms=item.duration_ms||IMAGE_DISPLAY_MS;await wait(ms)}}playing=false;motionTriggered=false;showIdle(true)}let lastMotionActive=false;async function fetchStatus(){try{const resp=await fetch('/status');if(!resp.ok)return;const data=await resp.json();document.getElementById('temp').innerText=data.temp;document.getElementById('hum').innerText=data.hum;document.getElementById('motion_txt').innerText=data.motion_status;if(data.motion_active&&!motionTriggered&&!playing){playPlaylistOnce()}}catch(e){}}window.addEventListener('load',()=>{showIdle(true);fetchStatus();setInterval(fetchStatus,1500)});</script></body></html>"""
+HTML_TEMPLATE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>Shirdi Sai Samaj - Autoplay</title><meta name="viewport" content="width=device-width,initial-scale=1"><style>html,body{height:100%;margin:0;background:black;color:white;font-family:Inter,Arial,sans-serif}.container{position:relative;width:100%;height:100vh;overflow:hidden;background:black;display:flex;align-items:center;justify-content:center}#media-wrapper{position:relative;width:100%;height:100%;background:black}.pl-media{position:absolute;top:0;left:0;width:100%;height:100%;opacity:0;z-index:1;transition:opacity .35s ease;background:black}.pl-media.show{opacity:1;z-index:2}video.pl-media{object-fit:cover}img.pl-media{object-fit:contain}#status-bar{position:fixed;top:12px;left:12px;z-index:60;background:rgba(0,0,0,.50);color:#fff;padding:10px 16px;border-radius:10px;font-size:1.35em;line-height:1.2;box-shadow:0 4px 16px rgba(0,0,0,.65)}.top-msg{position:fixed;top:12px;right:12px;z-index:60;color:#ff6b6b;font-weight:700;font-size:2.4em;background:rgba(0,0,0,.40);padding:16px 24px;border-radius:14px;box-shadow:0 4px 18px rgba(0,0,0,.55)}.pl-media{top:100px;height:calc(100% - 100px)}.hidden{display:none !important}.center-msg{position:absolute;z-index:3;color:#ddd;font-size:1.2em;text-align:center;left:50%;top:50%;transform:translate(-50%,-50%)}@media (max-width:600px){#status-bar{font-size:1.05em;padding:8px 12px}.top-msg{font-size:1.8em;padding:12px 16px}.pl-media{top:90px;height:calc(100% - 90px)}}</style></head><body><div id="status-bar">Temp: <span id="temp">{{temp}}</span> | Humidity: <span id="hum">{{hum}}</span> | Motion: <span id="motion_txt">{{motion_status}}</span></div><div class="top-msg">🌼 Don't forget to turn off Diyas & close doors 🌼</div><div class="container"><div id="media-wrapper"><video id="pl-video-a" class="pl-media" playsinline muted preload="auto"></video><video id="pl-video-b" class="pl-media" playsinline muted preload="auto"></video><img id="pl-image-a" class="pl-media" alt="media"/><img id="pl-image-b" class="pl-media" alt="media"/><div id="idle-msg" class="center-msg">Awaiting motion...</div></div></div><script src="/precache.js"></script><script>let playlist=[];const IMAGE_DISPLAY_MS=6000;const FADE_MS=350;let playing=false;let motionTriggered=false;const pairs={video:[document.getElementById('pl-video-a'),document.getElementById('pl-video-b')],image:[document.getElementById('pl-image-a'),document.getElementById('pl-image-b')]};let shown=null;function releaseEl(el){try{if(el.tagName==='VIDEO'){el.pause();el.removeAttribute('src');el.load()}else{el.removeAttribute('src')}}catch(e){}}function showIdle(yes){const idle=document.getElementById('idle-msg');if(yes){for(const el of [...pairs.video,...pairs.image]){el.classList.remove('show');releaseEl(el)}shown=null;idle.style.display='block'}else{idle.style.display='none'}}function wait(ms){return new Promise(r=>setTimeout(r,ms))}function waitVideoEnd(videoEl,expectedMs){return new Promise((resolve)=>{let settled=false;function cleanup(){videoEl.removeEventListener('ended',onEnd);videoEl.removeEventListener('error',onError);videoEl.removeEventListener('loadedmetadata',onLoaded);if(timeout)clearTimeout(timeout)}function onEnd(){if(settled)return;settled=true;cleanup();resolve()}function onError(e){if(settled)return;settled=true;cleanup();resolve()}function onLoaded(){setupTimeout()}let timeout=null;function setupTimeout(){if(timeout){clearTimeout(timeout);timeout=null}try{const dur=Number(videoEl.duration)||0;if(dur>0&&isFinite(dur)){timeout=setTimeout(()=>{if(settled)return;settled=true;cleanup();resolve()},(dur*1000)+2500)}}catch(e){}}videoEl.addEventListener('ended',onEnd);videoEl.addEventListener('error',onError);videoEl.addEventListener('loadedmetadata',onLoaded);timeout=setTimeout(()=>{if(settled)return;settled=true;cleanup();resolve()},expectedMs?expectedMs+5000:45000);if(videoEl.ended){onEnd()}})}function waitReady(el){return new Promise(resolve=>{if(el.readyState>=3){resolve();return}let t=null;const done=()=>{el.removeEventListener('canplay',done);el.removeEventListener('error',done);clearTimeout(t);resolve()};el.addEventListener('canplay',done);el.addEventListener('error',done);t=setTimeout(done,10000)})}function preload(item){const type=item.type==='video'?'video':'image';const el=pairs[type][0]===shown?pairs[type][1]:pairs[type][0];el.src=item.src;let ready;if(type==='video'){el.muted=true;el.load();ready=waitReady(el)}else{ready=Promise.race([el.decode?el.decode().catch(()=>{}):Promise.resolve(),wait(15000)])}return {item:item,type:type,el:el,ready:ready}}async function present(p){await p.ready;if(p.type==='video'){try{p.el.currentTime=0}catch(e){}try{await p.el.play()}catch(e){}}const prev=shown;p.el.classList.add('show');if(prev&&prev!==p.el)prev.classList.remove('show');shown=p.el;return prev}function reportGaps(firstMs,gaps){try{const body=JSON.stringify({device_mac:new URLSearchParams(location.search).get('device_mac'),first_ms:firstMs,gaps_ms:gaps});if(navigator.sendBeacon){navigator.sendBeacon('/api/playback/gaps',new Blob([body],{type:'application/json'}))}else{fetch('/api/playback/gaps',{method:'POST',headers:{'Content-Type':'application/json'},body:body,keepalive:true})}}catch(e){}}async function playPlaylistOnce(){if(playing)return;playing=true;motionTriggered=true;const started=performance.now();const m=window.sssnlManifest;if(m&&Array.isArray(m.items)){playlist=m.items}else{try{const r=await fetch('/playlist',{cache:'no-store'});if(r.ok){const data=await r.json();playlist=Array.isArray(data.playlist)?data.playlist:[]}else{playlist=[]}}catch(e){playlist=[]}}let firstMs=null;const gaps=[];let next=playlist.length?preload(playlist[0]):null;let endedAt=started;for(let i=0;i<playlist.length;i++){const cur=next;const prev=await present(cur);const gap=Math.round(performance.now()-endedAt);if(i===0){showIdle(false);firstMs=gap}else{gaps.push(gap)}await wait(FADE_MS);if(prev&&prev!==cur.el)releaseEl(prev);next=i+1<playlist.length?preload(playlist[i+1]):null;if(cur.type==='video'){await waitVideoEnd(cur.el,cur.item.duration_ms)}else{await wait(Math.max(0,(cur.item.duration_ms||IMAGE_DISPLAY_MS)-FADE_MS))}endedAt=performance.now()}if(playlist.length)reportGaps(firstMs,gaps);playing=false;motionTriggered=false;showIdle(true)}let lastMotionActive=false;let statusState={};function applyStatus(data){Object.assign(statusState,data);document.getElementById('temp').innerText=statusState.temp;document.getElementById('hum').innerText=statusState.hum;document.getElementById('motion_txt').innerText=statusState.motion_status;if(statusState.motion_active&&!motionTriggered&&!playing){playPlaylistOnce()}}async function fetchStatus(){try{const resp=await fetch('/status');if(!resp.ok)return;applyStatus(await resp.json())}catch(e){}}function startStatusStream(){if(!window.EventSource){fetchStatus();setInterval(fetchStatus,1500);return}const es=new EventSource('/api/status/stream');es.addEventListener('status',(e)=>{statusState={};applyStatus(JSON.parse(e.data))});es.addEventListener('delta',(e)=>applyStatus(JSON.parse(e.data)))}window.addEventListener('load',()=>{showIdle(true);startStatusStream()});</script></body></html>"""
+
+# Kiosk media precache. /precache.js registers /sw.js, polls the playlist
+# manifest while idle (a 304 when nothing changed) and hands new versions
+# to the worker, which downloads items whose sha256 it doesn't hold yet
+# and serves /static/media and /static/variants from its cache, including
+# Range requests for video. Cached entries are dropped once they leave the
+# playlist. Works under --incognito for as long as the browser runs.
+MEDIA_PRECACHE_JS = r"""(function(){
+if(!('serviceWorker' in navigator)||!window.caches)return;
+const mac=new URLSearchParams(location.search).get('device_mac');
+const url='/api/playlist/manifest'+(mac?'?mac='+encodeURIComponent(mac):'');
+const idle=window.requestIdleCallback||(fn=>setTimeout(fn,2000));
+let sent=null;
+async function refresh(){
+  try{
+    const r=await fetch(url,{cache:'no-cache',credentials:'same-origin'});
+    if(!r.ok)return;
+    const m=await r.json();
+    window.sssnlManifest=m;
+    if(m.version===sent)return;
+    const reg=await navigator.serviceWorker.ready;
+    if(reg.active){reg.active.postMessage({type:'precache',items:m.items});sent=m.version}
+  }catch(e){}
+}
+navigator.serviceWorker.register('/sw.js').then(()=>{idle(refresh);setInterval(()=>idle(refresh),60000)}).catch(()=>{});
+})();
+"""
+
+MEDIA_SERVICE_WORKER_JS = r"""const MEDIA='sssnl-media';
+const HASHES='sssnl-media-sha256';
+const MEDIA_PATH=/^\/static\/(media|variants)\//;
+self.addEventListener('install',()=>self.skipWaiting());
+self.addEventListener('activate',e=>e.waitUntil(self.clients.claim()));
+let queue=Promise.resolve();
+self.addEventListener('message',e=>{
+  const d=e.data||{};
+  if(d.type!=='precache'||!Array.isArray(d.items))return;
+  queue=queue.then(()=>precache(d.items)).catch(()=>{});
+  e.waitUntil(queue);
+});
+async function precache(items){
+  const media=await caches.open(MEDIA);
+  const hashes=await caches.open(HASHES);
+  const wanted=new Set();
+  for(const item of items){
+    const url=new URL(item.src,self.location.origin).href;
+    wanted.add(url);
+    const known=await hashes.match(url);
+    if(known&&(await known.text())===item.sha256&&await media.match(url))continue;
+    try{
+      const r=await fetch(url,{credentials:'same-origin'});
+      if(!r.ok)continue;
+      await media.put(url,r);
+      await hashes.put(url,new Response(item.sha256||''));
+    }catch(err){}
+  }
+  for(const req of await media.keys()){
+    if(!wanted.has(req.url)){await media.delete(req);await hashes.delete(req.url)}
+  }
+}
+self.addEventListener('fetch',e=>{
+  const req=e.request;
+  const u=new URL(req.url);
+  if(req.method!=='GET'||u.origin!==self.location.origin||!MEDIA_PATH.test(u.pathname))return;
+  e.respondWith(fromCache(req));
+});
+async function fromCache(req){
+  const hit=await (await caches.open(MEDIA)).match(req.url);
+  if(!hit)return fetch(req);
+  const range=/^bytes=(\d+)-(\d*)$/.exec(req.headers.get('Range')||'');
+  if(!range)return hit;
+  const body=await hit.blob();
+  const start=Number(range[1]);
+  const end=range[2]?Math.min(Number(range[2]),body.size-1):body.size-1;
+  if(start>=body.size)return new Response(null,{status:416,headers:{'Content-Range':'bytes */'+body.size}});
+  const headers=new Headers(hit.headers);
+  headers.set('Content-Range','bytes '+start+'-'+end+'/'+body.size);
+  headers.set('Content-Length',String(end-start+1));
+  return new Response(body.slice(start,end+1),{status:206,headers});
+}
+"""
 
 @app.route("/")
 def index():
@@ -225,19 +440,66 @@ def index():
             'status_api': '/api/status',
             'playlist': '/playlist',
             'playlist_api': '/api/playlist',
+            'playlist_manifest': '/api/playlist/manifest',
             'auth': '/api/auth/*',
             'media': '/api/media/*',
         }
     })
 
+request_profiler = RequestProfiler()
+
+@app.before_request
+def _metrics_start():
+    g.metrics_started = time.perf_counter()
+    route = request.url_rule.rule if request.url_rule is not None else None
+    if request_profiler.should_profile(route):
+        g.profile = request_profiler.start(request.method, route, request.path)
+
+@app.teardown_request
+def _profile_stop(exc):
+    sess = g.pop('profile', None)
+    if sess is not None:
+        request_profiler.stop(sess)
+
+@app.after_request
+def _metrics_observe(resp):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        _http_latency.observe(time.perf_counter() - started, (request.method, route))
+        _http_requests.inc(labels=(request.method, route, str(resp.status_code)))
+    return resp
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/healthz')
 def healthz():
     return jsonify({'ok': True})
 
 # DB init and seeding
 
+def _widen_media_columns():
+    """Byte counts outgrow a 32-bit INT (MySQL) after a few videos; widen tables created before they were BIGINT."""
+    dialect = _db_engine.dialect.name
+    if dialect == 'sqlite':
+        return  # INTEGER is already 64-bit
+    insp = inspect(_db_engine)
+    for table, column in (('media_items', 'size'), ('media_usage', 'bytes')):
+        types = {c['name']: c['type'] for c in insp.get_columns(table)}
+        if isinstance(types.get(column), BigInteger):
+            continue
+        if dialect in ('mysql', 'mariadb'):
+            sql = f'ALTER TABLE {table} MODIFY {column} BIGINT NOT NULL'
+        else:
+            sql = f'ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT'
+        with _db_engine.begin() as conn:
+            conn.execute(text(sql))
+
 def init_users_db():
     _metadata.create_all(_db_engine)
+    _widen_media_columns()
     admin_user = os.environ.get('SSSNL_ADMIN_USER')
     admin_pass = os.environ.get('SSSNL_ADMIN_PASS')
     with _db_engine.begin() as conn:
@@ -283,7 +545,7 @@ def api_login():
         row = conn.execute(text('SELECT username, password_hash, role FROM users WHERE username=:u'), {'u': username}).fetchone()
     if not row:
         return jsonify({'error': 'not_found'}), 404
-    if not check_password_hash(row[1], password):
+    if not _verify_password(row[1], password):
         return jsonify({'error': 'invalid_credentials'}), 401
     session['user_id'] = row[0]
     session['role'] = row[2]
@@ -316,7 +578,7 @@ def user_change_password():
         row = conn.execute(text('SELECT password_hash FROM users WHERE username=:u'), {'u': uid}).fetchone()
         if not row:
             return jsonify({'error': 'not_found'}), 404
-        if old_password and not check_password_hash(row[0], old_password):
+        if old_password and not _verify_password(row[0], old_password):
             return jsonify({'error': 'invalid_old_password'}), 401
         conn.execute(text('UPDATE users SET password_hash=:ph WHERE username=:u'), {'ph': generate_password_hash(new_password), 'u': uid})
     return jsonify({'ok': True})
@@ -335,18 +597,17 @@ def user_change_username():
         row = conn.execute(text('SELECT password_hash FROM users WHERE username=:u'), {'u': uid}).fetchone()
         if not row:
             return jsonify({'error': 'not_found'}), 404
-        if password and not check_password_hash(row[0], password):
+        if password and not _verify_password(row[0], password):
             return jsonify({'error': 'invalid_credentials'}), 401
         exists = conn.execute(text('SELECT 1 FROM users WHERE username=:nu'), {'nu': new_username}).fetchone()
         if exists:
             return jsonify({'error': 'user_exists'}), 409
         conn.execute(text('UPDATE users SET username=:nu WHERE username=:u'), {'nu': new_username, 'u': uid})
-    base_dir = PROJECT_ROOT
-    old_dir = os.path.join(base_dir, 'static', 'media', uid)
-    new_dir = os.path.join(base_dir, 'static', 'media', new_username)
+    old_dir = os.path.join(media_catalog.root, uid)
+    new_dir = os.path.join(media_catalog.root, new_username)
     try:
         if os.path.isdir(old_dir):
-            os.makedirs(os.path.join(base_dir, 'static', 'media'), exist_ok=True)
+            os.makedirs(media_catalog.root, exist_ok=True)
             if os.path.exists(new_dir):
                 for fname in os.listdir(old_dir):
                     src = os.path.join(old_dir, fname)
@@ -354,10 +615,15 @@ def user_change_username():
                     if not os.path.exists(dst):
                         shutil.move(src, dst)
                 shutil.rmtree(old_dir, ignore_errors=True)
+                media_catalog.rescan(uid)
+                media_catalog.rescan(new_username)
             else:
                 shutil.move(old_dir, new_dir)
+                media_catalog.rename_owner(uid, new_username)
     except Exception as e:
         session['user_id'] = new_username
+        media_catalog.rescan(uid)  # rows follow whatever made it to disk
+        media_catalog.rescan(new_username)
         return jsonify({'ok': True, 'user': {'username': new_username}, 'media_move_warning': str(e)})
     session['user_id'] = new_username
     return jsonify({'ok': True, 'user': {'username': new_username}})
@@ -376,6 +642,19 @@ def admin_list_users():
     users = [{'id': r[0], 'username': r[1], 'role': r[2], 'created_at': r[3]} for r in rows]
     return jsonify({'users': users})
 
+@app.route('/api/admin/media/usage', methods=['GET'])
+def admin_media_usage():
+    if not require_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    usage = media_catalog.usage()
+    try:
+        disk = shutil.disk_usage(media_catalog.root)
+        disk = {'total': disk.total, 'used': disk.used, 'free': disk.free}
+    except OSError:
+        disk = None
+    return jsonify({'users': [dict(v, owner=k) for k, v in sorted(usage.items())], 'disk': disk,
+                    'uploads': media_admission.snapshot()})
+
 @app.route('/api/admin/users', methods=['POST'])
 def admin_add_user():
     if not require_admin():
@@ -403,6 +682,10 @@ def admin_delete_user(username):
     username = (username or '').strip().lower()
     with _db_engine.begin() as conn:
         conn.execute(text('DELETE FROM users WHERE username=:u'), {'u': username})
+    if username and secure_filename(username) == username:
+        # the account's media goes with it; the rescan drops its rows, usage and unshared blobs
+        shutil.rmtree(os.path.join(media_catalog.root, username), ignore_errors=True)
+        media_catalog.rescan(username)
     return jsonify({'ok': True})
 
 @app.route('/api/admin/change_password', methods=['POST'])
@@ -421,6 +704,49 @@ def admin_change_password():
         conn.execute(text('UPDATE users SET password_hash=:ph WHERE username=:username'), {'ph': generate_password_hash(new_password), 'username': username})
     return jsonify({'ok': True})
 
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    if not require_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            request_profiler.configure(enabled=data.get('enabled'), sample_rate=data.get('sample_rate'),
+                                       route=data.get('route'), interval_ms=data.get('interval_ms'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid_config'}), 400
+    return jsonify(request_profiler.config())
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def admin_list_profiles():
+    if not require_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify({'profiles': request_profiler.list()})
+
+@app.route('/api/admin/profiles', methods=['DELETE'])
+def admin_clear_profiles():
+    if not require_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    request_profiler.clear()
+    return jsonify({'ok': True})
+
+@app.route('/api/admin/profiles/merged', methods=['GET'])
+def admin_merged_profile():
+    if not require_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    body = request_profiler.merged(request.args.get('route') or None)
+    return Response(body, mimetype='text/plain', headers={'Content-Disposition': 'attachment; filename="profiles.collapsed"'})
+
+@app.route('/api/admin/profiles/<int:profile_id>', methods=['GET'])
+def admin_get_profile(profile_id: int):
+    if not require_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    sess = request_profiler.get(profile_id)
+    if sess is None:
+        return jsonify({'error': 'not_found'}), 404
+    return Response(sess.collapsed(), mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename="profile-{profile_id}.collapsed"'})
+
 # Device APIs
 
 def _require_auth_user() -> str | None:
@@ -432,7 +758,7 @@ def _require_device_auth(device_id: str, secret: str) -> bool:
             row = conn.execute(text('SELECT device_secret_hash FROM devices WHERE device_id=:d'), {'d': device_id}).fetchone()
             if not row or not row[0]:
                 return False
-            return check_password_hash(row[0], secret)
+            return _verify_password(row[0], secret)
     except Exception:
         return False
 
@@ -513,7 +839,7 @@ def device_claim(device_id: str):
         if not pc or not pu or not pe or pe < now or pc != pairing_code:
             return jsonify({'error': 'pairing_invalid'}), 400
         tok = conn.execute(text('SELECT device_secret_hash FROM devices WHERE device_id=:d'), {'d': device_id}).fetchone()
-        if not tok or not tok[0] or not check_password_hash(tok[0], device_token):
+        if not tok or not tok[0] or not _verify_password(tok[0], device_token):
             return jsonify({'error': 'invalid_token'}), 401
         conn.execute(text('UPDATE devices SET owner_username=:u, status=:st, pairing_code=NULL, pairing_user=NULL, pairing_expires=NULL WHERE device_id=:d'),
                      {'u': pu, 'st': 'online', 'd': device_id})
@@ -559,104 +885,247 @@ def rename_device(device_id: str):
         conn.execute(text('UPDATE devices SET name=:n WHERE device_id=:d'), {'n': new_name, 'd': device_id})
     return jsonify({'ok': True})
 
+@app.route('/api/devices/<device_id>/display', methods=['POST'])
+def set_device_display(device_id: str):
+    user = _require_auth_user()
+    if not user:
+        return jsonify({'error': 'unauthenticated'}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        width, height = int(data.get('width')), int(data.get('height'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'width_height_required'}), 400
+    if not (160 <= width <= 7680 and 160 <= height <= 4320):
+        return jsonify({'error': 'invalid_size'}), 400
+    with _db_engine.begin() as conn:
+        cur = conn.execute(text('SELECT owner_username, mac FROM devices WHERE device_id=:d'), {'d': device_id}).fetchone()
+        if not cur:
+            return jsonify({'error': 'not_found'}), 404
+        if cur[0] != user:
+            return jsonify({'error': 'forbidden'}), 403
+        conn.execute(text('DELETE FROM device_displays WHERE device_id=:d'), {'d': device_id})
+        conn.execute(text('INSERT INTO device_displays (device_id, width, height) VALUES (:d,:w,:h)'),
+                     {'d': device_id, 'w': width, 'h': height})
+    # Re-render this device's images at the new size in the background
+    queued = media_catalog.renotify(user, cur[1])
+    return jsonify({'ok': True, 'width': width, 'height': height, 'requeued': queued})
+
 # Media playlist/status
 @app.route('/playlist')
 def get_playlist():
     username = session.get('user_id')
     if not username:
         return jsonify({'error': 'unauthenticated'}), 401
-    device_mac = request.args.get('device_mac')
-    if device_mac:
-        safe_mac = os.path.basename(device_mac)
-        media_dir = os.path.join(STATIC_DIR, 'media', username, safe_mac)
-    else:
-        media_dir = os.path.join(STATIC_DIR, 'media', username)
-    image_exts = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
-    video_exts = ('.mp4', '.mov', '.m4v', '.avi', '.webm')
-    items = []
     try:
-        if os.path.isdir(media_dir):
-            for fname in sorted(os.listdir(media_dir)):
-                if fname.lower().endswith(video_exts):
-                    path = os.path.join(media_dir, fname)
-                    items.append({'type': 'video', 'src': f"/{os.path.relpath(path, PROJECT_ROOT)}"})
-            for fname in sorted(os.listdir(media_dir)):
-                if fname.lower().endswith(image_exts):
-                    path = os.path.join(media_dir, fname)
-                    items.append({'type': 'image', 'src': f"/{os.path.relpath(path, PROJECT_ROOT)}", 'duration_ms': 6000})
+        items = media_catalog.playlist(username, request.args.get('device_mac'))
     except Exception as e:
         return jsonify({'playlist': [], 'error': str(e)}), 200
     return jsonify({'playlist': items})
 
+@app.cli.command('media-rescan')
+def media_rescan_command():
+    """Backfill media_items from files under static/media."""
+    init_users_db()
+    print(media_catalog.rescan())
+
+@app.cli.command('media-faststart')
+def media_faststart_command():
+    """Move the moov box to the front of existing MP4/MOV files, then rescan."""
+    init_users_db()
+    result = faststart_tree(media_catalog.root)
+    print(f"checked {result['checked']}, rewrote {len(result['rewritten'])}, failed {len(result['failed'])}")
+    for item in result['failed']:
+        print('  failed:', item['path'], item['error'])
+    print(media_catalog.rescan())
+
 @app.route('/api/playlist')
 def get_playlist_api():
     return get_playlist()
 
+def _owner_for_mac(mac: str):
+    try:
+        with _db_engine.connect() as conn:
+            row = conn.execute(text('SELECT owner_username FROM devices WHERE mac=:m'), {'m': mac}).fetchone()
+    except Exception:
+        return None
+    return row[0] if row and row[0] else None
+
 @app.route('/api/public/playlist_by_mac')
 def public_playlist_by_mac():
     mac = (request.args.get('mac') or '').strip().lower()
     if not mac:
         return jsonify({'playlist': []})
-    owner = None
-    try:
-        with _db_engine.connect() as conn:
-            row = conn.execute(text('SELECT owner_username FROM devices WHERE mac=:m'), {'m': mac}).fetchone()
-            if row and row[0]:
-                owner = row[0]
-    except Exception:
-        owner = None
+    owner = _owner_for_mac(mac)
     if not owner:
         return jsonify({'playlist': []})
-    # Build from static/media/<owner>/<mac>
-    media_dir = os.path.join(STATIC_DIR, 'media', owner, os.path.basename(mac))
-    image_exts = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
-    video_exts = ('.mp4', '.mov', '.m4v', '.avi', '.webm')
-    items = []
     try:
-        if os.path.isdir(media_dir):
-            for fname in sorted(os.listdir(media_dir)):
-                if fname.lower().endswith(video_exts):
-                    path = os.path.join(media_dir, fname)
-                    items.append({'type': 'video', 'src': f"/{os.path.relpath(path, PROJECT_ROOT)}"})
-            for fname in sorted(os.listdir(media_dir)):
-                if fname.lower().endswith(image_exts):
-                    path = os.path.join(media_dir, fname)
-                    items.append({'type': 'image', 'src': f"/{os.path.relpath(path, PROJECT_ROOT)}", 'duration_ms': 6000})
+        items = media_catalog.playlist(owner, mac)
     except Exception as e:
         return jsonify({'playlist': [], 'error': str(e)}), 200
     return jsonify({'playlist': items})
 
+@app.route('/api/playlist/manifest')
+def playlist_manifest():
+    """Playlist plus per-item sha256/size and a version, for kiosk precaching.
+
+    Either the signed-in user's (optional `device_mac`) or, like
+    /api/public/playlist_by_mac, a registered device's by `mac`.
+    """
+    mac = (request.args.get('mac') or '').strip().lower()
+    if mac:
+        owner, device_mac = _owner_for_mac(mac), mac
+        if not owner:
+            return jsonify({'version': None, 'items': []})
+    else:
+        owner, device_mac = session.get('user_id'), request.args.get('device_mac')
+        if not owner:
+            return jsonify({'error': 'unauthenticated'}), 401
+    manifest = media_catalog.manifest(owner, device_mac)
+    resp = jsonify(manifest)
+    resp.set_etag(manifest['version'])
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
+
+# Latest playback smoothness report per dashboard (in memory, per process)
+PLAYBACK_REPORT_MAX_DEVICES = 1024
+_playback_reports = {}
+_playback_lock = threading.Lock()
+
+@app.route('/api/playback/gaps', methods=['POST'])
+def report_playback_gaps():
+    """Dashboards post one report per playlist loop: motion-to-first-frame and item-to-item gaps (ms)."""
+    data = request.get_json(force=True, silent=True) or {}
+    gaps = data.get('gaps_ms')
+    first = data.get('first_ms')
+    if not isinstance(gaps, list) or len(gaps) > 1000 or \
+            not all(isinstance(v, (int, float)) and 0 <= v <= 600000 for v in gaps + ([first] if first is not None else [])):
+        return jsonify({'error': 'invalid_report'}), 400
+    device = (data.get('device_mac') or '').strip().lower() or \
+        (f"user:{session['user_id']}" if session.get('user_id') else f"ip:{request.remote_addr}")
+    if first is not None:
+        _playback_first_frame.observe(first / 1000.0)
+    for v in gaps:
+        _playback_gap.observe(v / 1000.0)
+    with _playback_lock:
+        entry = _playback_reports.get(device)
+        if entry is None:
+            if len(_playback_reports) >= PLAYBACK_REPORT_MAX_DEVICES:
+                _playback_reports.pop(min(_playback_reports, key=lambda k: _playback_reports[k]['at']))
+            entry = _playback_reports[device] = {'loops': 0, 'transitions': 0, 'max_gap_ms': 0}
+        entry['loops'] += 1
+        entry['transitions'] += len(gaps)
+        entry['max_gap_ms'] = max([entry['max_gap_ms']] + gaps)
+        entry.update(at=int(time.time()), last_first_ms=first, last_gaps_ms=gaps)
+    return '', 204
+
+@app.route('/api/admin/playback', methods=['GET'])
+def admin_playback_reports():
+    if not require_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    with _playback_lock:
+        devices = [dict(v, device=k) for k, v in sorted(_playback_reports.items())]
+    return jsonify({'devices': devices})
+
+@app.route('/sw.js')
+def media_service_worker():
+    resp = Response(MEDIA_SERVICE_WORKER_JS, mimetype='application/javascript')
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+@app.route('/precache.js')
+def media_precache_script():
+    resp = Response(MEDIA_PRECACHE_JS, mimetype='application/javascript')
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
 @app.route('/status')
 def status():
-    return jsonify({'temp': current_temp, 'hum': current_hum, 'motion_status': motion_status_msg, 'motion_active': motion_active, 'last_dht_time': last_dht_time, 'last_dht_success': last_dht_success, 'last_motion_raw': last_motion_raw, 'last_motion_change': last_motion_change})
+    since = request.args.get('since', type=int)
+    if since is not None:
+        wait = request.args.get('wait', default=0.0, type=float)
+        snap = sensor_hub.wait_for_change(since, max(0.0, min(wait, STATUS_LONG_POLL_MAX_SEC)))
+    else:
+        snap = sensor_hub.snapshot()
+    resp = jsonify(dict(snap.to_dict(), version=snap.version))
+    resp.set_etag(f"{sensor_hub.epoch}-{snap.version}")
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
 
 @app.route('/api/status')
 def status_api():
     return status()
 
+@app.route('/api/status/stream')
+def status_stream():
+    """Server-Sent Events: one full `status` event, then `delta` events
+    carrying only the fields that changed, plus a comment heartbeat."""
+    def _events():
+        snap = sensor_hub.snapshot()
+        last = snap.to_dict()
+        yield f"retry: 3000\nid: {snap.version}\nevent: status\ndata: {json.dumps(last)}\n\n"
+        last_sent = time.monotonic()
+        while True:
+            snap = sensor_hub.wait_for_change(snap.version, STATUS_STREAM_HEARTBEAT_SEC)
+            cur = snap.to_dict()
+            delta = {k: v for k, v in cur.items() if last.get(k) != v}
+            if delta:
+                last = cur
+                last_sent = time.monotonic()
+                yield f"id: {snap.version}\nevent: delta\ndata: {json.dumps(delta)}\n\n"
+            elif time.monotonic() - last_sent >= STATUS_STREAM_HEARTBEAT_SEC:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(_events(), mimetype='text/event-stream', headers=headers)
+
+@app.route('/api/status/history')
+def status_history():
+    end = request.args.get('to', default=time.time(), type=float)
+    start = request.args.get('from', default=end - 3600, type=float)
+    if start >= end:
+        return jsonify({'error': 'invalid_range'}), 400
+    span = end - start
+    step = request.args.get('step', type=float) or span / 360
+    step = max(step, span / STATUS_HISTORY_MAX_BUCKETS, 1.0)
+    oldest = sensor_hub.history.oldest()
+    if oldest is not None and start >= oldest:
+        source = 'memory'
+        buckets = sensor_hub.history.downsample(start, end, step)
+    else:
+        # Beyond the in-memory ring: read the persisted rollups.
+        source = 'store'
+        step = max(step, 60.0)
+        try:
+            buckets = sensor_store.downsample(start, end, step)
+        except Exception as e:
+            return jsonify({'error': 'db_error', 'detail': str(e)}), 500
+    return jsonify({'from': start, 'to': end, 'step': step, 'source': source, 'buckets': buckets})
+
 # Diagnostics/mocks
 @app.route('/dht-debug')
 def dht_debug():
+    """Latest reading from the DHT worker; never touches the sensor itself."""
     backend = _DHT_LIB
     read = {'temp': None, 'hum': None, 'error': None}
-    try:
-        if _DHT_LIB == 'circuitpython' and _dht_sensor_obj is not None:
-            try:
-                with dht_lock:
-                    read['temp'] = _dht_sensor_obj.temperature
-                    read['hum'] = _dht_sensor_obj.humidity
-            except Exception as e:
-                read['error'] = str(e)
+    worker = None
+    if dht_worker is not None:
+        worker = dht_worker.status()
+        latest = dht_worker.latest
+        if latest:
+            read = {'temp': latest['raw_temp'], 'hum': latest['raw_hum'], 'error': latest['error']}
+            worker.update({k: latest[k] for k in ('reads', 'failures', 'failure_rate', 'consecutive_failures', 'latency')})
+            worker['median'] = {'temp': latest['temp'], 'hum': latest['hum']}
         else:
-            read['temp'] = 21.5
-            read['hum'] = 55.0
-    except Exception as e:
-        read['error'] = str(e)
-    return jsonify({'backend': backend, 'read': read, 'last_dht_time': last_dht_time, 'last_dht_success': last_dht_success})
+            read['error'] = worker['last_error'] or 'no reading yet'
+    else:
+        read['temp'] = 21.5
+        read['hum'] = 55.0
+    snap = sensor_hub.snapshot()
+    return jsonify({'backend': backend, 'read': read, 'worker': worker, 'last_dht_time': snap.last_dht_time, 'last_dht_success': snap.last_dht_success})
 
 @app.route('/mock-motion', methods=['POST'])
 def mock_motion():
-    global mock_motion_override, motion_active, motion_status_msg, last_motion_change
+    global mock_motion_override
     data = request.get_json(silent=True) or {}
     val = data.get('active')
     if val is None:
@@ -669,20 +1138,19 @@ def mock_motion():
         val = bool(val)
     active = bool(val)
     mock_motion_override = active
-    motion_active = active
-    motion_status_msg = "Motion detected" if active else "No motion"
-    last_motion_change = time.time()
-    return jsonify({'ok': True, 'motion_active': motion_active, 'override': True})
+    snap = sensor_hub.record_motion(active, time.time())
+    return jsonify({'ok': True, 'motion_active': snap.motion_active, 'override': True})
 
 @app.route('/mock-motion/clear', methods=['POST'])
 def clear_mock_motion():
     global mock_motion_override
     mock_motion_override = None
-    return jsonify({'ok': True, 'override': False, 'motion_active': motion_active})
+    snap = sensor_hub.record_motion(_real_motion_active, time.time())
+    return jsonify({'ok': True, 'override': False, 'motion_active': snap.motion_active})
 
 @app.route('/mock-dht', methods=['POST'])
 def mock_dht():
-    global mock_dht_override, current_temp, current_hum, last_dht_time, last_dht_success
+    global mock_dht_override
     data = request.get_json(silent=True) or {}
     temp = data.get('temp')
     hum = data.get('hum')
@@ -693,10 +1161,7 @@ def mock_dht():
         return jsonify({'ok': False, 'error': 'invalid temp/hum'}), 400
     mock_dht_override = {'temp': temp_val, 'hum': hum_val}
     if temp_val is not None and hum_val is not None:
-        current_temp = f"{temp_val:.1f}°C"
-        current_hum = f"{hum_val:.1f}%"
-        last_dht_time = time.time()
-        last_dht_success = True
+        sensor_hub.record_dht(temp_val, hum_val, time.time())
     return jsonify({'ok': True, 'override': True, 'temp': temp_val, 'hum': hum_val})
 
 @app.route('/mock-dht/clear', methods=['POST'])
@@ -736,13 +1201,23 @@ def dev_web_app(path="index.html"):
         path = 'index.html'
     return send_from_directory(DEV_WEB_DIR, path)
 
-if __name__ == '__main__':
+def main():
+    """Start the sensor threads and serve; `python -m backend` runs this.
+
+    Prefer that over `python -m backend.app`: worker processes (DHT reader,
+    image variants) are spawned, and a spawned child re-runs the parent's
+    main module first. As `backend/__main__.py` that is skipped; as app.py
+    it would redo all of the setup above in every child.
+    """
     try:
         init_users_db()
     except Exception as e:
         print('Warning: failed to init users DB:', e)
     threading.Thread(target=read_dht_sensor, daemon=True).start()
     threading.Thread(target=motion_detector, daemon=True).start()
+    threading.Thread(target=sensor_store.run, daemon=True).start()
+    atexit.register(sensor_store.flush)
+    threading.Thread(target=media_catalog.rescan, daemon=True).start()
 
     # Prepare static/media folder at project root
     os.makedirs(STATIC_DIR, exist_ok=True)
@@ -793,3 +1268,7 @@ if __name__ == '__main__':
 
     print("🚀 Backend running on http://0.0.0.0:5656")
     app.run(host='0.0.0.0', port=5656)
+
+
+if __name__ == '__main__':
+    main()
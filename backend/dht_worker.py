@@ -0,0 +1,206 @@
+"""DHT reads in a dedicated child process.
+
+The circuitpython DHT driver bit-bangs the sensor with tight timing and can
+hang inside a read. Running it in its own process keeps those stalls (and
+the GIL time they cost) off the Flask request threads. The child streams
+readings over a pipe; `DHTWorker.run` supervises it from a parent thread
+and restarts the child if it dies or stops reporting.
+"""
+
+import collections
+import multiprocessing
+import statistics
+import threading
+import time
+
+
+class MockDHTSensor:
+    """Stand-in driver with fixed readings (used by tests and dev boxes)."""
+    temperature = 21.5
+    humidity = 55.0
+
+
+class CircuitPythonDHT:
+    """Picklable factory: builds the adafruit driver inside the child."""
+
+    def __init__(self, pin: int, dht_type: str = 'DHT11'):
+        self.pin = pin
+        self.dht_type = dht_type
+
+    def __call__(self):
+        import board
+        import adafruit_dht
+        board_pin = getattr(board, f'D{self.pin}')
+        return adafruit_dht.DHT11(board_pin) if self.dht_type == 'DHT11' else adafruit_dht.DHT22(board_pin)
+
+
+# Minimum seconds between reads the sensor itself tolerates.
+MIN_READ_INTERVAL = {'DHT11': 1.0, 'DHT22': 2.0}
+
+
+class DHTSampler:
+    """Decide when to read next and smooth what gets reported.
+
+    A failed read is retried after `min_interval` up to `quick_retries`
+    times; after that the delay doubles per failure up to `max_backoff`.
+    A good read resets to the normal `interval`. Reported values are the
+    median of the last `window` good reads, which rejects single spikes.
+    """
+
+    def __init__(self, interval: float = 10.0, min_interval: float = 1.0, quick_retries: int = 3,
+                 max_backoff: float | None = None, window: int = 5, rate_window: int = 50):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.quick_retries = quick_retries
+        self.max_backoff = max_backoff if max_backoff is not None else interval * 2
+        self.consecutive_failures = 0
+        self.reads = 0
+        self.failures = 0
+        self.last_latency = None
+        self._good = collections.deque(maxlen=window)
+        self._outcomes = collections.deque(maxlen=rate_window)
+
+    def record(self, temp, hum, latency: float) -> bool:
+        """Account for one read; returns True if it was good."""
+        self.reads += 1
+        self.last_latency = latency
+        ok = temp is not None and hum is not None
+        self._outcomes.append(ok)
+        if ok:
+            self.consecutive_failures = 0
+            self._good.append((temp, hum))
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+        return ok
+
+    def in_backoff(self) -> bool:
+        return self.consecutive_failures > self.quick_retries
+
+    def next_delay(self) -> float:
+        if self.consecutive_failures == 0:
+            return self.interval
+        if not self.in_backoff():
+            return self.min_interval
+        steps = self.consecutive_failures - self.quick_retries
+        return min(max(self.min_interval, self.interval) * (2 ** (steps - 1)), self.max_backoff)
+
+    def median(self):
+        if not self._good:
+            return None, None
+        return (statistics.median(t for t, _ in self._good),
+                statistics.median(h for _, h in self._good))
+
+    def failure_rate(self) -> float:
+        return (self._outcomes.count(False) / len(self._outcomes)) if self._outcomes else 0.0
+
+    def stats(self) -> dict:
+        return {'reads': self.reads, 'failures': self.failures, 'failure_rate': self.failure_rate(),
+                'consecutive_failures': self.consecutive_failures, 'latency': self.last_latency}
+
+
+def _worker_main(conn, sensor_factory, sampler: DHTSampler) -> None:
+    try:
+        sensor = sensor_factory()
+    except Exception as e:  # no driver, wrong pin, missing library: retrying at once won't help
+        conn.send({'ts': time.time(), 'fatal': f'{type(e).__name__}: {e}'})
+        return
+    while True:
+        started = time.monotonic()
+        try:
+            temp, hum, err = sensor.temperature, sensor.humidity, None
+        except Exception as e:
+            temp, hum, err = None, None, str(e)
+        ok = sampler.record(temp, hum, time.monotonic() - started)
+        # Failures inside the quick-retry budget are only counted; report
+        # once a retry succeeds or the sampler has fallen back to backoff.
+        if ok or sampler.in_backoff():
+            med_temp, med_hum = sampler.median() if ok else (None, None)
+            conn.send(dict(sampler.stats(), ts=time.time(), temp=med_temp, hum=med_hum,
+                           raw_temp=temp, raw_hum=hum, error=err))
+        time.sleep(sampler.next_delay())
+
+
+class DHTWorker:
+    """Supervise a sensor child process and forward its readings."""
+
+    def __init__(self, sensor_factory, interval: float = 10.0, min_interval: float = 1.0,
+                 stall_timeout: float | None = None, restart_delay: float = 1.0, max_restart_delay: float = 300.0):
+        self.sensor_factory = sensor_factory
+        self.interval = interval
+        self.min_interval = min_interval
+        # Backoff tops out at 2 x interval, so a healthy child always reports within this.
+        self.stall_timeout = stall_timeout if stall_timeout is not None else interval * 3 + 5
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.latest = None
+        self.restarts = 0
+        self.failed_runs = 0  # consecutive children that never produced a reading
+        self.last_error = None
+        self.next_restart = None
+        self.pid = None
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def status(self) -> dict:
+        latest = self.latest
+        return {
+            'pid': self.pid,
+            'restarts': self.restarts,
+            'failed_runs': self.failed_runs,
+            'last_error': self.last_error,
+            'next_restart_in': max(0.0, self.next_restart - time.time()) if self.next_restart else None,
+            'last_reading_age': (time.time() - latest['ts']) if latest else None,
+        }
+
+    def run(self, on_reading) -> None:
+        """Blocking supervisor loop; call `on_reading(reading)` per message."""
+        # the child re-runs the parent's __main__ first: keep that `python -m backend`, not app.py
+        ctx = multiprocessing.get_context('spawn')
+        while not self._stop.is_set():
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            sampler = DHTSampler(interval=self.interval, min_interval=self.min_interval)
+            proc = ctx.Process(target=_worker_main, args=(send_conn, self.sensor_factory, sampler), daemon=True)
+            proc.start()
+            send_conn.close()
+            self.pid = proc.pid
+            last_msg = time.monotonic()
+            reported = False
+            while not self._stop.is_set():
+                if recv_conn.poll(min(1.0, self.stall_timeout)):
+                    try:
+                        reading = recv_conn.recv()
+                    except EOFError:
+                        break
+                    if 'fatal' in reading:
+                        self.last_error = reading['fatal']
+                        break
+                    last_msg = time.monotonic()
+                    reported = True
+                    self.failed_runs = 0
+                    self.last_error = None
+                    self.latest = reading
+                    on_reading(reading)
+                elif not proc.is_alive():
+                    self.last_error = f'worker exited with code {proc.exitcode}'
+                    break
+                elif time.monotonic() - last_msg > self.stall_timeout:
+                    self.last_error = f'no reading for {self.stall_timeout:.0f}s'
+                    break
+            proc.kill()
+            proc.join(5)
+            recv_conn.close()
+            self.pid = None
+            if not self._stop.is_set():
+                self.restarts += 1
+                if not reported:
+                    self.failed_runs += 1
+                # A child that never reports (e.g. the driver can't be opened)
+                # is retried with exponential backoff instead of every second.
+                delay = min(self.restart_delay * 2 ** max(0, self.failed_runs - 1), self.max_restart_delay)
+                print(f'Warning: DHT worker stalled or exited ({self.last_error}); restarting in {delay:.0f}s')
+                self.next_restart = time.time() + delay
+                self._stop.wait(delay)
+                self.next_restart = None
@@ -1,15 +1,59 @@
-from flask import Blueprint, request, jsonify, current_app, url_for, session
+from flask import Blueprint, request, jsonify, current_app, url_for, session, send_from_directory
 import os
 import pathlib
-import urllib.request
+import concurrent.futures
+import hashlib
+import secrets
+import threading
+import time
 import shutil
+import urllib.parse
+from werkzeug.formparser import FormDataParser
 from werkzeug.utils import secure_filename
 
+try:
+    from .metrics import registry as metrics_registry
+    from .mp4_faststart import faststart, VIDEO_EXTS as FASTSTART_EXTS
+    from .media_uploads import UploadError, create_exclusive
+    from .media_catalog import device_dir
+    from .media_admission import AdmissionDenied
+    from .media_fetch import FetchFailed
+except ImportError:
+    from metrics import registry as metrics_registry
+    from mp4_faststart import faststart, VIDEO_EXTS as FASTSTART_EXTS
+    from media_uploads import UploadError, create_exclusive
+    from media_catalog import device_dir
+    from media_admission import AdmissionDenied
+    from media_fetch import FetchFailed
+
 bp = Blueprint('media_admin', __name__)
 
+_upload_bytes = metrics_registry.counter('sssnl_upload_bytes_total', 'Bytes written by /api/media/upload.')
+_upload_latency = metrics_registry.histogram('sssnl_upload_duration_seconds', 'Time to receive and store an upload request.',
+                                             buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+
 API_KEY = os.environ.get('SSSNL_MEDIA_API_KEY')
 ALLOWED_TARGETS = {'media'}
 ALLOWED_EXT = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'mp4', 'mov', 'm4v', 'avi', 'webm'}
+MAX_PAGE = 1000  # /files items per response
+QUOTA_BYTES = int(os.environ.get('SSSNL_MEDIA_QUOTA_BYTES', '0'))  # per user; 0 = unlimited
+QUOTA_FILES = int(os.environ.get('SSSNL_MEDIA_QUOTA_FILES', '0'))
+MIN_FREE_BYTES = int(os.environ.get('SSSNL_MEDIA_MIN_FREE_BYTES', str(256 << 20)))  # keep the SD card usable
+# Parts of a multi-file upload are finished (renamed, faststarted) in parallel.
+UPLOAD_WORKERS = int(os.environ.get('SSSNL_UPLOAD_WORKERS', '4'))
+
+
+def _lower_priority():
+    # Faststart is CPU and disk heavy; on a 4-core Pi it must yield to the
+    # request threads serving /status and the playlist.
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+_upload_pool = concurrent.futures.ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload',
+                                                     initializer=_lower_priority)
 
 
 def is_allowed_filename(filename: str) -> bool:
@@ -23,7 +67,9 @@ def is_authenticated(req):
         key = req.headers.get('X-API-KEY') or req.args.get('api_key')
         if not key and req.method == 'POST':
             data = req.get_json(silent=True) or {}
-            key = req.form.get('api_key') or data.get('api_key')
+            # multipart bodies are parsed by the upload route itself, after admission
+            form = req.form if req.mimetype != 'multipart/form-data' else {}
+            key = form.get('api_key') or data.get('api_key')
         if key == API_KEY:
             return True
     return session.get('user_id') is not None
@@ -34,51 +80,362 @@ def static_root() -> pathlib.Path:
     return pathlib.Path(current_app.root_path).parent / 'static'
 
 
+def media_catalog():
+    return current_app.extensions['media_catalog']
+
+
+def media_thumbs():
+    return current_app.extensions.get('media_thumbs')
+
+
+def media_uploads():
+    return current_app.extensions['media_uploads']
+
+
+def media_fetches():
+    return current_app.extensions['media_fetches']
+
+
+def media_admission():
+    return current_app.extensions['media_admission']
+
+
+def _admission_denied(e: AdmissionDenied):
+    resp = jsonify({'error': e.code})
+    resp.headers['Retry-After'] = str(e.retry_after)
+    return resp, e.status
+
+
+def prepare_media(path: str) -> bool:
+    """In-place fixups before a new file is recorded (MP4/MOV faststart).
+
+    Returns True if the file's bytes changed.
+    """
+    if path.lower().endswith(FASTSTART_EXTS):
+        try:
+            return faststart(path)
+        except Exception as e:
+            print('Warning: faststart failed for', path, e)
+    return False
+
+
+def user_usage(user: str) -> dict:
+    return media_catalog().usage(user).get(user) or {'files': 0, 'bytes': 0, 'devices': {}}
+
+
+def over_quota(catalog, user: str, add_bytes: int = 0, add_files: int = 1) -> dict | None:
+    """The `quota_exceeded` error body if `user` may not store `add_bytes` more in `add_files` new files.
+
+    Reads the running totals, so it is cheap enough for background jobs too.
+    """
+    totals = catalog.usage(user).get(user) or {'files': 0, 'bytes': 0}
+    if (QUOTA_BYTES and totals['bytes'] + add_bytes > QUOTA_BYTES) or \
+            (QUOTA_FILES and totals['files'] + add_files > QUOTA_FILES):
+        return {'error': 'quota_exceeded', 'files': totals['files'], 'bytes': totals['bytes'],
+                'quota_bytes': QUOTA_BYTES or None, 'quota_files': QUOTA_FILES or None}
+    return None
+
+
+def free_bytes() -> int | None:
+    try:
+        return shutil.disk_usage(media_catalog().root).free
+    except OSError:
+        return None  # root not created yet
+
+
+def check_quota(user: str, add_bytes: int = 0, add_files: int = 1):
+    """None if `user` may store `add_bytes` more in `add_files` new files, else an error response.
+
+    Reads the running totals (no tree walk) and the free space on the media volume.
+    """
+    body = over_quota(media_catalog(), user, add_bytes, add_files)
+    if body:
+        return jsonify(body), 413
+    free = free_bytes()
+    if free is not None and free - add_bytes < MIN_FREE_BYTES:
+        return jsonify({'error': 'insufficient_storage'}), 507
+    return None
+
+
+def quota_room(user: str) -> tuple[int | None, str]:
+    """Bytes `user` may still add, with the error for going over: what is left of the
+    quota or of the free space above MIN_FREE_BYTES, whichever is smaller (None: no limit)."""
+    room = []
+    if QUOTA_BYTES:
+        room.append((QUOTA_BYTES - user_usage(user)['bytes'], 'quota_exceeded'))
+    free = free_bytes()
+    if free is not None:
+        room.append((free - MIN_FREE_BYTES, 'insufficient_storage'))
+    return min(room) if room else (None, 'quota_exceeded')
+
+
 def static_target_dir(target: str, device_mac: str | None = None) -> str:
-    root = static_root()
+    # 'media' is the only allowed target; its tree is owned by the catalog
     user = session.get('user_id') or 'anon'
-    dest = root / target / user
-    if device_mac:
-        dest = dest / secure_filename(device_mac)
+    dest = pathlib.Path(media_catalog().dir_for(user, device_mac))
     dest.mkdir(parents=True, exist_ok=True)
     return str(dest)
 
 
+class _StagedPart:
+    """Multipart sink: one file part written straight to a hidden file in the
+    upload directory and hashed on the way, so storing it is only a rename."""
+
+    def __init__(self, dest_dir: str):
+        self.path = os.path.join(dest_dir, f".{secrets.token_hex(8)}.upload")
+        self._out = open(self.path, 'wb')
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._out.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0  # the parser rewinds each finished part; nothing reads it back
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def close(self) -> None:
+        self._out.close()
+
+    def discard(self) -> None:
+        self.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass  # already moved into place
+
+
+class _Discard:
+    """Multipart sink for parts that will be rejected anyway."""
+
+    def write(self, data) -> int:
+        return len(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+def _finish_part(part: _StagedPart, path: str):
+    """Worker: move a received part onto its claimed name and prepare it.
+
+    Returns (path, size, sha256); sha256 is None if `prepare_media` rewrote the file.
+    """
+    part.close()
+    try:
+        os.replace(part.path, path)  # same volume: no second copy of the bytes
+    except OSError:
+        os.unlink(path)  # give the claimed name back
+        raise
+    rewritten = prepare_media(path)
+    return path, part.size, None if rewritten else part.hexdigest()
+
+
 @bp.route('/upload', methods=['POST'])
 def upload_file():
     if not is_authenticated(request):
         return jsonify({'error': 'unauthorized'}), 401
-    target = request.form.get('target', 'media')
-    if target not in ALLOWED_TARGETS:
-        return jsonify({'error': 'invalid target folder'}), 400
-    device_mac = request.form.get('device_mac')
-    files = request.files.getlist('file')
-    if not files:
-        return jsonify({'error': 'no files provided'}), 400
-    saved = []
-    dest_dir = static_target_dir(target, device_mac)
-    for f in files:
-        filename = secure_filename(f.filename)
-        if not filename:
-            continue
-        if not is_allowed_filename(filename):
-            continue
-        dest_path = os.path.join(dest_dir, filename)
-        base, ext = os.path.splitext(filename)
-        i = 1
-        while os.path.exists(dest_path):
-            filename = f"{base}_{i}{ext}"
-            dest_path = os.path.join(dest_dir, filename)
-            i += 1
-        f.save(dest_path)
-        user = session.get('user_id') or 'anon'
-        if device_mac:
-            saved.append(url_for('static', filename=f"{target}/{user}/{secure_filename(device_mac)}/{filename}", _external=False))
-        else:
-            saved.append(url_for('static', filename=f"{target}/{user}/{filename}", _external=False))
-    if not saved:
-        return jsonify({'error': 'no valid files uploaded'}), 400
-    return jsonify({'saved': saved}), 201
+    started = time.perf_counter()
+    user = session.get('user_id') or 'anon'
+    length = request.content_length
+    if length is None:
+        return jsonify({'error': 'length_required'}), 411
+    if request.max_content_length is not None and length > request.max_content_length:
+        return jsonify({'error': 'too_large', 'max_bytes': request.max_content_length}), 413
+    # before the body is read, so an over-quota or over-budget upload never touches the disk
+    denied = check_quota(user, length, 0)
+    if denied:
+        return denied
+    try:
+        with media_admission().admit(user, length):
+            resp = _receive_upload(user)
+    except AdmissionDenied as e:
+        return _admission_denied(e)
+    _upload_latency.observe(time.perf_counter() - started)
+    return resp
+
+
+def _receive_upload(user: str):
+    staging = static_target_dir('media', request.args.get('device_mac'))
+    staged = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        name = secure_filename(filename or '')
+        if not name or not is_allowed_filename(name):
+            return _Discard()
+        part = _StagedPart(staging)
+        staged.append(part)
+        return part
+
+    parser = FormDataParser(stream_factory, max_form_memory_size=request.max_form_memory_size,
+                            max_content_length=request.max_content_length, max_form_parts=request.max_form_parts)
+    try:
+        _, form, file_map = parser.parse(request.stream, request.mimetype, request.content_length,
+                                         request.mimetype_params)
+        target = form.get('target', 'media')
+        if target not in ALLOWED_TARGETS:
+            return jsonify({'error': 'invalid target folder'}), 400
+        device_mac = form.get('device_mac') or request.args.get('device_mac')
+        files = file_map.getlist('file')
+        if not files:
+            return jsonify({'error': 'no files provided'}), 400
+        denied = check_quota(user, 0, len(files))
+        if denied:
+            return denied
+        dest_dir = static_target_dir(target, device_mac)
+        results = []
+        pending = []
+        for f in files:
+            filename = secure_filename(f.filename or '')
+            if not isinstance(f.stream, _StagedPart):
+                results.append({'file': f.filename, 'status': 'rejected', 'error': 'unsupported_type'})
+                continue
+            result = {'file': f.filename}
+            results.append(result)
+            # names are claimed here, in part order, so duplicates get _1, _2... predictably
+            try:
+                out, path = create_exclusive(dest_dir, filename)
+                out.close()
+            except OSError as e:
+                result.update(status='failed', error='write_failed', detail=str(e))
+                continue
+            pending.append((result, _upload_pool.submit(_finish_part, f.stream, path)))
+        saved = []
+        for result, fut in pending:
+            try:
+                path, size, digest = fut.result()
+            except OSError as e:
+                result.update(status='failed', error='write_failed', detail=str(e))
+                continue
+            _upload_bytes.inc(size)
+            # catalog writes stay on the request thread (one DB connection per request)
+            media_catalog().add(user, device_mac, path, sha256=digest)
+            rel = os.path.relpath(path, media_catalog().root).replace(os.sep, '/')
+            url = url_for('static', filename=f"{target}/{rel}", _external=False)
+            result.update(status='saved', name=os.path.basename(path), url=url, size=size)
+            saved.append(url)
+        if not saved:
+            return jsonify({'error': 'no valid files uploaded', 'results': results}), 400
+        return jsonify({'saved': saved, 'results': results}), 201
+    finally:
+        for part in staged:
+            part.discard()
+
+
+def _upload_error(e: UploadError):
+    return jsonify(dict(e.extra, error=e.code)), e.status
+
+
+@bp.route('/uploads', methods=['POST'])
+def create_upload():
+    if not is_authenticated(request):
+        return jsonify({'error': 'unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not is_allowed_filename(filename):
+        return jsonify({'error': 'invalid or unsupported filename'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size required'}), 400
+    if size <= 0:
+        return jsonify({'error': 'size required'}), 400
+    device_mac = data.get('device_mac')
+    user = session.get('user_id') or 'anon'
+    denied = check_quota(user, size)
+    if denied:
+        return denied
+    sess = media_uploads().create(user, static_target_dir('media', device_mac), filename, size,
+                                  device_mac=device_mac, sha256=data.get('sha256'))
+    resp = jsonify(dict(sess.to_dict(), location=url_for('media_admin.upload_session', upload_id=sess.id)))
+    resp.headers['Location'] = url_for('media_admin.upload_session', upload_id=sess.id)
+    return resp, 201
+
+
+@bp.route('/uploads/<upload_id>', methods=['GET', 'HEAD', 'PATCH', 'DELETE'])
+def upload_session(upload_id):
+    if not is_authenticated(request):
+        return jsonify({'error': 'unauthorized'}), 401
+    sess = media_uploads().get(upload_id, session.get('user_id') or 'anon')
+    if sess is None:
+        return jsonify({'error': 'not found'}), 404
+    if request.method == 'DELETE':
+        media_uploads().abort(sess)
+        return jsonify({'aborted': sess.id})
+    if request.method == 'PATCH':
+        offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'offset required', 'offset': sess.offset}), 400
+        before = sess.offset
+        try:
+            with media_admission().admit(sess.user, request.content_length or 0):
+                media_uploads().append(sess, offset, request.stream, request.content_length)
+        except AdmissionDenied as e:
+            return _admission_denied(e)
+        except UploadError as e:
+            return _upload_error(e)
+        finally:
+            _upload_bytes.inc(sess.offset - before)
+    resp = jsonify(sess.to_dict())
+    resp.headers['Upload-Offset'] = str(sess.offset)
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    if not is_authenticated(request):
+        return jsonify({'error': 'unauthorized'}), 401
+    user = session.get('user_id') or 'anon'
+    sess = media_uploads().get(upload_id, user)
+    if sess is None:
+        return jsonify({'error': 'not found'}), 404
+    try:
+        path, digest = media_uploads().finish(sess)
+    except UploadError as e:
+        return _upload_error(e)
+    rewritten = prepare_media(path)
+    media_catalog().add(user, sess.device_mac, path, sha256=None if rewritten else digest)
+    rel = os.path.relpath(path, media_catalog().root).replace(os.sep, '/')
+    return jsonify({'saved': [url_for('static', filename=f"media/{rel}", _external=False)], 'sha256': digest}), 201
+
+
+@bp.route('/precheck', methods=['POST'])
+def precheck_upload():
+    """Add a file by hash if the user already stored the same bytes; nothing to upload then."""
+    if not is_authenticated(request):
+        return jsonify({'error': 'unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    sha = (data.get('sha256') or '').lower()
+    filename = secure_filename(data.get('filename') or '')
+    if len(sha) != 64 or not all(c in '0123456789abcdef' for c in sha):
+        return jsonify({'error': 'sha256 required'}), 400
+    if not filename or not is_allowed_filename(filename):
+        return jsonify({'error': 'invalid or unsupported filename'}), 400
+    user = session.get('user_id') or 'anon'
+    catalog = media_catalog()
+    # Only the caller's own content counts, so the endpoint can't be used
+    # to probe what other accounts have stored.
+    if catalog.blobs is None or not catalog.has_content(user, sha) or not catalog.blobs.has(sha):
+        return jsonify({'exists': False})
+    denied = check_quota(user, os.path.getsize(catalog.blobs.path_for(sha)))
+    if denied:
+        return denied
+    device_mac = data.get('device_mac')
+    path = catalog.blobs.link_into(sha, static_target_dir('media', device_mac), filename)
+    catalog.add(user, device_mac, path, sha256=sha)
+    rel = os.path.relpath(path, catalog.root).replace(os.sep, '/')
+    return jsonify({'exists': True, 'deduplicated': True, 'sha256': sha,
+                    'saved': [url_for('static', filename=f"media/{rel}", _external=False)]}), 201
 
 
 @bp.route('/files', methods=['GET'])
@@ -86,22 +443,40 @@ def list_files():
     if not is_authenticated(request):
         return jsonify({'error': 'unauthorized'}), 401
     user = session.get('user_id') or 'anon'
-    device_mac = request.args.get('device_mac')
-    base = static_root() / 'media' / user
-    root = base / secure_filename(device_mac) if device_mac else base
-    files = []
-    if root.exists():
-        for p in sorted(root.iterdir()):
-            if p.is_file():
-                name = p.name
-                if device_mac:
-                    url = url_for('static', filename=f"media/{user}/{secure_filename(device_mac)}/{name}", _external=False)
-                else:
-                    url = url_for('static', filename=f"media/{user}/{name}", _external=False)
-                lower = name.lower()
-                typ = 'image' if lower.endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')) else 'video'
-                files.append({'name': name, 'url': url, 'type': typ})
-    return jsonify({'files': files})
+    args = request.args
+    try:
+        limit = min(int(args.get('limit', MAX_PAGE)), MAX_PAGE)
+    except ValueError:
+        return jsonify({'error': 'invalid limit'}), 400
+    if limit < 1:
+        return jsonify({'error': 'invalid limit'}), 400
+    try:
+        page = media_catalog().page(user, args.get('device_mac'), limit=limit, cursor=args.get('cursor'),
+                                    typ=args.get('type') or None, sort=args.get('sort', 'name'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    totals = user_usage(user)
+    page['usage'] = {'files': totals['files'], 'bytes': totals['bytes'],
+                     'device': totals['devices'].get(device_dir(args.get('device_mac')), {'files': 0, 'bytes': 0}),
+                     'quota_bytes': QUOTA_BYTES or None, 'quota_files': QUOTA_FILES or None}
+    thumbs = media_thumbs()
+    if thumbs is not None:
+        base = url_for('media_admin.thumbnail', name='_')[:-1]
+        page['files'] = [dict(f, thumb=base + thumbs.name_for(f['sha256'])
+                              if f['sha256'] and thumbs.available(f['type']) else None) for f in page['files']]
+    return jsonify(page)
+
+
+@bp.route('/thumb/<name>', methods=['GET'])
+def thumbnail(name):
+    thumbs = media_thumbs()
+    if thumbs is None:
+        return jsonify({'error': 'not found'}), 404
+    # Names are content hashes, so a thumbnail never changes once written.
+    resp = send_from_directory(thumbs.root, secure_filename(name), max_age=31536000)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
 
 
 @bp.route('/delete', methods=['POST'])
@@ -114,12 +489,12 @@ def delete_file():
     if not filename:
         return jsonify({'error': 'filename required'}), 400
     user = session.get('user_id') or 'anon'
-    base = static_root() / 'media' / user
-    path = (base / secure_filename(device_mac) / filename) if device_mac else (base / filename)
+    path = pathlib.Path(media_catalog().dir_for(user, device_mac)) / filename
     if not path.exists() or not path.is_file():
         return jsonify({'error': 'not found'}), 404
     try:
         path.unlink()
+        media_catalog().remove(user, device_mac, filename)
         return jsonify({'deleted': filename})
     except Exception as e:
         return jsonify({'error': 'delete_failed', 'detail': str(e)}), 500
@@ -136,30 +511,58 @@ def fetch_remote():
         return jsonify({'error': 'url required'}), 400
     if target not in ALLOWED_TARGETS:
         return jsonify({'error': 'invalid target folder'}), 400
-    parsed = urllib.request.urlparse(url)
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ('http', 'https'):
+        return jsonify({'error': 'invalid url'}), 400
     filename = secure_filename(os.path.basename(parsed.path))
     if not filename or not is_allowed_filename(filename):
         return jsonify({'error': 'invalid or unsupported filename'}), 400
-    dest_dir = static_target_dir(target)
-    dest_path = os.path.join(dest_dir, filename)
-    base, ext = os.path.splitext(filename)
-    i = 1
-    while os.path.exists(dest_path):
-        filename = f"{base}_{i}{ext}"
-        dest_path = os.path.join(dest_dir, filename)
-        i += 1
-    try:
-        with urllib.request.urlopen(url, timeout=20) as resp, open(dest_path, 'wb') as out:
-            shutil.copyfileobj(resp, out)
-    except Exception as e:
-        return jsonify({'error': 'download_failed', 'detail': str(e)}), 400
     user = session.get('user_id') or 'anon'
-    return jsonify({'saved': [url_for('static', filename=f"{target}/{user}/{filename}", _external=False)]}), 201
+    denied = check_quota(user)
+    if denied:
+        return denied
+    catalog = media_catalog()
+    base_url = url_for('static', filename=target, _external=False)
+
+    def record(path):
+        # the size is only known now; jobs may also have raced each other for the room left
+        if over_quota(catalog, user, os.path.getsize(path)):
+            raise FetchFailed('quota_exceeded')
+        prepare_media(path)
+        catalog.add(user, None, path)
+        rel = os.path.relpath(path, catalog.root).replace(os.sep, '/')
+        return {'saved': [f"{base_url}/{rel}"]}
+
+    # no single job may download more than the user has room for
+    room, over = quota_room(user)
+    job = media_fetches().submit(user, url, static_target_dir(target), filename, on_done=record,
+                                 max_bytes=room, limit_error=over)
+    if job is None:
+        resp = jsonify({'error': 'fetch_queue_full'})
+        resp.headers['Retry-After'] = '30'
+        return resp, 503
+    location = url_for('media_admin.fetch_job', job_id=job.id)
+    resp = jsonify(dict(job.to_dict(), location=location))
+    resp.headers['Location'] = location
+    return resp, 202
+
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def fetch_job(job_id):
+    if not is_authenticated(request):
+        return jsonify({'error': 'unauthorized'}), 401
+    job = media_fetches().get(job_id, session.get('user_id') or 'anon')
+    if job is None:
+        return jsonify({'error': 'not found'}), 404
+    resp = jsonify(job.to_dict())
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 
 @bp.route('/info', methods=['GET'])
 def info():
-    return jsonify({'allowed_targets': sorted(ALLOWED_TARGETS), 'allowed_ext': sorted(ALLOWED_EXT)})
+    return jsonify({'allowed_targets': sorted(ALLOWED_TARGETS), 'allowed_ext': sorted(ALLOWED_EXT),
+                    'uploads_per_user': media_admission().per_user})
 
 
 @bp.route('/manage', methods=['GET'])
@@ -181,14 +584,31 @@ def manage_ui():
         "<div class='row'><h2 style='margin:0'>Media Manager</h2>"
         "<button class='btn ghost' id='refresh'>Refresh</button>"
         "<label class='btn ghost' for='file'>Choose files</label>"
-        "<input id='file' type='file' multiple></div>"
+        "<input id='file' type='file' multiple><span id='status' class='tag'></span><span id='summary' class='tag'></span></div>"
         "<div id='list' class='grid'></div>"
+        "<div class='row' style='margin-top:16px'><button class='btn ghost' id='more' style='display:none'>Load more</button></div>"
         "</div><script>"
-        "document.getElementById('refresh').onclick=fetchFiles;"
-        "document.getElementById('file').onchange=async(e)=>{const files=[...e.target.files];for(const f of files){const fd=new FormData();fd.append('file',f);fd.append('target','media');await fetch('/api/media/upload',{method:'POST',body:fd});}fetchFiles();};"
-        "async function fetchFiles(){const r=await fetch('/api/media/files');if(!r.ok){alert('List failed');return;}"
-        "const data=await r.json();const grid=document.getElementById('list');grid.innerHTML='';for(const f of data.files){const c=document.createElement('div');c.className='card';"
-        "let el;if(f.type==='image'){el=document.createElement('img');el.src=f.url;el.className='thumb';}else{el=document.createElement('video');el.src=f.url;el.className='thumb';el.controls=true;}c.appendChild(el);"
+        "document.getElementById('refresh').onclick=()=>fetchFiles();let nextCursor=null;"
+        "document.getElementById('more').onclick=()=>fetchFiles(nextCursor);"
+        # Files go up in batches (<= 4 files / 32 MB each), with no more requests in flight than
+        # the server admits per user; 429/503 answers are retried after their Retry-After.
+        "document.getElementById('file').onchange=async(e)=>{const files=[...e.target.files];e.target.value='';"
+        "const batches=[];let cur=[],bytes=0;for(const f of files){if(cur.length&&(cur.length>=4||bytes+f.size>33554432)){batches.push(cur);cur=[];bytes=0;}cur.push(f);bytes+=f.size;}if(cur.length)batches.push(cur);"
+        "const st=document.getElementById('status');let done=0,failed=[];st.textContent='Uploading 0/'+files.length;"
+        "async function send(batch){const fd=new FormData();fd.append('target','media');for(const f of batch)fd.append('file',f);"
+        "try{let r;for(let i=0;;i++){r=await fetch('/api/media/upload',{method:'POST',body:fd});if((r.status!==429&&r.status!==503)||i>=20)break;"
+        "st.textContent='Server busy, retrying ('+done+'/'+files.length+')';await new Promise(ok=>setTimeout(ok,1000*(parseInt(r.headers.get('Retry-After'))||5)));}"
+        "const d=await r.json().catch(()=>({}));const res=d.results||[];"
+        "for(const f of batch){const x=res.find(x=>x.file===f.name);if(!x||x.status!=='saved')failed.push(f.name);}}catch(err){failed.push(...batch.map(f=>f.name));}"
+        "done+=batch.length;st.textContent='Uploading '+done+'/'+files.length;}"
+        "let next=0;async function lane(){while(next<batches.length){await send(batches[next++]);}}"
+        "let lanes=3;try{const i=await (await fetch('/api/media/info')).json();lanes=Math.max(1,Math.min(lanes,i.uploads_per_user||lanes));}catch(err){}"
+        "await Promise.all(Array.from({length:lanes},lane));st.textContent=failed.length?('Failed: '+failed.join(', ')):('Uploaded '+files.length);fetchFiles();};"
+        "async function fetchFiles(cursor){const r=await fetch('/api/media/files?limit=60'+(cursor?'&cursor='+encodeURIComponent(cursor):''));if(!r.ok){alert('List failed');return;}"
+        "const data=await r.json();const grid=document.getElementById('list');if(!cursor)grid.innerHTML='';nextCursor=data.next_cursor;"
+        "document.getElementById('more').style.display=nextCursor?'':'none';"
+        "document.getElementById('summary').textContent=data.total+' files, '+(data.total_bytes/1048576).toFixed(1)+' MB';for(const f of data.files){const c=document.createElement('div');c.className='card';"
+        "let el;if(f.thumb){el=document.createElement('img');el.src=f.thumb;el.loading='lazy';el.className='thumb';el.onerror=()=>{el.onerror=null;if(f.type==='image'){el.src=f.url}else{el.removeAttribute('src')}};}else if(f.type==='image'){el=document.createElement('img');el.src=f.url;el.loading='lazy';el.className='thumb';}else{el=document.createElement('video');el.src=f.url;el.preload='metadata';el.className='thumb';el.controls=true;}c.appendChild(el);"
         "const box=document.createElement('div');box.className='box';const nm=document.createElement('div');nm.className='name';nm.textContent=f.name;box.appendChild(nm);"
         "const del=document.createElement('button');del.className='btn ghost';del.textContent='Delete';del.onclick=async()=>{if(!confirm('Delete '+f.name+'?'))return;const d=await fetch('/api/media/delete',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({filename:f.name})});if(d.ok)fetchFiles();else alert('Delete failed');};"
         "box.appendChild(del);c.appendChild(box);grid.appendChild(c);} }"
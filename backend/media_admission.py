@@ -0,0 +1,66 @@
+"""Admission control for media uploads.
+
+A Pi has little RAM, one SD card and four cores shared with the kiosk,
+so a burst of large uploads must not take over the machine. Before an
+upload request reads its body, `UploadAdmission.admit` reserves its
+declared size against a global in-flight byte budget and takes one of the
+user's concurrent-upload slots. When either is exhausted the request is
+turned away at once with a Retry-After hint instead of queueing a thread
+(and its spooled bytes) behind the others; `/status` and playlist
+requests never wait on uploads.
+"""
+
+import contextlib
+import threading
+
+
+class AdmissionDenied(Exception):
+    """Raised with the API error code, HTTP status and Retry-After seconds."""
+
+    def __init__(self, code: str, status: int, retry_after: int):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+        self.retry_after = retry_after
+
+
+class UploadAdmission:
+    def __init__(self, max_inflight_bytes: int = 512 << 20, per_user: int = 2):
+        self.max_inflight_bytes = max_inflight_bytes
+        self.per_user = per_user
+        self.inflight_bytes = 0
+        self.rejected = 0
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def admit(self, user: str, nbytes: int):
+        """Hold a slot for one upload of `nbytes` while the block runs.
+
+        A single upload bigger than the whole budget is admitted only when
+        nothing else is in flight, so it can't be refused forever.
+        """
+        with self._lock:
+            if self._by_user.get(user, 0) >= self.per_user:
+                self.rejected += 1
+                raise AdmissionDenied('too_many_uploads', 429, 5)
+            if self.inflight_bytes and self.inflight_bytes + nbytes > self.max_inflight_bytes:
+                self.rejected += 1
+                raise AdmissionDenied('server_busy', 503, 10)
+            self._by_user[user] = self._by_user.get(user, 0) + 1
+            self.inflight_bytes += nbytes
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight_bytes -= nbytes
+                if self._by_user[user] <= 1:
+                    del self._by_user[user]
+                else:
+                    self._by_user[user] -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'inflight_bytes': self.inflight_bytes, 'uploads': sum(self._by_user.values()),
+                    'max_inflight_bytes': self.max_inflight_bytes, 'per_user': self.per_user,
+                    'rejected': self.rejected}
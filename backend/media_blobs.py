@@ -0,0 +1,66 @@
+"""Content-addressed storage for media bytes.
+
+Each distinct file is kept once as `root/<sha256>`; the per-user and
+per-device names under static/media are hard links to it, so the same
+video on five devices costs its size once and existing `/static/media/...`
+URLs keep working. References are the `media_items` rows carrying the
+hash; the catalog releases a blob when its last row goes. On filesystems
+without hard links entries stay plain files (no dedup, nothing breaks).
+"""
+
+import os
+import threading
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.reclaimed = 0
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256)
+
+    def has(self, sha256: str) -> bool:
+        return os.path.isfile(self.path_for(sha256))
+
+    def adopt(self, path: str, sha256: str) -> bool:
+        """Make `path` a link to the blob for `sha256`; True if it was deduplicated."""
+        blob = self.path_for(sha256)
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            os.link(path, blob)
+            return False  # first copy: the new file becomes the blob
+        except FileExistsError:
+            pass
+        except OSError:
+            return False  # no hard links here; keep the plain file
+        try:
+            if os.path.samefile(path, blob):
+                return False
+            tmp = f"{path}.{threading.get_ident()}.dedup"
+            os.link(blob, tmp)
+            os.replace(tmp, path)
+            return True
+        except OSError:
+            return False
+
+    def link_into(self, sha256: str, dest_dir: str, filename: str) -> str:
+        """Create a new entry for an existing blob under the first free name."""
+        base, ext = os.path.splitext(filename)
+        name, i = filename, 1
+        while True:
+            dest = os.path.join(dest_dir, name)
+            try:
+                os.link(self.path_for(sha256), dest)
+                return dest
+            except FileExistsError:
+                name = f"{base}_{i}{ext}"
+                i += 1
+
+    def release(self, sha256: str) -> None:
+        """Drop the blob (caller has checked no references remain)."""
+        try:
+            os.unlink(self.path_for(sha256))
+            self.reclaimed += 1
+        except FileNotFoundError:
+            pass
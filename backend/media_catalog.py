@@ -0,0 +1,437 @@
+"""Media library index backed by the `media_items` table.
+
+Every uploaded or fetched file gets a row (owner, device_mac, filename,
+type, size, sha256, dimensions, duration, mtime, sort order), so a
+playlist or file list is one indexed query instead of a directory walk,
+and every backend process sharing the DB sees the same library. On top of
+that, each process keeps the listing per (user, device_mac) in memory with
+the playlist and file-list payloads prebuilt; local writes invalidate it
+and writes from other processes show up after at most `recheck_sec`.
+`rescan` backfills the table from files already under `root`. Listeners
+registered with `add_listener` see every new or changed file (thumbnails).
+With a `BlobStore`, recorded files are linked to one copy per sha256 and
+a blob is released when the last row referencing it goes. File count and
+bytes per key are kept in `media_usage`, adjusted in the same transaction
+as every row change, so quota checks are a primary-key read.
+"""
+
+import base64
+import binascii
+import bisect
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import text
+from werkzeug.utils import secure_filename
+
+try:
+    from .media_probe import file_sha256, image_size, media_duration_ms, has_duration_parser
+except ImportError:
+    from media_probe import file_sha256, image_size, media_duration_ms, has_duration_parser
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+VIDEO_EXTS = ('.mp4', '.mov', '.m4v', '.avi', '.webm')
+IMAGE_DURATION_MS = 6000
+
+_COLS = ('filename', 'type', 'size', 'sha256', 'width', 'height', 'duration_ms', 'mtime', 'sort_order', 'variant')
+
+
+def media_type(name: str) -> str | None:
+    lower = name.lower()
+    if lower.endswith(IMAGE_EXTS):
+        return 'image'
+    if lower.endswith(VIDEO_EXTS):
+        return 'video'
+    return None
+
+
+def display_ms(typ: str, duration_ms: int | None) -> int | None:
+    """How long a playlist item stays up: video length; stills 6 s; animations whole loops >= 6 s."""
+    if typ == 'video':
+        return duration_ms
+    if not duration_ms:
+        return IMAGE_DURATION_MS
+    return duration_ms * max(1, math.ceil(IMAGE_DURATION_MS / duration_ms))
+
+
+def device_dir(device_mac: str | None) -> str:
+    """Directory name used for a device's media (same rule as uploads)."""
+    return secure_filename(device_mac) if device_mac else ''
+
+
+class MediaEntry:
+    __slots__ = ('name', 'type', 'size', 'sha256', 'width', 'height', 'duration_ms', 'mtime', 'sort_order',
+                 'url', 'variant_url')
+
+    def __init__(self, row, url, variant_url=None):
+        (self.name, self.type, self.size, self.sha256, self.width, self.height,
+         self.duration_ms, self.mtime, self.sort_order) = row
+        self.url = url
+        self.variant_url = variant_url
+
+    @property
+    def play_url(self) -> str:
+        """What kiosks should load: the display-sized variant if there is one."""
+        return self.variant_url or self.url
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'url': self.url, 'variant_url': self.variant_url, 'type': self.type,
+                'size': self.size, 'mtime': self.mtime, 'sha256': self.sha256, 'width': self.width,
+                'height': self.height, 'duration_ms': self.duration_ms}
+
+
+SORTS = {
+    'name': lambda f: (f['name'],),
+    'newest': lambda f: (-(f['mtime'] or 0), f['name']),
+    'largest': lambda f: (-(f['size'] or 0), f['name']),
+}
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of `encode_cursor`; ValueError if it was not made by it."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('invalid cursor') from e
+    if not isinstance(key, list) or not key:
+        raise ValueError('invalid cursor')
+    return tuple(key)
+
+
+class _Listing:
+    __slots__ = ('entries', 'loaded', 'playlist', 'manifest', 'files', '_orders', '_totals')
+
+    def __init__(self, entries, loaded):
+        self.entries = entries
+        self.loaded = loaded
+        # Videos first, then images; each group by sort order, then name.
+        ordered = sorted(entries, key=lambda e: (e.sort_order, e.name))
+        played = [e for typ in ('video', 'image') for e in ordered if e.type == typ]
+        self.playlist = [{'type': e.type, 'src': e.play_url, 'duration_ms': display_ms(e.type, e.duration_ms)}
+                         for e in played]
+        # For precaching: a variant's bytes follow from the source hash and
+        # its URL, so sha256 versions either; its size isn't known here.
+        items = [dict(item, sha256=e.sha256, size=None if e.variant_url else e.size)
+                 for item, e in zip(self.playlist, played)]
+        version = hashlib.sha256(json.dumps(items, sort_keys=True).encode()).hexdigest()[:16]
+        self.manifest = {'version': version, 'items': items}
+        self.files = [e.to_dict() for e in entries]
+        self._orders = {}
+        self._totals = {None: (len(self.files), sum(f['size'] or 0 for f in self.files))}
+        for typ in ('image', 'video'):
+            of_type = [f for f in self.files if f['type'] == typ]
+            self._totals[typ] = (len(of_type), sum(f['size'] or 0 for f in of_type))
+
+    def page(self, limit, cursor, typ, sort) -> dict:
+        """One page of `files`; the cursor is the sort key of the last item returned."""
+        order = self._orders.get((sort, typ))
+        if order is None:
+            key = SORTS[sort]
+            files = sorted((f for f in self.files if typ is None or f['type'] == typ), key=key)
+            order = self._orders[(sort, typ)] = ([key(f) for f in files], files)
+        keys, files = order
+        start = bisect.bisect_right(keys, cursor) if cursor else 0
+        items = files[start:start + limit]
+        more = start + limit < len(files)
+        count, size = self._totals[typ]
+        return {'files': items, 'next_cursor': encode_cursor(keys[start + limit - 1]) if more else None,
+                'total': count, 'total_bytes': size}
+
+
+class MediaCatalog:
+    """Rows of `media_items` for `root/<user>[/<device_mac>]`, cached per key."""
+
+    def __init__(self, engine, root: str, url_prefix: str = '/static/media', recheck_sec: float = 2.0,
+                 variant_prefix: str = '/static/variants', blobs=None):
+        self._engine = engine
+        self.root = root
+        self.blobs = blobs
+        self.url_prefix = url_prefix.rstrip('/')
+        self.variant_prefix = variant_prefix.rstrip('/')
+        self.recheck_sec = recheck_sec
+        self.loads = 0
+        self._lock = threading.Lock()
+        self._listings = {}
+        self._generation = {}
+        self._listeners = []
+        self._reclaim_listeners = []
+
+    def add_listener(self, fn) -> None:
+        """Register `fn(path, row)` for recorded files; it must not block."""
+        self._listeners.append(fn)
+
+    def _notify(self, path, row) -> None:
+        for fn in self._listeners:
+            try:
+                fn(path, row)
+            except Exception:
+                pass
+
+    def add_reclaim_listener(self, fn) -> None:
+        """Register `fn(sha256)` for content no row references any more."""
+        self._reclaim_listeners.append(fn)
+
+    def dir_for(self, user: str, device_mac: str | None = None) -> str:
+        sub = device_dir(device_mac)
+        return os.path.join(self.root, user, sub) if sub else os.path.join(self.root, user)
+
+    def invalidate(self, user: str, device_mac: str | None = None) -> None:
+        self._invalidate_key((user, device_dir(device_mac)))
+
+    def _invalidate_key(self, key) -> None:
+        with self._lock:
+            self._listings.pop(key, None)
+            self._generation[key] = self._generation.get(key, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in self._listings:
+                self._generation[key] = self._generation.get(key, 0) + 1
+            self._listings.clear()
+
+    # Writes
+
+    def _row_for(self, path: str, name: str, sha256: str | None = None) -> dict | None:
+        typ = media_type(name)
+        if typ is None:
+            return None
+        st = os.stat(path)
+        width, height = image_size(path) if typ == 'image' else (None, None)
+        return {'filename': name, 'type': typ, 'size': st.st_size, 'sha256': sha256 or file_sha256(path),
+                'width': width, 'height': height, 'duration_ms': media_duration_ms(path), 'mtime': int(st.st_mtime), 'sort_order': 0,
+                'variant': None}
+
+    def _upsert(self, conn, owner, sub, row) -> str | None:
+        """Replace the row for one file; returns the sha256 it had before, if any."""
+        params = dict(row, owner=owner, device_mac=sub)
+        where = 'WHERE owner=:owner AND device_mac=:device_mac AND filename=:filename'
+        old = conn.execute(text('SELECT sha256, size FROM media_items ' + where), params).first()
+        conn.execute(text('DELETE FROM media_items ' + where), params)
+        conn.execute(text(f"INSERT INTO media_items (owner, device_mac, {', '.join(_COLS)}) "
+                          f"VALUES (:owner, :device_mac, {', '.join(':' + c for c in _COLS)})"), params)
+        if old is None:
+            self._count(conn, owner, sub, 1, row['size'])
+            return None
+        self._count(conn, owner, sub, 0, row['size'] - old[1])
+        return old[0]
+
+    @staticmethod
+    def _count(conn, owner, sub, files, size) -> None:
+        params = {'o': owner, 'd': sub, 'n': files, 'b': size}
+        if not conn.execute(text('UPDATE media_usage SET files=files+:n, bytes=bytes+:b WHERE owner=:o AND device_mac=:d'),
+                            params).rowcount:
+            conn.execute(text('INSERT INTO media_usage (owner, device_mac, files, bytes) VALUES (:o, :d, :n, :b)'), params)
+
+    def usage(self, user: str | None = None) -> dict:
+        """{owner: {'files', 'bytes', 'devices': {device_dir: {'files', 'bytes'}}}}, for one user or all."""
+        sql = 'SELECT owner, device_mac, files, bytes FROM media_usage'
+        with self._engine.connect() as conn:
+            rows = conn.execute(text(sql + ' WHERE owner=:o'), {'o': user}) if user else conn.execute(text(sql))
+            out = {}
+            for owner, sub, files, size in rows:
+                totals = out.setdefault(owner, {'files': 0, 'bytes': 0, 'devices': {}})
+                totals['files'] += files
+                totals['bytes'] += size
+                totals['devices'][sub] = {'files': files, 'bytes': size}
+        return out
+
+    def _adopt(self, path, row) -> None:
+        if self.blobs is not None and row.get('sha256'):
+            self.blobs.adopt(path, row['sha256'])
+
+    def _reclaim(self, conn, hashes) -> None:
+        """Release blobs and derived files no row references any more."""
+        for sha in set(hashes) - {None}:
+            if conn.execute(text('SELECT COUNT(*) FROM media_items WHERE sha256=:s'), {'s': sha}).scalar():
+                continue
+            if self.blobs is not None:
+                self.blobs.release(sha)
+            for fn in self._reclaim_listeners:
+                try:
+                    fn(sha)
+                except Exception:
+                    pass
+
+    def has_content(self, user: str, sha256: str) -> bool:
+        """True if `user` already has a file with these bytes (any device)."""
+        with self._engine.connect() as conn:
+            return conn.execute(text('SELECT 1 FROM media_items WHERE owner=:o AND sha256=:s LIMIT 1'),
+                                {'o': user, 's': sha256}).first() is not None
+
+    def add(self, user: str, device_mac: str | None, path: str, sha256: str | None = None) -> dict | None:
+        """Record a file just written under `dir_for(user, device_mac)`."""
+        row = self._row_for(path, os.path.basename(path), sha256)
+        if row is None:
+            return None
+        key = (user, device_dir(device_mac))
+        row.update(owner=key[0], device_mac=key[1])
+        self._adopt(path, row)
+        with self._engine.begin() as conn:
+            old = self._upsert(conn, key[0], key[1], row)
+            if old != row['sha256']:
+                self._reclaim(conn, [old])
+        self._invalidate_key(key)
+        self._notify(path, row)
+        return row
+
+    def remove(self, user: str, device_mac: str | None, filename: str) -> None:
+        key = (user, device_dir(device_mac))
+        params = {'o': key[0], 'd': key[1], 'f': filename}
+        with self._engine.begin() as conn:
+            old = conn.execute(text('SELECT sha256, size FROM media_items WHERE owner=:o AND device_mac=:d AND filename=:f'),
+                               params).first()
+            if old is not None:
+                conn.execute(text('DELETE FROM media_items WHERE owner=:o AND device_mac=:d AND filename=:f'), params)
+                self._count(conn, key[0], key[1], -1, -old[1])
+                self._reclaim(conn, [old[0]])
+        self._invalidate_key(key)
+
+    def set_variant(self, row: dict, variant: str | None) -> None:
+        """Point a row at its display-sized copy (if the file is unchanged)."""
+        with self._engine.begin() as conn:
+            conn.execute(text('UPDATE media_items SET variant=:v WHERE owner=:o AND device_mac=:d '
+                              'AND filename=:f AND sha256=:s'),
+                         {'v': variant, 'o': row['owner'], 'd': row['device_mac'], 'f': row['filename'], 's': row['sha256']})
+        self._invalidate_key((row['owner'], row['device_mac']))
+
+    def renotify(self, user: str, device_mac: str | None = None) -> int:
+        """Replay listeners for every file of one key (e.g. after a setting changed)."""
+        base = self.dir_for(user, device_mac)
+        entries = self._load((user, device_dir(device_mac)))
+        for e in entries:
+            self._notify(os.path.join(base, e.name), {
+                'owner': user, 'device_mac': device_dir(device_mac), 'filename': e.name, 'type': e.type,
+                'sha256': e.sha256, 'width': e.width, 'height': e.height})
+        return len(entries)
+
+    def rename_owner(self, old: str, new: str) -> None:
+        """Re-key rows after `<root>/<old>` was renamed to `<root>/<new>`; nothing is rehashed."""
+        with self._engine.begin() as conn:
+            stale = [r[0] for r in conn.execute(text('SELECT sha256 FROM media_items WHERE owner=:n'), {'n': new})]
+            for table in ('media_items', 'media_usage'):
+                conn.execute(text(f'DELETE FROM {table} WHERE owner=:n'), {'n': new})
+                conn.execute(text(f'UPDATE {table} SET owner=:n WHERE owner=:o'), {'n': new, 'o': old})
+            self._reclaim(conn, stale)
+        self.clear()
+
+    def rescan(self, user: str | None = None) -> dict:
+        """Sync rows with files on disk; only new or changed files are hashed."""
+        found = {}
+        users = [user] if user else (sorted(os.listdir(self.root)) if os.path.isdir(self.root) else [])
+        for owner in users:
+            base = os.path.join(self.root, owner)
+            if not os.path.isdir(base):
+                continue
+            for name in sorted(os.listdir(base)):
+                path = os.path.join(base, name)
+                if os.path.isdir(path):
+                    for sub_name in sorted(os.listdir(path)):
+                        sub_path = os.path.join(path, sub_name)
+                        if os.path.isfile(sub_path) and media_type(sub_name):
+                            found[(owner, name, sub_name)] = sub_path
+                elif media_type(name):
+                    found[(owner, '', name)] = path
+        added = updated = removed = 0
+        changed, dropped = [], []
+        with self._engine.begin() as conn:
+            sql = 'SELECT owner, device_mac, filename, size, mtime, duration_ms, sha256 FROM media_items'
+            rows = conn.execute(text(sql + ' WHERE owner=:o'), {'o': user}) if user else conn.execute(text(sql))
+            known = {(r[0], r[1], r[2]): (r[3], r[4], r[5], r[6]) for r in rows}
+            for key, path in found.items():
+                st = os.stat(path)
+                if key in known and known[key][:2] == (st.st_size, int(st.st_mtime)):
+                    self._adopt(path, {'sha256': known[key][3]})  # files from before the blob store
+                    if known[key][2] is None and has_duration_parser(key[2]):
+                        # rows recorded before durations were probed
+                        ms = media_duration_ms(path)
+                        if ms is not None:
+                            conn.execute(text('UPDATE media_items SET duration_ms=:ms WHERE owner=:o AND device_mac=:d '
+                                              'AND filename=:f'), {'ms': ms, 'o': key[0], 'd': key[1], 'f': key[2]})
+                            updated += 1
+                    continue
+                row = dict(self._row_for(path, key[2]), owner=key[0], device_mac=key[1])
+                self._adopt(path, row)
+                old = self._upsert(conn, key[0], key[1], row)
+                if old != row['sha256']:
+                    dropped.append(old)
+                changed.append((path, row))
+                if key in known:
+                    updated += 1
+                else:
+                    added += 1
+            for key in known.keys() - found.keys():
+                conn.execute(text('DELETE FROM media_items WHERE owner=:o AND device_mac=:d AND filename=:f'),
+                             {'o': key[0], 'd': key[1], 'f': key[2]})
+                dropped.append(known[key][3])
+                removed += 1
+            self._reclaim(conn, dropped)
+            # Recount from the rows, which also seeds totals for libraries
+            # recorded before media_usage existed.
+            where = ' WHERE owner=:o' if user else ''
+            conn.execute(text('DELETE FROM media_usage' + where), {'o': user})
+            conn.execute(text('INSERT INTO media_usage (owner, device_mac, files, bytes) SELECT owner, device_mac, '
+                              'COUNT(*), SUM(size) FROM media_items' + where + ' GROUP BY owner, device_mac'), {'o': user})
+        self.clear()
+        for path, row in changed:
+            self._notify(path, row)
+        return {'added': added, 'updated': updated, 'removed': removed, 'total': len(found)}
+
+    # Reads
+
+    def entries(self, user: str, device_mac: str | None = None) -> list[MediaEntry]:
+        return self._listing(user, device_mac).entries
+
+    def playlist(self, user: str, device_mac: str | None = None) -> list[dict]:
+        return self._listing(user, device_mac).playlist
+
+    def manifest(self, user: str, device_mac: str | None = None) -> dict:
+        """Playlist items with sha256 and size, plus a version that changes with any of them."""
+        return self._listing(user, device_mac).manifest
+
+    def files(self, user: str, device_mac: str | None = None) -> list[dict]:
+        return self._listing(user, device_mac).files
+
+    def page(self, user: str, device_mac: str | None = None, limit: int = 100, cursor: str | None = None,
+             typ: str | None = None, sort: str = 'name') -> dict:
+        """A page of `files` plus totals; pass the returned `next_cursor` for the next one."""
+        if sort not in SORTS or typ not in (None, 'image', 'video'):
+            raise ValueError('invalid sort or type')
+        key = decode_cursor(cursor) if cursor else None
+        try:
+            return self._listing(user, device_mac).page(limit, key, typ, sort)
+        except TypeError as e:  # a cursor from a different sort
+            raise ValueError('invalid cursor') from e
+
+    def _listing(self, user, device_mac) -> _Listing:
+        key = (user, device_dir(device_mac))
+        now = time.monotonic()
+        with self._lock:
+            listing = self._listings.get(key)
+            generation = self._generation.get(key, 0)
+        if listing is not None and now - listing.loaded < self.recheck_sec:
+            return listing
+        listing = _Listing(self._load(key), now)
+        with self._lock:
+            # Don't cache a load that raced with a local write to the same key.
+            if self._generation.get(key, 0) == generation:
+                self._listings[key] = listing
+        return listing
+
+    def _load(self, key) -> list[MediaEntry]:
+        self.loads += 1
+        user, sub = key
+        prefix = f"{self.url_prefix}/{user}/{sub}/" if sub else f"{self.url_prefix}/{user}/"
+        with self._engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT {', '.join(_COLS)} FROM media_items "
+                                     'WHERE owner=:o AND device_mac=:d ORDER BY filename'),
+                                {'o': user, 'd': sub}).fetchall()
+        return [MediaEntry(tuple(r[:-1]), prefix + r[0], f"{self.variant_prefix}/{r[-1]}" if r[-1] else None)
+                for r in rows]
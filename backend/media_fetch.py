@@ -0,0 +1,195 @@
+"""Background downloads for `/api/media/fetch`.
+
+A fetch used to run inside the request thread, so a slow remote held a
+server worker (and the client) for the whole transfer. `FetchQueue` runs
+each download as a job on a small thread pool instead: bytes stream into a
+hidden temp file next to the destination, a dropped connection is retried
+with a `Range` request from the bytes already on disk, and the finished
+file is renamed onto a freshly claimed name. Jobs are kept in memory for
+progress polling; the request that started one only waits for it to be
+queued.
+"""
+
+import concurrent.futures
+import http.client
+import os
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+
+try:
+    from .media_uploads import create_exclusive
+except ImportError:
+    from media_uploads import create_exclusive
+
+CHUNK = 1 << 16
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-\d+/(\d+|\*)')
+
+
+class FetchFailed(Exception):
+    """A job error that retrying will not fix (e.g. 404, over the size cap)."""
+
+    def __init__(self, code: str, detail: str = ''):
+        super().__init__(detail or code)
+        self.code = code
+        self.detail = detail
+
+
+class FetchJob:
+    def __init__(self, user, url, dest_dir, filename, on_done=None, max_bytes=None, limit_error='too_large'):
+        self.id = secrets.token_hex(8)
+        self.user = user
+        self.url = url
+        self.dest_dir = dest_dir
+        self.filename = filename
+        self.on_done = on_done
+        self.max_bytes = max_bytes
+        self.limit_error = limit_error
+        self.state = 'queued'
+        self.received = 0
+        self.total = None
+        self.attempts = 0
+        self.error = None
+        self.detail = None
+        self.path = None
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def tmp_path(self) -> str:
+        return os.path.join(self.dest_dir, f".{self.id}.fetch")
+
+    def to_dict(self) -> dict:
+        return {'id': self.id, 'url': self.url, 'state': self.state, 'received': self.received,
+                'total': self.total, 'attempts': self.attempts, 'error': self.error, 'detail': self.detail,
+                'name': os.path.basename(self.path) if self.path else None, 'result': self.result}
+
+
+class FetchQueue:
+    """Bounded pool of downloaders; jobs beyond `max_pending` are refused."""
+
+    def __init__(self, workers: int = 2, max_bytes: int = 2 << 30, max_pending: int = 32, retries: int = 3,
+                 timeout: float = 20.0, backoff: float = 1.0, keep_sec: float = 3600.0):
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.keep_sec = keep_sec
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user, url, dest_dir, filename, on_done=None, max_bytes=None,
+               limit_error='too_large') -> FetchJob | None:
+        """Queue a download; None if the queue is full.
+
+        `on_done(path)` runs on the worker once the file is in place and
+        may return a JSON-able result for the job. `max_bytes` lowers the
+        queue's size cap for this job; going over it fails the job with
+        `limit_error`.
+        """
+        self._prune()
+        if not self._slots.acquire(blocking=False):
+            return None
+        if max_bytes is None or max_bytes >= self.max_bytes:
+            max_bytes, limit_error = self.max_bytes, 'too_large'
+        job = FetchJob(user, url, dest_dir, filename, on_done, max_bytes, limit_error)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str, user) -> FetchJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.user == user else None
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.keep_sec
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished < cutoff]:
+                del self._jobs[job_id]
+
+    def _run(self, job: FetchJob) -> None:
+        try:
+            job.state = 'downloading'
+            while True:
+                job.attempts += 1
+                try:
+                    self._download(job)
+                    break
+                except FetchFailed:
+                    raise
+                except (OSError, ValueError, http.client.HTTPException) as e:  # timeouts, resets, short reads
+                    if job.attempts > self.retries:
+                        raise FetchFailed('download_failed', str(e))
+                    time.sleep(self.backoff * 2 ** (job.attempts - 1))
+            out, job.path = create_exclusive(job.dest_dir, job.filename)
+            out.close()
+            os.replace(job.tmp_path, job.path)  # the name is ours; the rename publishes the bytes
+            if job.on_done is not None:
+                job.result = job.on_done(job.path)
+            job.state = 'done'
+        except FetchFailed as e:
+            job.state, job.error, job.detail = 'failed', e.code, e.detail
+        except Exception as e:
+            job.state, job.error, job.detail = 'failed', 'internal_error', str(e)
+        finally:
+            if job.state != 'done':
+                # the claimed name too: a placeholder, or a file on_done never recorded
+                for path in (job.tmp_path, job.path):
+                    try:
+                        if path:
+                            os.unlink(path)
+                    except OSError:
+                        pass
+                job.path = None
+            job.finished = time.time()
+            self._slots.release()
+
+    def _download(self, job: FetchJob) -> None:
+        """One attempt: continue the temp file from `job.received`."""
+        req = urllib.request.Request(job.url)
+        if job.received:
+            req.add_header('Range', f'bytes={job.received}-')
+        try:
+            resp = urllib.request.urlopen(req, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and job.total is not None and job.received == job.total:
+                return
+            if e.code in (408, 429) or e.code >= 500:
+                raise
+            raise FetchFailed('download_failed', f'HTTP {e.code}')
+        with resp:
+            start = 0
+            if resp.status == 206:
+                m = _CONTENT_RANGE.match(resp.headers.get('Content-Range', ''))
+                if not m or int(m.group(1)) != job.received:
+                    raise FetchFailed('download_failed', 'unexpected Content-Range')
+                start = job.received
+                if m.group(2) != '*':
+                    job.total = int(m.group(2))
+            else:
+                length = resp.headers.get('Content-Length')
+                job.total = int(length) if length and length.isdigit() else None
+            if job.total is not None and job.total > job.max_bytes:
+                raise FetchFailed(job.limit_error, f'{job.total} bytes')
+            job.received = start  # a 200 to a Range request starts over
+            with open(job.tmp_path, 'r+b' if start else 'wb') as out:
+                out.seek(start)
+                out.truncate()
+                while True:
+                    chunk = resp.read(CHUNK)
+                    if not chunk:
+                        break
+                    if job.received + len(chunk) > job.max_bytes:
+                        raise FetchFailed(job.limit_error, f'over {job.max_bytes} bytes')
+                    out.write(chunk)
+                    job.received += len(chunk)
+        if job.total is not None and job.received < job.total:
+            raise ConnectionError(f'connection closed at {job.received}/{job.total} bytes')
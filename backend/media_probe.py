@@ -0,0 +1,218 @@
+"""Header-only probes for media metadata (no decoding, no dependencies)."""
+
+import collections
+import hashlib
+import os
+import struct
+import threading
+
+try:
+    from .mp4_faststart import top_level_boxes, child_boxes
+except ImportError:
+    from mp4_faststart import top_level_boxes, child_boxes
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+            continue  # standalone markers carry no length
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        length = struct.unpack('>H', seg)[0]
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack('>xHH', data)
+            return w, h
+        f.seek(length - 2, 1)
+
+
+def _webp_size(head):
+    kind = head[12:16]
+    if kind == b'VP8 ' and len(head) >= 30:
+        w, h = struct.unpack('<HH', head[26:30])
+        return w & 0x3fff, h & 0x3fff
+    if kind == b'VP8L' and len(head) >= 25:
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if kind == b'VP8X' and len(head) >= 30:
+        return (int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1)
+    return None
+
+
+def image_size(path: str) -> tuple[int | None, int | None]:
+    """(width, height) read from the file header; (None, None) if unknown."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            size = None
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and len(head) >= 24:
+                size = struct.unpack('>II', head[16:24])
+            elif head[:6] in (b'GIF87a', b'GIF89a') and len(head) >= 10:
+                size = struct.unpack('<HH', head[6:10])
+            elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                size = _webp_size(head)
+            elif head[:2] == b'\xff\xd8':
+                size = _jpeg_size(f)
+    except (OSError, struct.error):
+        size = None
+    return (size[0], size[1]) if size else (None, None)
+
+
+def _mp4_duration(f):
+    size = os.fstat(f.fileno()).st_size
+    for kind, offset, box_size in top_level_boxes(f, size):
+        if kind != b'moov':
+            continue
+        f.seek(offset)
+        _, moov = next(child_boxes(f.read(box_size)))
+        best = None
+        for child, payload in child_boxes(moov):
+            if child == b'mvhd':
+                best = _mvhd_ms(payload)
+            elif child == b'trak' and not best:
+                # mvhd can be zero (e.g. fragmented files); use the longest track
+                mdia = dict(child_boxes(payload)).get(b'mdia')
+                mdhd = dict(child_boxes(mdia)).get(b'mdhd') if mdia else None
+                if mdhd:
+                    ms = _mvhd_ms(mdhd)
+                    best = max(best or 0, ms or 0) or None
+        return best
+    return None
+
+
+def _mvhd_ms(payload):
+    """mvhd and mdhd share the layout: version, dates, timescale, duration."""
+    if payload[0] == 0:
+        timescale, duration = struct.unpack_from('>II', payload, 12)
+        unknown = duration == 0xffffffff
+    else:
+        timescale, duration = struct.unpack_from('>IQ', payload, 20)
+        unknown = duration == 0xffffffffffffffff
+    if not timescale or not duration or unknown:
+        return None
+    return round(duration * 1000 / timescale)
+
+
+def _skip_sub_blocks(f):
+    while True:
+        n = f.read(1)
+        if not n or n[0] == 0:
+            return
+        f.seek(n[0], 1)
+
+
+def _gif_duration(f):
+    head = f.read(13)
+    if head[:6] not in (b'GIF87a', b'GIF89a'):
+        return None
+    if head[10] & 0x80:
+        f.seek(3 << ((head[10] & 0x07) + 1), 1)
+    frames, total, delay = 0, 0, 0
+    while True:
+        tag = f.read(1)
+        if not tag or tag == b'\x3b':
+            break
+        if tag == b'\x21':
+            label = f.read(1)
+            if label == b'\xf9':
+                block = f.read(6)  # size, packed, delay(2), transparent index, terminator
+                delay = struct.unpack_from('<H', block, 2)[0]
+            else:
+                _skip_sub_blocks(f)
+        elif tag == b'\x2c':
+            desc = f.read(9)
+            if len(desc) < 9:
+                break
+            if desc[8] & 0x80:
+                f.seek(3 << ((desc[8] & 0x07) + 1), 1)
+            f.seek(1, 1)  # LZW minimum code size
+            _skip_sub_blocks(f)
+            frames += 1
+            total += (delay if delay >= 2 else 10) * 10  # browsers clamp tiny delays to 100 ms
+            delay = 0
+        else:
+            break
+    return total if frames > 1 else None
+
+
+def _webp_duration(f):
+    head = f.read(12)
+    if head[:4] != b'RIFF' or head[8:12] != b'WEBP':
+        return None
+    total, frames = 0, 0
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        kind, size = struct.unpack('<4sI', chunk)
+        if kind == b'ANMF':
+            frame = f.read(16)
+            if len(frame) < 16:
+                break
+            frames += 1
+            total += int.from_bytes(frame[12:15], 'little')
+            f.seek(size + (size & 1) - 16, 1)
+        else:
+            f.seek(size + (size & 1), 1)
+    return total if frames > 1 else None
+
+
+_DURATION_PARSERS = {'.mp4': _mp4_duration, '.m4v': _mp4_duration, '.mov': _mp4_duration,
+                     '.gif': _gif_duration, '.webp': _webp_duration}
+_duration_cache = collections.OrderedDict()
+_duration_lock = threading.Lock()
+_DURATION_CACHE_SIZE = 4096
+
+
+def has_duration_parser(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in _DURATION_PARSERS
+
+
+def media_duration_ms(path: str) -> int | None:
+    """Playback length of a video or one loop of an animated GIF/WebP.
+
+    None for still images and formats without a parser (webm, avi).
+    Results are cached by (path, mtime, size).
+    """
+    parser = _DURATION_PARSERS.get(os.path.splitext(path)[1].lower())
+    if parser is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _duration_lock:
+        if key in _duration_cache:
+            _duration_cache.move_to_end(key)
+            return _duration_cache[key]
+    try:
+        with open(path, 'rb') as f:
+            ms = parser(f)
+    except (OSError, ValueError, struct.error, StopIteration, IndexError):
+        ms = None
+    with _duration_lock:
+        _duration_cache[key] = ms
+        if len(_duration_cache) > _DURATION_CACHE_SIZE:
+            _duration_cache.popitem(last=False)
+    return ms
@@ -0,0 +1,122 @@
+"""Small JPEG thumbnails for the media library, built off the request path.
+
+After a file lands in the catalog, `ThumbnailWorker.submit` queues it on a
+small thread pool. Images are scaled with Pillow when it is installed and
+video poster frames come from `ffmpeg` when it is on PATH (which also
+covers images without Pillow). Thumbnails are named by the source's
+sha256, so a URL never changes meaning and can be cached forever. Without
+either tool nothing is queued and clients fall back to the full file.
+"""
+
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+THUMB_SIZE = 320
+
+
+class ThumbnailWorker:
+    """Bounded background pool writing `<root>/<sha256>.jpg`."""
+
+    def __init__(self, root: str, size: int = THUMB_SIZE, workers: int = 2, max_pending: int = 256):
+        self.root = root
+        self.size = size
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.generated = 0
+        self.failed = 0
+        self.dropped = 0
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbs')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def available(self, typ: str) -> bool:
+        if typ == 'image':
+            return Image is not None or self.ffmpeg is not None
+        return typ == 'video' and self.ffmpeg is not None
+
+    @staticmethod
+    def name_for(sha256: str) -> str:
+        return f"{sha256}.jpg"
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, self.name_for(sha256))
+
+    def submit(self, src: str, row: dict):
+        """Catalog listener: queue a thumbnail for a newly recorded file."""
+        sha256, typ = row.get('sha256'), row.get('type')
+        if not sha256 or not self.available(typ) or os.path.exists(self.path_for(sha256)):
+            return None
+        with self._lock:
+            if sha256 in self._pending:
+                return None
+            if not self._slots.acquire(blocking=False):
+                self.dropped += 1
+                return None
+            self._pending.add(sha256)
+        return self._pool.submit(self._run, src, sha256, typ)
+
+    def discard(self, sha256: str) -> None:
+        """Reclaim listener: delete the thumbnail of content no file holds any more."""
+        try:
+            os.remove(self.path_for(sha256))
+        except OSError:
+            pass
+
+    def _run(self, src, sha256, typ) -> None:
+        dest = self.path_for(sha256)
+        tmp = f"{dest}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            if typ == 'image' and Image is not None:
+                self._pil_thumb(src, tmp)
+            else:
+                self._ffmpeg_thumb(src, tmp, typ)
+            os.replace(tmp, dest)
+            self.generated += 1
+        except Exception as e:
+            self.failed += 1
+            print('Warning: thumbnail failed for', src, e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                self._pending.discard(sha256)
+                self._slots.release()
+
+    def _pil_thumb(self, src, dest) -> None:
+        with Image.open(src) as im:
+            im.draft('RGB', (self.size, self.size))  # JPEG: decode at reduced scale
+            im = ImageOps.exif_transpose(im).convert('RGB')
+            im.thumbnail((self.size, self.size))
+            im.save(dest, 'JPEG', quality=80, optimize=True)
+
+    def _ffmpeg_thumb(self, src, dest, typ) -> None:
+        # Poster frame 1 s in; clips shorter than that fall back to frame 0.
+        for seek in ((['-ss', '1'], []) if typ == 'video' else ([],)):
+            subprocess.run([self.ffmpeg, '-v', 'error', '-y', *seek, '-i', src, '-frames:v', '1',
+                            '-vf', f"scale='min({self.size},iw)':-2", '-f', 'mjpeg', dest],
+                           timeout=60, stdin=subprocess.DEVNULL, capture_output=True)
+            if os.path.exists(dest) and os.path.getsize(dest) > 0:
+                return
+        raise RuntimeError('ffmpeg produced no frame')
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        """Block until queued work finishes (tests, shutdown)."""
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            with self._lock:
+                if not self._pending:
+                    return True
+            time.sleep(0.02)
+        return False
@@ -0,0 +1,236 @@
+"""Resumable, chunked uploads.
+
+A client creates a session with the final name and total size, then
+appends the bytes with any number of `PATCH` requests, each carrying the
+offset it starts at. A dropped connection loses only the chunk in flight:
+the client asks for the current offset and continues from there.
+
+Chunks are written straight into a hidden `.part` file in the destination
+directory and fed to a running sha256 as they arrive, so finishing is a
+rename (no second copy, no re-read). Session metadata is kept as JSON in
+`state_dir`; after a restart the hash is rebuilt from the part file once.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+
+CHUNK_READ = 1 << 20
+
+
+def create_exclusive(dest_dir: str, filename: str):
+    """Open a new file under the first free name (`<name>_<n>.<ext>` on collision).
+
+    Names are claimed with O_EXCL, so concurrent writers never pick the
+    same one. Returns (binary file object, path).
+    """
+    base, ext = os.path.splitext(filename)
+    name, i = filename, 1
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        path = os.path.join(dest_dir, name)
+        try:
+            return os.fdopen(os.open(path, flags, 0o644), 'wb'), path
+        except FileExistsError:
+            name = f"{base}_{i}{ext}"
+            i += 1
+
+
+class UploadError(Exception):
+    """Raised with an API error code (and the HTTP status to use)."""
+
+    def __init__(self, code: str, status: int = 400, **extra):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+        self.extra = extra
+
+
+class UploadSession:
+    def __init__(self, sid, user, device_mac, filename, size, dest_dir, sha256=None, offset=0, created=None):
+        self.id = sid
+        self.user = user
+        self.device_mac = device_mac
+        self.filename = filename
+        self.size = size
+        self.dest_dir = dest_dir
+        self.sha256 = sha256
+        self.offset = offset
+        self.created = created or time.time()
+        self.lock = threading.Lock()
+        self._hasher = None
+
+    @property
+    def part_path(self) -> str:
+        return os.path.join(self.dest_dir, f".{self.id}.part")
+
+    def to_dict(self) -> dict:
+        return {'id': self.id, 'filename': self.filename, 'size': self.size, 'offset': self.offset,
+                'device_mac': self.device_mac, 'created': self.created}
+
+    def _state(self) -> dict:
+        return {'id': self.id, 'user': self.user, 'device_mac': self.device_mac, 'filename': self.filename,
+                'size': self.size, 'dest_dir': self.dest_dir, 'sha256': self.sha256, 'created': self.created}
+
+    def hasher(self):
+        if self._hasher is None:
+            # Resumed after a restart: rebuild the running hash from disk.
+            h = hashlib.sha256()
+            with open(self.part_path, 'rb') as f:
+                remaining = self.offset
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_READ, remaining))
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    remaining -= len(chunk)
+            self._hasher = h
+        return self._hasher
+
+
+class UploadManager:
+    """Open upload sessions, persisted under `state_dir`."""
+
+    def __init__(self, state_dir: str, ttl: float = 86400.0):
+        self.state_dir = state_dir
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _state_path(self, sid: str) -> str:
+        return os.path.join(self.state_dir, f"{sid}.json")
+
+    def create(self, user, dest_dir, filename, size, device_mac=None, sha256=None) -> UploadSession:
+        self.expire()
+        sess = UploadSession(secrets.token_hex(16), user, device_mac, filename, size, dest_dir,
+                             sha256=(sha256 or '').lower() or None)
+        sess._hasher = hashlib.sha256()
+        os.makedirs(dest_dir, exist_ok=True)
+        os.makedirs(self.state_dir, exist_ok=True)
+        open(sess.part_path, 'wb').close()
+        with open(self._state_path(sess.id), 'w') as f:
+            json.dump(sess._state(), f)
+        with self._lock:
+            self._sessions[sess.id] = sess
+        return sess
+
+    def get(self, sid: str, user) -> UploadSession | None:
+        if not sid.isalnum():
+            return None
+        with self._lock:
+            sess = self._sessions.get(sid)
+            if sess is None:
+                sess = self._load(sid)
+                if sess is not None:
+                    self._sessions[sid] = sess
+        if sess is None or sess.user != user:
+            return None
+        return sess
+
+    def _load(self, sid):
+        try:
+            with open(self._state_path(sid)) as f:
+                state = json.load(f)
+            offset = os.path.getsize(os.path.join(state['dest_dir'], f".{sid}.part"))
+        except (OSError, ValueError, KeyError):
+            return None
+        return UploadSession(state['id'], state['user'], state['device_mac'], state['filename'], state['size'],
+                             state['dest_dir'], sha256=state.get('sha256'), offset=offset, created=state.get('created'))
+
+    def append(self, sess: UploadSession, offset: int, stream, length: int | None = None) -> int:
+        """Write `stream` at `offset` (must equal the session offset); returns the new offset."""
+        if not sess.lock.acquire(blocking=False):
+            raise UploadError('upload_busy', 409, offset=sess.offset)
+        try:
+            if offset != sess.offset:
+                raise UploadError('offset_mismatch', 409, offset=sess.offset)
+            if length is not None and sess.offset + length > sess.size:
+                raise UploadError('exceeds_declared_size', 413, offset=sess.offset)
+            hasher = sess.hasher()
+            with open(sess.part_path, 'r+b') as f:
+                f.seek(sess.offset)
+                f.truncate()
+                while True:
+                    chunk = stream.read(CHUNK_READ)
+                    if not chunk:
+                        break
+                    if sess.offset + len(chunk) > sess.size:
+                        raise UploadError('exceeds_declared_size', 413, offset=sess.offset)
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    # Advance only past bytes that reached the file, so a
+                    # dropped connection leaves a consistent resume point.
+                    sess.offset += len(chunk)
+            return sess.offset
+        finally:
+            sess.lock.release()
+
+    def finish(self, sess: UploadSession) -> tuple[str, str]:
+        """Move the completed part file to its final name; returns (path, sha256).
+
+        The part file is hard-linked under the first free name, so an
+        existing file is never overwritten; `<name>_<n>.<ext>` on collision.
+        """
+        with sess.lock:
+            if sess.offset != sess.size:
+                raise UploadError('incomplete', 409, offset=sess.offset)
+            digest = sess.hasher().hexdigest()
+            if sess.sha256 and digest != sess.sha256:
+                raise UploadError('hash_mismatch', 422, sha256=digest)
+            base, ext = os.path.splitext(sess.filename)
+            name, i = sess.filename, 1
+            while True:
+                final_path = os.path.join(sess.dest_dir, name)
+                try:
+                    os.link(sess.part_path, final_path)
+                    break
+                except FileExistsError:
+                    name = f"{base}_{i}{ext}"
+                    i += 1
+            os.unlink(sess.part_path)
+            self._forget(sess)
+        return final_path, digest
+
+    def abort(self, sess: UploadSession) -> None:
+        with sess.lock:
+            try:
+                os.unlink(sess.part_path)
+            except OSError:
+                pass
+            self._forget(sess)
+
+    def _forget(self, sess) -> None:
+        with self._lock:
+            self._sessions.pop(sess.id, None)
+        try:
+            os.unlink(self._state_path(sess.id))
+        except OSError:
+            pass
+
+    def expire(self, now: float | None = None) -> int:
+        """Drop sessions idle for longer than `ttl`, including ones from before a restart."""
+        now = time.time() if now is None else now
+        expired = 0
+        try:
+            names = os.listdir(self.state_dir)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            sid = name[:-5]
+            with self._lock:
+                sess = self._sessions.get(sid) or self._load(sid)
+            if sess is None:
+                continue
+            try:
+                idle_since = os.path.getmtime(sess.part_path)  # touched by every append
+            except OSError:
+                idle_since = sess.created
+            if now - idle_since > self.ttl:
+                self.abort(sess)
+                expired += 1
+        return expired
@@ -0,0 +1,140 @@
+"""Display-sized copies of uploaded images for the kiosk playlist.
+
+Phone photos are often 12+ MP; the kiosk only ever shows them at its
+screen size. After an image is recorded in the catalog, `ImageOptimizer`
+renders an EXIF-upright, downscaled progressive JPEG (or WebP) in a
+process pool, so decoding big files never competes with request threads
+for the GIL. The original is kept; the catalog row's `variant` points at
+the copy and the playlist serves that. Needs Pillow; without it this is a
+no-op and playlists keep serving originals.
+"""
+
+import concurrent.futures
+import glob
+import multiprocessing
+import os
+import threading
+
+try:
+    import PIL  # noqa: F401  (workers import the submodules they need)
+    _HAS_PIL = True
+except ImportError:  # optional dependency
+    _HAS_PIL = False
+
+DEFAULT_TARGET = (1920, 1080)
+_SKIP_EXTS = ('.gif',)  # may be animated; served as uploaded
+_EXIF_ORIENTATION = 0x0112
+
+
+def _render(src: str, dest: str, width: int, height: int, fmt: str, quality: int):
+    """Worker: write the variant; returns its size, or None if not worth it."""
+    from PIL import Image, ImageOps
+    with Image.open(src) as im:
+        orientation = im.getexif().get(_EXIF_ORIENTATION, 1)
+        if orientation == 1 and im.width <= width and im.height <= height:
+            return None
+        edge = max(width, height)
+        im.draft('RGB', (edge, edge))  # JPEG: let libjpeg decode at a reduced scale
+        im = ImageOps.exif_transpose(im)
+        if im.mode in ('RGBA', 'LA', 'P'):
+            im = im.convert('RGBA')
+            flat = Image.new('RGB', im.size, (0, 0, 0))  # kiosk background
+            flat.paste(im, mask=im.getchannel('A'))
+            im = flat
+        else:
+            im = im.convert('RGB')
+        im.thumbnail((width, height), Image.LANCZOS)
+        tmp = f"{dest}.{os.getpid()}.tmp"
+        if fmt == 'webp':
+            im.save(tmp, 'WEBP', quality=quality, method=4)
+        else:
+            im.save(tmp, 'JPEG', quality=quality, optimize=True, progressive=True)
+        os.replace(tmp, dest)
+        return im.size
+
+
+class ImageOptimizer:
+    """Catalog listener producing `<root>/<sha256>-<w>x<h>.<ext>` variants.
+
+    `target_for(owner, device_dir)` gives the (width, height) to fit into;
+    `on_variant(row, name)` is called once a variant exists.
+    """
+
+    def __init__(self, root: str, target_for=None, on_variant=None, workers: int = 2,
+                 fmt: str = 'jpeg', quality: int = 82):
+        self.root = root
+        self.target_for = target_for or (lambda owner, device: DEFAULT_TARGET)
+        self.on_variant = on_variant
+        self.workers = workers
+        self.fmt = 'webp' if fmt == 'webp' else 'jpeg'
+        self.quality = quality
+        self.rendered = 0
+        self.failed = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return _HAS_PIL
+
+    def name_for(self, sha256: str, width: int, height: int) -> str:
+        ext = 'webp' if self.fmt == 'webp' else 'jpg'
+        return f"{sha256}-{width}x{height}.{ext}"
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawned workers re-run __main__ first; see app.main
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def submit(self, src: str, row: dict):
+        if not self.available or row.get('type') != 'image' or not row.get('sha256') \
+                or src.lower().endswith(_SKIP_EXTS):
+            return None
+        width, height = self.target_for(row.get('owner'), row.get('device_mac', ''))
+        if row.get('width') and row.get('height') and row.get('width') <= width and row.get('height') <= height \
+                and not src.lower().endswith(('.jpg', '.jpeg')):
+            return None  # already small and has no EXIF orientation to apply
+        name = self.name_for(row['sha256'], width, height)
+        dest = os.path.join(self.root, name)
+        if os.path.exists(dest):
+            self._finish(row, name)
+            return None
+        os.makedirs(self.root, exist_ok=True)
+        fut = self._executor().submit(_render, src, dest, width, height, self.fmt, self.quality)
+        fut.add_done_callback(lambda f: self._done(f, src, row, name))
+        return fut
+
+    def discard(self, sha256: str) -> None:
+        """Reclaim listener: delete every size of variant rendered from `sha256`."""
+        for path in glob.glob(os.path.join(self.root, f"{sha256}-*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _done(self, fut, src, row, name) -> None:
+        try:
+            size = fut.result()
+        except Exception as e:
+            self.failed += 1
+            print('Warning: image variant failed for', src, e)
+            return
+        if size is not None:
+            self.rendered += 1
+            self._finish(row, name)
+
+    def _finish(self, row, name) -> None:
+        if self.on_variant is not None:
+            try:
+                self.on_variant(row, name)
+            except Exception as e:
+                print('Warning: recording image variant failed:', e)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
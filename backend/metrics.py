@@ -0,0 +1,147 @@
+"""Minimal Prometheus text-format metrics.
+
+Counters and histograms write into a per-thread shard (a plain dict owned
+by the calling thread), so the hot path never takes a lock. A scrape
+merges all shards. Shards of finished threads (Werkzeug serves each
+request on its own thread) are folded into a retired total and dropped.
+"""
+
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_FOLD_AT = 64
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Sharded:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                if len(self._shards) >= _FOLD_AT:
+                    self._fold_dead()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _fold_dead(self) -> None:
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for key, val in list(shard.items()):
+                    self._merge(self._retired, key, val)
+        self._shards = live
+
+    def _collect(self) -> dict:
+        with self._lock:
+            self._fold_dead()
+            total = {}
+            for key, val in self._retired.items():
+                self._merge(total, key, val)
+            for _, shard in self._shards:
+                for key, val in list(shard.items()):
+                    self._merge(total, key, val)
+        return total
+
+
+class Counter(_Sharded):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, labels=()) -> None:
+        shard = self._shard()
+        key = tuple(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    @staticmethod
+    def _merge(into, key, val):
+        into[key] = into.get(key, 0.0) + val
+
+    def render(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, key)} {val}' for key, val in sorted(self._collect().items())]
+
+
+class Histogram(_Sharded):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels=()) -> None:
+        shard = self._shard()
+        key = tuple(labels)
+        row = shard.get(key)
+        if row is None:
+            # per-bucket counts, then +Inf count, then sum
+            row = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    @staticmethod
+    def _merge(into, key, val):
+        cur = into.get(key)
+        into[key] = list(val) if cur is None else [a + b for a, b in zip(cur, val)]
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, row in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), row[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, [le])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {row[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        out = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            out.append(f'# HELP {name} {metric.help}')
+            out.append(f'# TYPE {name} {metric.kind}')
+            out.extend(metric.render())
+        return '\n'.join(out) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,120 @@
+"""PIR motion sources and time-based debouncing.
+
+A source pushes raw pin levels into a `MotionDebouncer`, which commits a
+new motion state once the level has been stable for `settle_sec`:
+
+- `GPIOEdgeSource` registers an edge callback (`GPIO.add_event_detect`),
+  so the thread sleeps until the pin actually changes.
+- `PollingSource` samples the pin on an interval; used when edge
+  detection is unavailable.
+- `MockEventSource` lets tests (or a simulator) emit levels directly.
+"""
+
+import threading
+import time
+
+
+class MotionDebouncer:
+    """Commit `on_change(is_motion, raw, ts)` after a level settles."""
+
+    def __init__(self, on_change, settle_sec: float = 0.2, active_value: int = 1):
+        self.on_change = on_change
+        self.settle_sec = settle_sec
+        self.active_value = active_value
+        self._cond = threading.Condition()
+        self._raw = None
+        self._edge_at = None
+        self._committed = None
+        self._stopped = False
+
+    def feed(self, raw) -> None:
+        """Record a raw level; safe to call from GPIO callback threads."""
+        with self._cond:
+            if raw == self._raw:
+                return
+            self._raw = raw
+            self._edge_at = time.monotonic()
+            self._cond.notify_all()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def run(self) -> None:
+        """Debounce loop; blocks while idle (no wakeups between edges)."""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or (self._edge_at is not None and self._raw != self._committed))
+                if self._stopped:
+                    return
+                # Restart the settle window on every new edge.
+                while not self._stopped:
+                    remaining = self._edge_at + self.settle_sec - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopped:
+                    return
+                raw = self._raw
+                if raw == self._committed:
+                    continue  # glitch shorter than the settle window
+                self._committed = raw
+            self.on_change(raw == self.active_value, raw, time.time())
+
+
+class GPIOEdgeSource:
+    """Edge-triggered source; raises RuntimeError if the pin can't do edges."""
+
+    def __init__(self, gpio, pin: int, bouncetime_ms: int = 50):
+        self.gpio = gpio
+        self.pin = pin
+        self.bouncetime_ms = bouncetime_ms
+
+    def start(self, debouncer: MotionDebouncer) -> None:
+        debouncer.feed(self.gpio.input(self.pin))
+        self.gpio.add_event_detect(self.pin, self.gpio.BOTH,
+                                   callback=lambda ch: debouncer.feed(self.gpio.input(ch)),
+                                   bouncetime=self.bouncetime_ms)
+
+    def stop(self) -> None:
+        try:
+            self.gpio.remove_event_detect(self.pin)
+        except Exception:
+            pass
+
+
+class PollingSource:
+    """Fallback: read the pin every `interval` seconds on a daemon thread."""
+
+    def __init__(self, read, interval: float = 0.5):
+        self.read = read
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def start(self, debouncer: MotionDebouncer) -> None:
+        def loop():
+            while not self._stop.is_set():
+                debouncer.feed(self.read())
+                self._stop.wait(self.interval)
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class MockEventSource:
+    """Test source: call `emit(raw)` to simulate a pin edge."""
+
+    def __init__(self):
+        self._debouncer = None
+
+    def start(self, debouncer: MotionDebouncer) -> None:
+        self._debouncer = debouncer
+
+    def emit(self, raw) -> None:
+        if self._debouncer is not None:
+            self._debouncer.feed(raw)
+
+    def stop(self) -> None:
+        self._debouncer = None
@@ -0,0 +1,148 @@
+"""On-demand sampling profiler for live requests.
+
+When enabled, a fraction of requests (or every request to one route) is
+profiled: a single sampler thread periodically reads the stacks of the
+threads serving those requests via `sys._current_frames()`, so profiled
+code runs unmodified. Each finished request becomes a record of collapsed
+stacks (`a;b;c count`, the input format of flamegraph.pl / speedscope)
+kept in a bounded in-memory ring.
+"""
+
+import collections
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+MAX_DEPTH = 64
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < MAX_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+class _Session:
+    __slots__ = ('id', 'ident', 'method', 'route', 'path', 'started', 'duration', 'stacks', 'samples')
+
+    def __init__(self, sid, ident, method, route, path):
+        self.id = sid
+        self.ident = ident
+        self.method = method
+        self.route = route
+        self.path = path
+        self.started = time.time()
+        self.duration = None
+        self.stacks = collections.Counter()
+        self.samples = 0
+
+    def summary(self) -> dict:
+        return {'id': self.id, 'method': self.method, 'route': self.route, 'path': self.path,
+                'started': self.started, 'duration_ms': round(self.duration * 1000, 2) if self.duration else None,
+                'samples': self.samples}
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Request-scoped sampling with an admin-controlled switch."""
+
+    def __init__(self, capacity: int = 50):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.route = None
+        self.interval = 0.005
+        self._ids = itertools.count(1)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._ring = collections.deque(maxlen=capacity)
+
+    def configure(self, enabled=None, sample_rate=None, route=None, interval_ms=None) -> dict:
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(float(sample_rate), 1.0))
+        if route is not None:
+            self.route = route or None
+        if interval_ms is not None:
+            self.interval = max(1.0, float(interval_ms)) / 1000.0
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        return self.config()
+
+    def config(self) -> dict:
+        return {'enabled': self.enabled, 'sample_rate': self.sample_rate, 'route': self.route,
+                'interval_ms': self.interval * 1000, 'stored': len(self._ring), 'capacity': self._ring.maxlen}
+
+    def should_profile(self, route) -> bool:
+        if not self.enabled:
+            return False
+        if self.route is not None:
+            return route == self.route
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, method: str, route, path: str) -> _Session:
+        sess = _Session(next(self._ids), threading.get_ident(), method, route, path)
+        with self._lock:
+            self._active[sess.ident] = sess
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return sess
+
+    def stop(self, sess: _Session) -> None:
+        sess.duration = time.time() - sess.started
+        with self._lock:
+            self._active.pop(sess.ident, None)
+            self._ring.append(sess)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            with self._lock:
+                active = list(self._active.values())
+                if not active:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for sess in active:
+                frame = frames.get(sess.ident)
+                if frame is not None:
+                    sess.stacks[_collapse(frame)] += 1
+                    sess.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+    def _stored(self) -> list[_Session]:
+        # request threads append concurrently; iterating the deque itself could raise
+        with self._lock:
+            return list(self._ring)
+
+    def list(self) -> list[dict]:
+        return [s.summary() for s in reversed(self._stored())]
+
+    def get(self, sid: int):
+        for sess in self._stored():
+            if sess.id == sid:
+                return sess
+        return None
+
+    def merged(self, route=None) -> str:
+        """All stored profiles (optionally one route) as one collapsed file."""
+        total = collections.Counter()
+        for sess in self._stored():
+            if route is None or sess.route == route:
+                total.update(dict(sess.stacks))  # copied in one step; the sampler may still be adding
+        return ''.join(f"{stack} {count}\n" for stack, count in total.most_common())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ring.clear()
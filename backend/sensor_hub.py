@@ -0,0 +1,270 @@
+"""Single owner of live sensor state.
+
+Writers (sensor threads, mock endpoints) go through `SensorHub`, which
+builds a new immutable `SensorSnapshot` and swaps it in with one reference
+assignment. Readers call `snapshot()` and never take a lock, so every
+`/status` response comes from one consistent record.
+"""
+
+import bisect
+import os
+import threading
+from array import array
+
+
+def _fmt_temp(value):
+    return f"{value:.1f}°C" if value is not None else "--"
+
+
+def _fmt_hum(value):
+    return f"{value:.1f}%" if value is not None else "--"
+
+
+class SensorSnapshot:
+    __slots__ = (
+        'version',
+        'temp_c',
+        'hum_pct',
+        'motion_active',
+        'last_dht_time',
+        'last_dht_success',
+        'last_motion_raw',
+        'last_motion_change',
+    )
+
+    def __init__(self, version=0, temp_c=None, hum_pct=None, motion_active=False,
+                 last_dht_time=None, last_dht_success=False, last_motion_raw=None,
+                 last_motion_change=None):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'temp_c', temp_c)
+        object.__setattr__(self, 'hum_pct', hum_pct)
+        object.__setattr__(self, 'motion_active', motion_active)
+        object.__setattr__(self, 'last_dht_time', last_dht_time)
+        object.__setattr__(self, 'last_dht_success', last_dht_success)
+        object.__setattr__(self, 'last_motion_raw', last_motion_raw)
+        object.__setattr__(self, 'last_motion_change', last_motion_change)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SensorSnapshot is immutable')
+
+    def replace(self, **changes) -> 'SensorSnapshot':
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return SensorSnapshot(**fields)
+
+    @property
+    def temp(self) -> str:
+        return _fmt_temp(self.temp_c)
+
+    @property
+    def hum(self) -> str:
+        return _fmt_hum(self.hum_pct)
+
+    @property
+    def motion_status(self) -> str:
+        return "Motion detected" if self.motion_active else "No motion"
+
+    def to_dict(self) -> dict:
+        """The `/status` payload (without `version`)."""
+        return {
+            'temp': self.temp,
+            'hum': self.hum,
+            'temp_c': self.temp_c,
+            'hum_pct': self.hum_pct,
+            'motion_status': self.motion_status,
+            'motion_active': self.motion_active,
+            'last_dht_time': self.last_dht_time,
+            'last_dht_success': self.last_dht_success,
+            'last_motion_raw': self.last_motion_raw,
+            'last_motion_change': self.last_motion_change,
+        }
+
+    def _state(self):
+        return tuple(getattr(self, name) for name in self.__slots__[1:])
+
+
+class _SeriesRing:
+    """Fixed-size ring of (timestamp, value) pairs kept in timestamp order.
+
+    Samples usually arrive in order, but a DHT reading is stamped when the
+    worker finished it and a motion edge when the GPIO callback fired, so
+    one can land slightly behind the other. A late sample is shifted into
+    place (only past the few newer ones), which keeps `bisect` valid.
+    Not locked; `SensorHistory` serialises access.
+    """
+
+    def __init__(self, capacity: int, typecode: str):
+        self.capacity = capacity
+        self.ts = array('d', [0.0]) * capacity
+        self.values = array(typecode, [0]) * capacity
+        self.head = 0
+        self.count = 0
+
+    def append(self, ts: float, value) -> None:
+        cap = self.capacity
+        i = self.head
+        # When full, the slot at `head` holds the oldest sample, which this write drops.
+        movable = self.count if self.count < cap else cap - 1
+        while movable and self.ts[(i - 1) % cap] > ts:
+            j = (i - 1) % cap
+            self.ts[i], self.values[i] = self.ts[j], self.values[j]
+            i = j
+            movable -= 1
+        self.ts[i] = ts
+        self.values[i] = value
+        self.head = (self.head + 1) % cap
+        self.count = min(self.count + 1, cap)
+
+    def ordered(self):
+        """Copy (ts, values) out oldest-first as two slices."""
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return self.ts[start:start + self.count], self.values[start:start + self.count]
+        return self.ts[start:] + self.ts[:self.head], self.values[start:] + self.values[:self.head]
+
+
+def _bucket_slices(ts, start: float, end: float, step: float, since: float | None = None):
+    """Yield (bucket index, lo, hi) for each non-empty bucket of sorted `ts` in [start, end).
+
+    Buckets are aligned on `start`; samples before `since` are skipped.
+    """
+    lo = bisect.bisect_left(ts, start if since is None else max(start, since))
+    hi = bisect.bisect_left(ts, end, lo)
+    while lo < hi:
+        key = int((ts[lo] - start) // step)
+        nxt = max(bisect.bisect_left(ts, start + (key + 1) * step, lo, hi), lo + 1)
+        yield key, lo, nxt
+        lo = nxt
+
+
+class SensorHistory:
+    """Fixed-size rings of temp, hum and motion samples.
+
+    Each series has its own preallocated `array` columns, so memory is
+    constant no matter how long the process runs, a missing reading is just
+    absent from its series, and bucket statistics are `min`/`max`/`sum`
+    over array slices instead of a Python loop per sample.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._temp = _SeriesRing(self.capacity, 'd')
+        self._hum = _SeriesRing(self.capacity, 'd')
+        self._motion = _SeriesRing(self.capacity, 'b')  # one entry per sample of any kind
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._motion.count
+
+    def oldest(self):
+        """Timestamp of the oldest retained sample, or None when empty."""
+        with self._lock:
+            ring = self._motion
+            if not ring.count:
+                return None
+            return ring.ts[(ring.head - ring.count) % ring.capacity]
+
+    def append(self, ts: float, temp, hum, motion: bool) -> None:
+        with self._lock:
+            if temp is not None:
+                self._temp.append(ts, temp)
+            if hum is not None:
+                self._hum.append(ts, hum)
+            self._motion.append(ts, 1 if motion else 0)
+
+    def downsample(self, start: float, end: float, step: float) -> list[dict]:
+        """Aggregate samples in [start, end) into `step`-second buckets.
+
+        Each non-empty bucket reports min/avg/max for temp and hum and the
+        motion duty cycle (`avg`) plus whether any motion was seen (`max`).
+        """
+        with self._lock:
+            temp, hum, motion = self._temp.ordered(), self._hum.ordered(), self._motion.ordered()
+        buckets = {}
+        ts, values = motion
+        for key, lo, hi in _bucket_slices(ts, start, end, step):
+            moving = sum(values[lo:hi])
+            buckets[key] = {'t': start + key * step, 'n': hi - lo, 'temp': None, 'hum': None,
+                            'motion': {'avg': moving / (hi - lo), 'max': 1 if moving else 0}}
+        # temp/hum rings hold fewer samples per second, so they may reach back further; cut them
+        # at the oldest sample in the motion ring so every bucket describes the same span
+        oldest = ts[0] if ts else None
+        for name, (ts, values) in (('temp', temp), ('hum', hum)):
+            for key, lo, hi in _bucket_slices(ts, start, end, step, oldest):
+                if key in buckets:
+                    chunk = values[lo:hi]
+                    buckets[key][name] = {'min': min(chunk), 'avg': sum(chunk) / len(chunk), 'max': max(chunk)}
+        return [buckets[key] for key in sorted(buckets)]
+
+
+class SensorHub:
+    """Copy-on-write sensor state with change notification.
+
+    `version` increases by one for every distinct state; `epoch` is random
+    per process so version-derived ETags never collide across restarts.
+    Readings are also appended to `history` and handed to every listener
+    registered with `add_listener` (e.g. durable storage).
+    """
+
+    def __init__(self, history_size: int = 17280):
+        self._cond = threading.Condition()
+        self._snap = SensorSnapshot()
+        self._listeners = []
+        self.epoch = os.urandom(4).hex()
+        self.history = SensorHistory(history_size)
+
+    def add_listener(self, fn) -> None:
+        """Register `fn(ts, temp, hum, motion)`; it must not block."""
+        self._listeners.append(fn)
+
+    def _record_sample(self, ts, temp, hum, motion) -> None:
+        self.history.append(ts, temp, hum, motion)
+        for fn in self._listeners:
+            try:
+                fn(ts, temp, hum, motion)
+            except Exception:
+                pass
+
+    def snapshot(self) -> SensorSnapshot:
+        return self._snap
+
+    def update(self, **changes) -> SensorSnapshot:
+        with self._cond:
+            cur = self._snap
+            new = cur.replace(**changes)
+            if new._state() == cur._state():
+                return cur
+            new = new.replace(version=cur.version + 1)
+            self._snap = new
+            self._cond.notify_all()
+            return new
+
+    def wait_for_change(self, since: int, timeout: float) -> SensorSnapshot:
+        """Block until the version differs from `since` or `timeout` expires."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._snap.version != since, timeout=timeout)
+            return self._snap
+
+    # Sensor inputs
+
+    def record_dht(self, temperature, humidity, ts: float) -> SensorSnapshot:
+        if temperature is None or humidity is None:
+            snap = self.update(last_dht_success=False)
+            self._record_sample(ts, None, None, snap.motion_active)
+            return snap
+        snap = self.update(temp_c=float(temperature), hum_pct=float(humidity),
+                           last_dht_time=ts, last_dht_success=True)
+        self._record_sample(ts, snap.temp_c, snap.hum_pct, snap.motion_active)
+        return snap
+
+    def record_motion(self, active: bool, ts: float) -> SensorSnapshot:
+        with self._cond:
+            if self._snap.motion_active == active:
+                return self._snap
+            snap = self.update(motion_active=active, last_motion_change=ts)
+            # Edge sample: motion only, so temp/hum stats stay per-reading.
+            self._record_sample(ts, None, None, active)
+            return snap
+
+    def record_motion_raw(self, raw) -> SensorSnapshot:
+        return self.update(last_motion_raw=raw)
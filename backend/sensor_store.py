@@ -0,0 +1,204 @@
+"""Durable sensor history on the app's SQLAlchemy engine.
+
+Samples from `SensorHub` are queued in memory and written in batches by a
+background writer (`run`) so the request path never waits on a commit.
+Each batch also folds into 1-minute and 1-hour rollup rows, which is what
+long-range history queries read. A retention pass trims old rows.
+"""
+
+import math
+import queue
+import threading
+import time
+
+from sqlalchemy import Table, Column, Integer, Float, Index, text
+
+RAW_RETENTION_SEC = 7 * 86400
+ROLLUP_1M_RETENTION_SEC = 30 * 86400
+ROLLUP_1H_RETENTION_SEC = 365 * 86400
+
+# Aggregate slots kept per rollup bucket.
+_AGG_COLS = ('n', 'temp_n', 'temp_min', 'temp_sum', 'temp_max',
+             'hum_n', 'hum_min', 'hum_sum', 'hum_max', 'motion_sum')
+
+
+def _rollup_table(name, metadata):
+    return Table(
+        name, metadata,
+        Column('bucket', Integer, primary_key=True, autoincrement=False),
+        Column('n', Integer, nullable=False),
+        Column('temp_n', Integer, nullable=False),
+        Column('temp_min', Float, nullable=True),
+        Column('temp_sum', Float, nullable=False),
+        Column('temp_max', Float, nullable=True),
+        Column('hum_n', Integer, nullable=False),
+        Column('hum_min', Float, nullable=True),
+        Column('hum_sum', Float, nullable=False),
+        Column('hum_max', Float, nullable=True),
+        Column('motion_sum', Integer, nullable=False),
+    )
+
+
+def _new_agg():
+    return {'n': 0, 'temp_n': 0, 'temp_min': None, 'temp_sum': 0.0, 'temp_max': None,
+            'hum_n': 0, 'hum_min': None, 'hum_sum': 0.0, 'hum_max': None, 'motion_sum': 0}
+
+
+def _fold(agg, other):
+    """Merge aggregate `other` into `agg` in place."""
+    agg['n'] += other['n']
+    agg['motion_sum'] += other['motion_sum']
+    for key in ('temp', 'hum'):
+        agg[f'{key}_n'] += other[f'{key}_n']
+        agg[f'{key}_sum'] += other[f'{key}_sum']
+        for col, pick in ((f'{key}_min', min), (f'{key}_max', max)):
+            if other[col] is not None:
+                agg[col] = other[col] if agg[col] is None else pick(agg[col], other[col])
+
+
+def _sample_agg(temp, hum, motion):
+    agg = _new_agg()
+    agg['n'] = 1
+    agg['motion_sum'] = 1 if motion else 0
+    for key, val in (('temp', temp), ('hum', hum)):
+        if val is not None and not math.isnan(val):
+            agg[f'{key}_n'] = 1
+            agg[f'{key}_min'] = agg[f'{key}_max'] = agg[f'{key}_sum'] = float(val)
+    return agg
+
+
+def _agg_to_bucket(t, agg):
+    def stats(key):
+        if not agg[f'{key}_n']:
+            return None
+        return {'min': agg[f'{key}_min'], 'avg': agg[f'{key}_sum'] / agg[f'{key}_n'], 'max': agg[f'{key}_max']}
+    return {
+        't': t,
+        'n': agg['n'],
+        'temp': stats('temp'),
+        'hum': stats('hum'),
+        'motion': {'avg': agg['motion_sum'] / agg['n'], 'max': 1 if agg['motion_sum'] else 0},
+    }
+
+
+class SensorStore:
+    """Write-behind persistence for (ts, temp, hum, motion) samples."""
+
+    def __init__(self, engine, metadata, batch_size: int = 500, flush_interval: float = 30.0,
+                 retention_interval: float = 3600.0, max_queue: int = 20000):
+        self._engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_interval = retention_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._last_retention = 0.0
+        self.dropped = 0
+        self.samples_table = Table(
+            'sensor_samples', metadata,
+            Column('id', Integer, primary_key=True, autoincrement=True),
+            Column('ts', Float, nullable=False),
+            Column('temp', Float, nullable=True),
+            Column('hum', Float, nullable=True),
+            Column('motion', Integer, nullable=False),
+            Index('ix_sensor_samples_ts', 'ts'),
+        )
+        self.rollups = {
+            60: _rollup_table('sensor_rollup_1m', metadata),
+            3600: _rollup_table('sensor_rollup_1h', metadata),
+        }
+
+    def enqueue(self, ts: float, temp, hum, motion: bool) -> None:
+        """SensorHub listener: never blocks; drops the sample if the queue is full."""
+        try:
+            self._queue.put_nowait((ts, temp, hum, 1 if motion else 0))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self) -> None:
+        """Writer thread body."""
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if time.time() - self._last_retention >= self.retention_interval:
+                    self.apply_retention()
+            except Exception as e:
+                print('Warning: sensor store flush failed:', e)
+
+    def flush(self) -> int:
+        """Write all queued samples; returns how many were written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = []
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    pass
+                if not batch:
+                    return written
+                self._write_batch(batch)
+                written += len(batch)
+
+    def _write_batch(self, batch) -> None:
+        rows = [{'ts': ts, 'temp': None if temp is None or math.isnan(temp) else temp,
+                 'hum': None if hum is None or math.isnan(hum) else hum, 'm': motion}
+                for ts, temp, hum, motion in batch]
+        with self._engine.begin() as conn:
+            conn.execute(text('INSERT INTO sensor_samples (ts, temp, hum, motion) VALUES (:ts,:temp,:hum,:m)'), rows)
+            for width, table in self.rollups.items():
+                buckets = {}
+                for r in rows:
+                    key = int(r['ts'] // width) * width
+                    agg = buckets.setdefault(key, _new_agg())
+                    _fold(agg, _sample_agg(r['temp'], r['hum'], r['m']))
+                self._merge_rollup(conn, table.name, buckets)
+
+    def _merge_rollup(self, conn, name, buckets) -> None:
+        cols = ', '.join(_AGG_COLS)
+        existing = conn.execute(
+            text(f'SELECT bucket, {cols} FROM {name} WHERE bucket >= :lo AND bucket <= :hi'),
+            {'lo': min(buckets), 'hi': max(buckets)},
+        ).fetchall()
+        have = {r[0]: dict(zip(_AGG_COLS, r[1:])) for r in existing}
+        inserts, updates = [], []
+        for key, agg in buckets.items():
+            if key in have:
+                merged = have[key]
+                _fold(merged, agg)
+                updates.append(dict(merged, bucket=key))
+            else:
+                inserts.append(dict(agg, bucket=key))
+        if inserts:
+            conn.execute(text(f'INSERT INTO {name} (bucket, {cols}) VALUES (:bucket, '
+                              + ', '.join(f':{c}' for c in _AGG_COLS) + ')'), inserts)
+        if updates:
+            conn.execute(text(f'UPDATE {name} SET ' + ', '.join(f'{c}=:{c}' for c in _AGG_COLS)
+                              + ' WHERE bucket=:bucket'), updates)
+
+    def apply_retention(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self._engine.begin() as conn:
+            conn.execute(text('DELETE FROM sensor_samples WHERE ts < :cut'), {'cut': now - RAW_RETENTION_SEC})
+            conn.execute(text('DELETE FROM sensor_rollup_1m WHERE bucket < :cut'), {'cut': now - ROLLUP_1M_RETENTION_SEC})
+            conn.execute(text('DELETE FROM sensor_rollup_1h WHERE bucket < :cut'), {'cut': now - ROLLUP_1H_RETENTION_SEC})
+        self._last_retention = now
+
+    def downsample(self, start: float, end: float, step: float) -> list[dict]:
+        """Same bucket shape as `SensorHistory.downsample`, read from rollups."""
+        width = 3600 if step >= 3600 else 60
+        name = self.rollups[width].name
+        cols = ', '.join(_AGG_COLS)
+        with self._engine.connect() as conn:
+            rows = conn.execute(
+                text(f'SELECT bucket, {cols} FROM {name} WHERE bucket >= :lo AND bucket < :hi ORDER BY bucket'),
+                {'lo': int(start // width) * width, 'hi': end},
+            ).fetchall()
+        buckets = {}
+        for r in rows:
+            key = int((max(r[0], start) - start) // step)
+            agg = buckets.setdefault(key, _new_agg())
+            _fold(agg, dict(zip(_AGG_COLS, r[1:])))
+        return [_agg_to_bucket(start + key * step, buckets[key]) for key in sorted(buckets)]
@@ -0,0 +1,584 @@
+import concurrent.futures
+import io
+import os
+import hashlib
+import struct
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+THIS_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = os.path.abspath(os.path.join(THIS_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ['DB_URI'] = 'sqlite:///:memory:'
+
+from sqlalchemy import text  # noqa: E402
+from app import (app, init_users_db, media_catalog, media_thumbs, media_variants, media_uploads,  # noqa: E402
+                 media_fetches, media_admission, _db_engine)
+import media_variants as media_variants_mod  # noqa: E402
+from media_uploads import UploadManager  # noqa: E402
+from mp4_faststart import faststart, _box, child_boxes, _shift_offsets  # noqa: E402
+from media_catalog import MediaCatalog  # noqa: E402
+from media_probe import image_size, media_duration_ms  # noqa: E402
+
+
+@pytest.fixture()
+def client(tmp_path, monkeypatch):
+    app.config['TESTING'] = True
+    monkeypatch.setattr(media_catalog, 'root', str(tmp_path / 'media'))
+    monkeypatch.setattr(media_uploads, 'state_dir', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(media_catalog.blobs, 'root', str(tmp_path / 'blobs'))
+    media_catalog.clear()
+    with app.test_client() as c:
+        with app.app_context():
+            init_users_db()
+        with _db_engine.begin() as conn:
+            conn.execute(text('DELETE FROM media_items'))
+            conn.execute(text('DELETE FROM media_usage'))
+        c.post('/api/auth/login', json={'username': 'dbadmin', 'password': 'dbadmin'})
+        yield c
+    media_catalog.clear()
+
+
+def _upload(client, name, data=b'x', device_mac=None):
+    form = {'file': (io.BytesIO(data), name), 'target': 'media'}
+    if device_mac:
+        form['device_mac'] = device_mac
+    return client.post('/api/media/upload', data=form, content_type='multipart/form-data')
+
+
+def test_rescan_backfills_and_listing_is_cached(client, tmp_path):
+    cat = MediaCatalog(_db_engine, str(tmp_path / 'lib'), recheck_sec=3600)
+    os.makedirs(cat.dir_for('u', 'AA:BB'))
+    (tmp_path / 'lib' / 'u' / 'b.jpg').write_bytes(b'1')
+    (tmp_path / 'lib' / 'u' / 'a.mp4').write_bytes(b'22')
+    (tmp_path / 'lib' / 'u' / 'notes.txt').write_bytes(b'')
+    (tmp_path / 'lib' / 'u' / 'AABB' / 'c.gif').write_bytes(b'GIF89a' + struct.pack('<HH', 4, 3))
+    assert cat.rescan() == {'added': 3, 'updated': 0, 'removed': 0, 'total': 3}
+    assert cat.playlist('u') == [{'type': 'video', 'src': '/static/media/u/a.mp4', 'duration_ms': None},
+                                 {'type': 'image', 'src': '/static/media/u/b.jpg', 'duration_ms': 6000}]
+    gif = cat.files('u', 'AA:BB')[0]
+    assert (gif['name'], gif['width'], gif['height'], len(gif['sha256'])) == ('c.gif', 4, 3, 64)
+    loads = cat.loads
+    cat.playlist('u')
+    assert cat.loads == loads  # served from memory
+
+    os.remove(tmp_path / 'lib' / 'u' / 'b.jpg')
+    assert cat.rescan('u')['removed'] == 1
+    assert [f['name'] for f in cat.files('u')] == ['a.mp4']
+    assert cat.rescan()['added'] == 0
+
+
+def test_image_size_headers(tmp_path):
+    png = tmp_path / 'x.png'
+    png.write_bytes(b'\x89PNG\r\n\x1a\n' + struct.pack('>I4sII', 13, b'IHDR', 640, 480) + b'\0' * 8)
+    jpg = tmp_path / 'x.jpg'
+    jpg.write_bytes(b'\xff\xd8\xff\xe0' + struct.pack('>H', 4) + b'JF' + b'\xff\xc0' + struct.pack('>HBHH', 11, 8, 720, 1280) + b'\0' * 6)
+    assert image_size(str(png)) == (640, 480)
+    assert image_size(str(jpg)) == (1280, 720)
+    assert image_size(str(tmp_path / 'missing.png')) == (None, None)
+
+
+def test_upload_list_playlist_delete_roundtrip(client):
+    assert _upload(client, 'clip.mp4', b'video').status_code == 201
+    assert _upload(client, 'pic.jpg', b'image', device_mac='AA:BB:CC:DD:EE:FF').status_code == 201
+
+    files = client.get('/api/media/files').get_json()['files']
+    assert [(f['name'], f['type'], f['size']) for f in files] == [('clip.mp4', 'video', 5)]
+    rv = client.get('/playlist?device_mac=AA:BB:CC:DD:EE:FF')
+    assert rv.get_json()['playlist'] == [{'type': 'image', 'src': '/static/media/dbadmin/AABBCCDDEEFF/pic.jpg', 'duration_ms': 6000}]
+
+    rv = client.post('/api/media/delete', json={'filename': 'clip.mp4'})
+    assert rv.status_code == 200
+    assert client.get('/api/media/files').get_json()['files'] == []
+    assert client.get('/playlist').get_json()['playlist'] == []
+
+
+def test_batch_upload_reports_per_file_status(client, tmp_path):
+    form = {'target': 'media', 'file': [(io.BytesIO(b'one'), 'a.jpg'), (io.BytesIO(b'two'), 'a.jpg'),
+                                        (io.BytesIO(b'exe'), 'run.exe'), (io.BytesIO(b'three'), 'b.png')]}
+    rv = client.post('/api/media/upload', data=form, content_type='multipart/form-data')
+    assert rv.status_code == 201
+    results = rv.get_json()['results']
+    assert [(r['file'], r['status'], r.get('name')) for r in results] == [
+        ('a.jpg', 'saved', 'a.jpg'), ('a.jpg', 'saved', 'a_1.jpg'), ('run.exe', 'rejected', None), ('b.png', 'saved', 'b.png')]
+    assert (tmp_path / 'media' / 'dbadmin' / 'a_1.jpg').read_bytes() == b'two'
+    files = {f['name']: f for f in client.get('/api/media/files').get_json()['files']}
+    assert sorted(files) == ['a.jpg', 'a_1.jpg', 'b.png']
+    assert files['b.png']['sha256'] == hashlib.sha256(b'three').hexdigest()
+
+    rv = client.post('/api/media/upload', data={'target': 'media', 'file': (io.BytesIO(b'x'), 'x.txt')},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 400 and rv.get_json()['results'][0]['error'] == 'unsupported_type'
+
+
+def test_thumbnails_generated_in_background_and_served_immutable(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_thumbs, 'root', str(tmp_path / 'thumbs'))
+    monkeypatch.setattr(media_thumbs, 'ffmpeg', '/usr/bin/ffmpeg')  # pretend a generator exists
+
+    def fake_ffmpeg(src, dest, typ):
+        with open(dest, 'wb') as f:
+            f.write(b'thumb:' + typ.encode())
+    monkeypatch.setattr(media_thumbs, '_ffmpeg_thumb', fake_ffmpeg)
+    monkeypatch.setattr('media_thumbs.Image', None)
+
+    assert _upload(client, 'clip.mp4', b'video').status_code == 201
+    assert media_thumbs.wait_idle()
+    f = client.get('/api/media/files').get_json()['files'][0]
+    assert f['thumb'] == f"/api/media/thumb/{f['sha256']}.jpg"
+    rv = client.get(f['thumb'])
+    assert rv.status_code == 200 and rv.data == b'thumb:video'
+    assert 'immutable' in rv.headers['Cache-Control'] and 'max-age=31536000' in rv.headers['Cache-Control']
+    rv.close()
+    assert client.get('/api/media/thumb/' + '0' * 64 + '.jpg').status_code == 404
+
+
+def _jpeg(width, height, orientation=1):
+    Image = pytest.importorskip('PIL.Image')
+    im = Image.new('RGB', (width, height), (255, 0, 0))
+    im.paste((0, 0, 255), (width // 2, 0, width, height))  # left half red, right half blue
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buf = io.BytesIO()
+    im.save(buf, 'JPEG', exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def test_real_image_thumbnail(client, tmp_path, monkeypatch):
+    Image = pytest.importorskip('PIL.Image')
+    monkeypatch.setattr(media_thumbs, 'root', str(tmp_path / 'thumbs'))
+    monkeypatch.setattr(media_thumbs, 'ffmpeg', None)
+    assert _upload(client, 'wide.jpg', _jpeg(1000, 500)).status_code == 201
+    assert media_thumbs.wait_idle()
+    f = client.get('/api/media/files').get_json()['files'][0]
+    rv = client.get(f['thumb'])
+    assert rv.status_code == 200
+    with Image.open(io.BytesIO(rv.data)) as im:
+        assert (im.format, im.size) == ('JPEG', (320, 160))
+    rv.close()
+    assert client.post('/api/media/delete', json={'filename': 'wide.jpg'}).status_code == 200
+    assert not os.path.exists(media_thumbs.path_for(f['sha256']))  # reclaimed with the last copy
+
+
+class _InlineExecutor:
+    # the in-memory test DB is per-thread, so run pool work on the caller
+    def submit(self, fn, *args):
+        fut = concurrent.futures.Future()
+        fut.set_result(fn(*args))
+        return fut
+
+
+def test_playlist_serves_display_variant_and_keeps_original(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_variants, 'root', str(tmp_path / 'variants'))
+    monkeypatch.setattr(media_variants_mod, '_HAS_PIL', True)
+    monkeypatch.setattr(media_variants, '_executor', lambda: _InlineExecutor())
+    calls = []
+
+    def fake_render(src, dest, width, height, fmt, quality):
+        calls.append((os.path.basename(src), width, height, fmt))
+        with open(dest, 'wb') as f:
+            f.write(b'small')
+        return (width, 1)
+    monkeypatch.setattr(media_variants_mod, '_render', fake_render)
+
+    assert _upload(client, 'photo.jpg', b'big').status_code == 201
+    assert calls == [('photo.jpg', 1920, 1080, 'jpeg')]
+    f = client.get('/api/media/files').get_json()['files'][0]
+    assert f['url'] == '/static/media/dbadmin/photo.jpg'
+    assert f['variant_url'] == f"/static/variants/{f['sha256']}-1920x1080.jpg"
+    assert client.get('/playlist').get_json()['playlist'][0]['src'] == f['variant_url']
+    assert os.path.exists(os.path.join(media_catalog.root, 'dbadmin', 'photo.jpg'))
+    assert client.post('/api/media/delete', json={'filename': 'photo.jpg'}).status_code == 200
+    assert os.listdir(media_variants.root) == []  # reclaimed with the last copy
+
+
+def test_render_variant_is_upright_downscaled_progressive_jpeg(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    src = tmp_path / 'phone.jpg'
+    src.write_bytes(_jpeg(400, 200, orientation=6))  # stored sideways; shown rotated 90 degrees clockwise
+    dest = tmp_path / 'variant.jpg'
+    assert media_variants_mod._render(str(src), str(dest), 100, 100, 'jpeg', 80) == (50, 100)
+    with Image.open(dest) as im:
+        assert (im.format, im.size) == ('JPEG', (50, 100))
+        assert im.info.get('progressive') or im.info.get('progression')
+        assert im.getexif().get(0x0112, 1) == 1
+        top, bottom = im.convert('RGB').getpixel((25, 5)), im.convert('RGB').getpixel((25, 95))
+    assert top[0] > 200 > top[2] and bottom[2] > 200 > bottom[0]  # stored left edge is now on top
+    small = tmp_path / 'small.jpg'
+    small.write_bytes(_jpeg(80, 40))
+    assert media_variants_mod._render(str(small), str(tmp_path / 'none.jpg'), 100, 100, 'jpeg', 80) is None
+
+
+def _mp4_with_trailing_moov():
+    ftyp = _box(b'ftyp', b'isom\0\0\0\0isom')
+    samples = [b'AAAA', b'BBBBBB', b'CC']
+    mdat = _box(b'mdat', b''.join(samples))
+    first = len(ftyp) + 8
+    offsets = [first, first + 4, first + 10]
+    stco = _box(b'stco', struct.pack('>II3I', 0, 3, *offsets))
+    mvhd = struct.pack('>B3xIIII', 0, 0, 0, 600, 9000) + b'\0' * 80  # 9000/600 s
+    moov = _box(b'moov', _box(b'mvhd', mvhd) + _box(b'trak', _box(b'mdia', _box(b'minf', _box(b'stbl', stco)))))
+    return ftyp + mdat + moov, samples
+
+
+def _stco_offsets(data):
+    boxes = dict(child_boxes(data))
+    stbl = boxes[b'moov']
+    for kind in (b'trak', b'mdia', b'minf', b'stbl'):
+        stbl = dict(child_boxes(stbl))[kind]
+    payload = dict(child_boxes(stbl))[b'stco']
+    return list(struct.unpack_from('>3I', payload, 8))
+
+
+def test_faststart_moves_moov_and_fixes_chunk_offsets(tmp_path):
+    data, samples = _mp4_with_trailing_moov()
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(data)
+    assert faststart(str(path)) is True
+    out = path.read_bytes()
+    assert len(out) == len(data)
+    assert [k for k, _ in child_boxes(out)] == [b'ftyp', b'moov', b'mdat']
+    for off, sample in zip(_stco_offsets(out), samples):
+        assert out[off:off + len(sample)] == sample
+    assert faststart(str(path)) is False  # already faststart
+
+
+def test_faststart_widens_stco_past_4gib():
+    stco = struct.pack('>II2I', 0, 2, 100, 0xfffffff0)
+    rebuilt = _shift_offsets(b'stco', stco, lambda o: o + 0x100)
+    kind, payload = next(child_boxes(rebuilt))
+    assert kind == b'co64'
+    assert struct.unpack_from('>2Q', payload, 8) == (0x164, 0xfffffff0 + 0x100)
+
+
+def test_upload_applies_faststart(client):
+    data, _ = _mp4_with_trailing_moov()
+    assert _upload(client, 'phone.mp4', data).status_code == 201
+    stored = open(os.path.join(media_catalog.root, 'dbadmin', 'phone.mp4'), 'rb').read()
+    assert [k for k, _ in child_boxes(stored)] == [b'ftyp', b'moov', b'mdat']
+
+
+def _gif(delays):
+    frames = b''.join(b'\x21\xf9\x04\x00' + struct.pack('<H', d) + b'\x00\x00'
+                      + b'\x2c' + struct.pack('<HHHHB', 0, 0, 1, 1, 0) + b'\x02\x02\x44\x01\x00' for d in delays)
+    return b'GIF89a' + struct.pack('<HHBBB', 1, 1, 0, 0, 0) + frames + b'\x3b'
+
+
+def test_media_durations_from_headers(tmp_path):
+    mp4 = tmp_path / 'a.mp4'
+    mp4.write_bytes(_mp4_with_trailing_moov()[0])
+    gif = tmp_path / 'anim.gif'
+    gif.write_bytes(_gif([50, 0, 150]))
+    still = tmp_path / 'still.gif'
+    still.write_bytes(_gif([0]))
+    anmf = b''.join(b'ANMF' + struct.pack('<I', 16) + b'\0' * 12 + d.to_bytes(3, 'little') + b'\0' for d in (400, 600))
+    webp = tmp_path / 'anim.webp'
+    webp.write_bytes(b'RIFF' + struct.pack('<I', 4 + len(anmf)) + b'WEBP' + anmf)
+    assert media_duration_ms(str(mp4)) == 15000
+    assert media_duration_ms(str(gif)) == 500 + 100 + 1500
+    assert media_duration_ms(str(still)) is None
+    assert media_duration_ms(str(webp)) == 1000
+    assert media_duration_ms(str(tmp_path / 'x.webm')) is None
+
+
+def test_playlist_carries_durations(client):
+    assert _upload(client, 'clip.mp4', _mp4_with_trailing_moov()[0]).status_code == 201
+    assert _upload(client, 'anim.gif', _gif([120, 130])).status_code == 201
+    assert _upload(client, 'pic.jpg', b'jpeg').status_code == 201
+    playlist = client.get('/playlist').get_json()['playlist']
+    # animations play whole loops for at least 6 s
+    assert [(p['type'], p['duration_ms']) for p in playlist] == [('video', 15000), ('image', 7500), ('image', 6000)]
+
+
+def test_playlist_manifest_versions_items_for_precache(client):
+    assert _upload(client, 'pic.jpg', b'jpeg', device_mac='aa:bb').status_code == 201
+    rv = client.get('/api/playlist/manifest?device_mac=aa:bb')
+    manifest = rv.get_json()
+    assert manifest['items'] == [{'type': 'image', 'src': '/static/media/dbadmin/aabb/pic.jpg', 'duration_ms': 6000,
+                                  'sha256': hashlib.sha256(b'jpeg').hexdigest(), 'size': 4}]
+    assert rv.headers['ETag'] == f'"{manifest["version"]}"'
+    assert client.get('/api/playlist/manifest?device_mac=aa:bb',
+                      headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+    with _db_engine.begin() as conn:
+        conn.execute(text('DELETE FROM devices WHERE mac=:m'), {'m': 'aa:bb'})
+        conn.execute(text("INSERT INTO devices (device_id, mac, owner_username, status) "
+                          "VALUES ('kiosk-1', 'aa:bb', 'dbadmin', 'active')"))
+    # kiosks without a session ask by MAC, like /api/public/playlist_by_mac
+    assert client.get('/api/playlist/manifest?mac=AA:BB').get_json() == manifest
+    assert _upload(client, 'more.jpg', b'more', device_mac='aa:bb').status_code == 201
+    assert client.get('/api/playlist/manifest?device_mac=aa:bb').get_json()['version'] != manifest['version']
+
+    rv = client.get('/sw.js')
+    assert rv.mimetype == 'application/javascript' and b'precache' in rv.data
+    assert client.get('/precache.js').status_code == 200
+
+
+def test_playback_gap_reports(client):
+    rv = client.post('/api/playback/gaps', json={'device_mac': 'AA:BB', 'first_ms': 420, 'gaps_ms': [12, 380, 40]})
+    assert rv.status_code == 204
+    client.post('/api/playback/gaps', json={'device_mac': 'aa:bb', 'first_ms': 90, 'gaps_ms': [15]})
+    assert client.post('/api/playback/gaps', json={'gaps_ms': ['slow']}).status_code == 400
+    [entry] = [d for d in client.get('/api/admin/playback').get_json()['devices'] if d['device'] == 'aa:bb']
+    assert (entry['loops'], entry['transitions'], entry['max_gap_ms']) == (2, 4, 380)
+    assert (entry['last_first_ms'], entry['last_gaps_ms']) == (90, [15])
+    assert 'sssnl_playback_transition_gap_seconds_bucket' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_resumable_upload_appends_chunks_and_finalizes(client, tmp_path):
+    body = os.urandom(3000)
+    rv = client.post('/api/media/uploads', json={'filename': 'big.mp4', 'size': len(body),
+                                                 'sha256': hashlib.sha256(body).hexdigest()})
+    assert rv.status_code == 201
+    loc = rv.get_json()['location']
+    rv = client.patch(loc, data=body[:1000], headers={'Upload-Offset': '0'})
+    assert rv.status_code == 200 and rv.headers['Upload-Offset'] == '1000'
+    # a retried chunk at a stale offset is refused with the resume point
+    rv = client.patch(loc, data=body[:1000], headers={'Upload-Offset': '0'})
+    assert rv.status_code == 409 and rv.get_json()['offset'] == 1000
+    assert client.post(loc + '/finalize').get_json() == {'error': 'incomplete', 'offset': 1000}
+
+    # the session survives a restart; the running hash is rebuilt from disk
+    sess = UploadManager(media_uploads.state_dir).get(loc.rsplit('/', 1)[1], 'dbadmin')
+    assert sess.offset == 1000
+    media_uploads._sessions.clear()
+    assert client.get(loc).get_json()['offset'] == 1000
+
+    assert client.patch(loc, data=body[1000:], headers={'Upload-Offset': '1000'}).status_code == 200
+    rv = client.post(loc + '/finalize')
+    assert rv.status_code == 201
+    assert rv.get_json()['saved'] == ['/static/media/dbadmin/big.mp4']
+    assert open(os.path.join(media_catalog.root, 'dbadmin', 'big.mp4'), 'rb').read() == body
+    assert [f['name'] for f in client.get('/api/media/files').get_json()['files']] == ['big.mp4']
+    assert not [n for n in os.listdir(os.path.join(media_catalog.root, 'dbadmin')) if n.endswith('.part')]
+    assert client.get(loc).status_code == 404
+
+
+def test_resumable_upload_rejects_overflow_and_bad_hash(client):
+    rv = client.post('/api/media/uploads', json={'filename': 'x.jpg', 'size': 4, 'sha256': '0' * 64})
+    loc = rv.get_json()['location']
+    assert client.patch(loc, data=b'12345', headers={'Upload-Offset': '0'}).status_code == 413
+    assert client.patch(loc, data=b'1234', headers={'Upload-Offset': '0'}).status_code == 200
+    assert client.post(loc + '/finalize').status_code == 422
+    assert client.delete(loc).status_code == 200
+    assert client.post('/api/media/uploads', json={'filename': 'x.exe', 'size': 4}).status_code == 400
+
+
+def test_blob_store_shares_bytes_and_reclaims_on_last_delete(client, tmp_path):
+    data = b'\x89PNG\r\n\x1a\n' + b'same bytes' * 100
+    sha = hashlib.sha256(data).hexdigest()
+    assert _upload(client, 'a.png', data, device_mac='AA:BB').status_code == 201
+    assert _upload(client, 'b.png', data, device_mac='CC:DD').status_code == 201
+    first = tmp_path / 'media' / 'dbadmin' / 'AABB' / 'a.png'
+    second = tmp_path / 'media' / 'dbadmin' / 'CCDD' / 'b.png'
+    blob = tmp_path / 'blobs' / sha
+    assert os.path.samefile(first, blob) and os.path.samefile(second, blob)
+
+    r = client.post('/api/media/delete', json={'filename': 'a.png', 'device_mac': 'AA:BB'})
+    assert r.status_code == 200
+    assert blob.exists()
+    r = client.post('/api/media/delete', json={'filename': 'b.png', 'device_mac': 'CC:DD'})
+    assert r.status_code == 200
+    assert not blob.exists()
+
+
+def test_precheck_adds_known_content_without_upload(client, tmp_path):
+    data = b'GIF89a' + b'\x00' * 64
+    sha = hashlib.sha256(data).hexdigest()
+    r = client.post('/api/media/precheck', json={'sha256': sha, 'filename': 'x.gif'})
+    assert r.status_code == 200 and r.get_json() == {'exists': False}
+    assert _upload(client, 'x.gif', data).status_code == 201
+
+    r = client.post('/api/media/precheck', json={'sha256': sha, 'filename': 'x.gif', 'device_mac': 'AA:BB'})
+    assert r.status_code == 201
+    body = r.get_json()
+    assert body['deduplicated'] and body['saved'] == ['/static/media/dbadmin/AABB/x.gif']
+    assert os.path.samefile(tmp_path / 'media' / 'dbadmin' / 'AABB' / 'x.gif', tmp_path / 'blobs' / sha)
+    names = [f['name'] for f in client.get('/api/media/files?device_mac=AA:BB').get_json()['files']]
+    assert names == ['x.gif']
+    assert client.post('/api/media/precheck', json={'sha256': 'nothex', 'filename': 'x.gif'}).status_code == 400
+
+
+class _Remote(BaseHTTPRequestHandler):
+    """Stand-in remote: /flaky.png drops the first response halfway."""
+    body = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 64
+    requests = []
+
+    def do_GET(self):
+        rng = self.headers.get('Range')
+        self.requests.append((self.path, rng))
+        if self.path == '/missing.png':
+            self.send_error(404)
+            return
+        if self.path == '/big.png':
+            self.send_response(200)
+            self.send_header('Content-Length', str(1 << 30))
+            self.end_headers()
+            return
+        start = int(rng[6:-1]) if rng else 0
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header('Content-Range', f'bytes {start}-{len(self.body) - 1}/{len(self.body)}')
+        self.send_header('Content-Length', str(len(self.body) - start))
+        self.end_headers()
+        if self.path == '/flaky.png' and len(self.requests) == 1:
+            self.wfile.write(self.body[:5000])
+            self.close_connection = True
+            return
+        self.wfile.write(self.body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    _Remote.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Remote)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(media_fetches, '_pool', _InlineExecutor())
+    monkeypatch.setattr(media_fetches, 'backoff', 0)
+    monkeypatch.setattr(media_fetches, 'timeout', 5)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_runs_as_job_and_resumes_with_range(client, tmp_path, remote):
+    rv = client.post('/api/media/fetch', json={'url': remote + '/flaky.png'})
+    assert rv.status_code == 202
+    job = client.get(rv.headers['Location']).get_json()
+    assert job['state'] == 'done' and job['attempts'] == 2
+    assert job['received'] == job['total'] == len(_Remote.body)
+    assert job['result'] == {'saved': ['/static/media/dbadmin/flaky.png']}
+    assert _Remote.requests == [('/flaky.png', None), ('/flaky.png', 'bytes=5000-')]
+    assert (tmp_path / 'media' / 'dbadmin' / 'flaky.png').read_bytes() == _Remote.body
+    assert not [n for n in os.listdir(tmp_path / 'media' / 'dbadmin') if n.endswith('.fetch')]
+    assert [f['name'] for f in client.get('/api/media/files').get_json()['files']] == ['flaky.png']
+
+
+def test_fetch_job_failures(client, tmp_path, remote, monkeypatch):
+    monkeypatch.setattr(media_fetches, 'max_bytes', 1 << 20)
+    job = client.get(client.post('/api/media/fetch', json={'url': remote + '/big.png'}).headers['Location']).get_json()
+    assert (job['state'], job['error']) == ('failed', 'too_large')
+    job = client.get(client.post('/api/media/fetch', json={'url': remote + '/missing.png'}).headers['Location']).get_json()
+    assert (job['state'], job['error'], job['attempts']) == ('failed', 'download_failed', 1)
+    assert os.listdir(tmp_path / 'media' / 'dbadmin') == []
+
+    def broken_add(*args, **kwargs):
+        raise RuntimeError('db down')
+    monkeypatch.setattr(media_catalog, 'add', broken_add)
+    job = client.get(client.post('/api/media/fetch', json={'url': remote + '/ok.png'}).headers['Location']).get_json()
+    assert (job['state'], job['error'], job['name']) == ('failed', 'internal_error', None)
+    assert os.listdir(tmp_path / 'media' / 'dbadmin') == []  # no published file without a catalog row
+    assert client.post('/api/media/fetch', json={'url': 'file:///etc/passwd.png'}).status_code == 400
+    assert client.get('/api/media/jobs/nope').status_code == 404
+
+
+def test_files_paginate_with_stable_cursor(client):
+    for name, data in (('a.jpg', b'1'), ('b.webm', b'22'), ('c.png', b'333'), ('d.jpg', b'4444'), ('e.gif', b'55555')):
+        assert _upload(client, name, data).status_code == 201
+    seen, cursor = [], None
+    while True:
+        page = client.get('/api/media/files', query_string={'limit': 2, **({'cursor': cursor} if cursor else {})}).get_json()
+        if not seen:
+            assert (page['total'], page['total_bytes']) == (5, 15)
+        seen += [f['name'] for f in page['files']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+        if len(seen) == 2:
+            client.post('/api/media/delete', json={'filename': 'a.jpg'})  # earlier items going away don't shift pages
+    assert seen == ['a.jpg', 'b.webm', 'c.png', 'd.jpg', 'e.gif']
+
+    page = client.get('/api/media/files?type=image&sort=largest&limit=10').get_json()
+    assert [f['name'] for f in page['files']] == ['e.gif', 'd.jpg', 'c.png']
+    assert (page['total'], page['total_bytes'], page['next_cursor']) == (3, 12, None)
+    assert client.get('/api/media/files?cursor=%%%').status_code == 400
+    assert client.get('/api/media/files?sort=bogus').status_code == 400
+    assert client.get('/api/media/files?limit=0').status_code == 400
+
+
+def test_usage_totals_track_writes_and_enforce_quota(client, monkeypatch):
+    import media_admin
+    assert _upload(client, 'a.jpg', b'12345').status_code == 201
+    assert _upload(client, 'b.jpg', b'123', device_mac='AA:BB').status_code == 201
+    usage = client.get('/api/media/files?device_mac=AA:BB').get_json()['usage']
+    assert (usage['files'], usage['bytes'], usage['device']) == (2, 8, {'files': 1, 'bytes': 3})
+    client.post('/api/media/delete', json={'filename': 'a.jpg'})
+    [mine] = [u for u in client.get('/api/admin/media/usage').get_json()['users'] if u['owner'] == 'dbadmin']
+    assert (mine['files'], mine['bytes'], mine['devices']) == (1, 3, {'': {'files': 0, 'bytes': 0}, 'AABB': {'files': 1, 'bytes': 3}})
+    assert media_catalog.rescan()['total'] == 1  # recount agrees with the running totals
+    assert media_catalog.usage('dbadmin')['dbadmin']['bytes'] == 3
+
+    monkeypatch.setattr(media_admin, 'QUOTA_FILES', 2)
+    assert _upload(client, 'c.jpg', b'1').status_code == 201
+    rv = _upload(client, 'd.jpg', b'1')
+    assert rv.status_code == 413 and rv.get_json()['error'] == 'quota_exceeded'
+    rv = client.post('/api/media/uploads', json={'filename': 'e.jpg', 'size': 10})
+    assert rv.status_code == 413
+    monkeypatch.setattr(media_admin, 'QUOTA_FILES', 0)
+    monkeypatch.setattr(media_admin, 'MIN_FREE_BYTES', 1 << 62)
+    assert _upload(client, 'd.jpg', b'1').status_code == 507
+
+
+def test_upload_admission_limits_and_streams_in_place(client, tmp_path, monkeypatch):
+    # parts land in the device directory by rename; no staging files are left behind
+    assert _upload(client, 'a.jpg', b'abc', device_mac='AA:BB').status_code == 201
+    assert sorted(os.listdir(tmp_path / 'media' / 'dbadmin' / 'AABB')) == ['a.jpg']
+    assert not [n for n in os.listdir(tmp_path / 'media' / 'dbadmin') if n.endswith('.upload')]
+    assert media_admission.snapshot()['inflight_bytes'] == 0
+    assert client.get('/api/media/info').get_json()['uploads_per_user'] == media_admission.per_user
+
+    with media_admission.admit('dbadmin', 1), media_admission.admit('dbadmin', 1):
+        rv = _upload(client, 'b.jpg')
+        assert rv.status_code == 429 and rv.headers['Retry-After'] == '5'
+    monkeypatch.setattr(media_admission, 'max_inflight_bytes', 1000)
+    with media_admission.admit('someone-else', 1000):
+        rv = _upload(client, 'b.jpg')
+        assert rv.status_code == 503 and rv.get_json()['error'] == 'server_busy'
+    assert _upload(client, 'b.jpg').status_code == 201  # a lone upload over the budget still goes
+
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 100)
+    rv = _upload(client, 'c.jpg', b'x' * 200)
+    assert rv.status_code == 413 and rv.get_json()['error'] == 'too_large'
+
+
+def test_fetch_is_capped_by_remaining_quota(client, tmp_path, remote, monkeypatch):
+    import media_admin
+    assert _upload(client, 'a.jpg', b'x' * 1000).status_code == 201
+    monkeypatch.setattr(media_admin, 'QUOTA_BYTES', 1000 + len(_Remote.body) - 1)
+    job = client.get(client.post('/api/media/fetch', json={'url': remote + '/ok.png'}).headers['Location']).get_json()
+    assert (job['state'], job['error']) == ('failed', 'quota_exceeded')
+    assert os.listdir(tmp_path / 'media' / 'dbadmin') == ['a.jpg']
+
+    # the room left shrank while the job was queued: the size is checked again before recording
+    monkeypatch.setattr(media_admin, 'quota_room', lambda user: (None, 'quota_exceeded'))
+    job = client.get(client.post('/api/media/fetch', json={'url': remote + '/ok.png'}).headers['Location']).get_json()
+    assert (job['state'], job['error']) == ('failed', 'quota_exceeded')
+    assert os.listdir(tmp_path / 'media' / 'dbadmin') == ['a.jpg']
+    assert media_catalog.usage('dbadmin')['dbadmin']['files'] == 1
+
+    monkeypatch.setattr(media_admin, 'QUOTA_BYTES', 1000 + len(_Remote.body))
+    job = client.get(client.post('/api/media/fetch', json={'url': remote + '/ok.png'}).headers['Location']).get_json()
+    assert job['state'] == 'done'
+
+
+def test_renaming_a_user_moves_their_catalog(client, tmp_path):
+    client.post('/api/auth/signup', json={'username': 'renamer', 'password': 'pw'})
+    assert _upload(client, 'a.jpg', b'abc').status_code == 201
+    assert _upload(client, 'b.jpg', b'de', device_mac='AA:BB').status_code == 201
+    rv = client.post('/api/user/change_username', json={'new_username': 'renamed', 'password': 'pw'})
+    assert rv.get_json()['ok']
+    assert [f['name'] for f in client.get('/api/media/files').get_json()['files']] == ['a.jpg']
+    assert client.get('/playlist?device_mac=AA:BB').get_json()['playlist'][0]['src'] == '/static/media/renamed/AABB/b.jpg'
+    usage = media_catalog.usage()
+    assert 'renamer' not in usage and usage['renamed']['bytes'] == 5
+
+    client.post('/api/auth/login', json={'username': 'dbadmin', 'password': 'dbadmin'})
+    assert client.delete('/api/admin/users/renamed').status_code == 200
+    assert not (tmp_path / 'media' / 'renamed').exists()
+    assert 'renamed' not in media_catalog.usage()
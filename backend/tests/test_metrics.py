@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+THIS_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = os.path.abspath(os.path.join(THIS_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ['DB_URI'] = 'sqlite:///:memory:'
+
+from app import app, init_users_db  # noqa: E402
+from metrics import Registry  # noqa: E402
+from profiler import RequestProfiler  # noqa: E402
+
+
+@pytest.fixture()
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as c:
+        with app.app_context():
+            init_users_db()
+        yield c
+
+
+def test_metrics_endpoint_covers_routes_db_and_password(client):
+    client.post('/api/auth/login', json={'username': 'dbadmin', 'password': 'dbadmin'})
+    client.get('/api/media/info')
+    rv = client.get('/metrics')
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/plain'
+    body = rv.get_data(as_text=True)
+    assert 'sssnl_http_requests_total{method="POST",route="/api/auth/login",status="200"}' in body
+    assert 'sssnl_http_request_duration_seconds_count{method="GET",route="/api/media/info"}' in body
+    assert 'sssnl_db_query_duration_seconds_count{op="SELECT"}' in body
+    assert 'sssnl_password_verify_duration_seconds_count ' in body
+    assert '# TYPE sssnl_upload_bytes_total counter' in body
+
+
+def test_sharded_counters_merge_across_threads():
+    reg = Registry()
+    hits = reg.counter('hits_total', 'Hits.', ('path',))
+    lat = reg.histogram('lat_seconds', 'Latency.', buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(100):
+            hits.inc(labels=('/a',))
+            lat.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(80)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    text = reg.render()
+    assert 'hits_total{path="/a"} 8000.0' in text
+    assert 'lat_seconds_bucket{le="0.1"} 0' in text
+    assert 'lat_seconds_bucket{le="1.0"} 8000' in text
+    assert 'lat_seconds_count 8000' in text
+
+
+def _slow_handler():
+    time.sleep(0.1)
+
+
+def test_request_profiler_samples_thread_stack():
+    prof = RequestProfiler(capacity=2)
+    prof.configure(enabled=True, route='/x', interval_ms=2)
+    assert prof.should_profile('/x') and not prof.should_profile('/y')
+    sess = prof.start('GET', '/x', '/x')
+    _slow_handler()
+    prof.stop(sess)
+    assert sess.samples > 0
+    assert any(stack.endswith('_slow_handler') for stack in sess.stacks)
+    assert prof.get(sess.id) is sess
+    line = sess.collapsed().splitlines()[0]
+    stack, count = line.rsplit(' ', 1)
+    assert ';' in stack and int(count) > 0
+
+
+def test_admin_profiles_endpoints(client):
+    assert client.get('/api/admin/profiles').status_code == 403
+    client.post('/api/auth/login', json={'username': 'dbadmin', 'password': 'dbadmin'})
+    rv = client.post('/api/admin/profiling', json={'enabled': True, 'route': '/healthz'})
+    assert rv.get_json()['enabled'] is True
+    client.get('/healthz')
+    client.post('/api/admin/profiling', json={'enabled': False})
+    profiles = client.get('/api/admin/profiles').get_json()['profiles']
+    assert profiles[0]['route'] == '/healthz'
+    rv = client.get(f"/api/admin/profiles/{profiles[0]['id']}")
+    assert rv.status_code == 200 and rv.mimetype == 'text/plain'
+    assert client.get('/api/admin/profiles/merged').status_code == 200
+    assert client.get('/api/admin/profiles/999999').status_code == 404
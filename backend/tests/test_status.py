@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import functools
+import threading
+import time
+import pytest
+
+THIS_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = os.path.abspath(os.path.join(THIS_DIR, '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ['DB_URI'] = 'sqlite:///:memory:'
+
+import app as app_module  # noqa: E402
+from app import app, init_users_db, sensor_hub, sensor_store  # noqa: E402
+from sensor_hub import SensorHub  # noqa: E402
+from motion_source import MotionDebouncer, MockEventSource  # noqa: E402
+from dht_worker import DHTSampler, DHTWorker, MockDHTSensor  # noqa: E402
+
+
+@pytest.fixture()
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as c:
+        yield c
+        c.post('/mock-motion/clear')
+        c.post('/mock-dht/clear')
+
+
+def _sse_event(chunk):
+    text = chunk.decode() if isinstance(chunk, bytes) else chunk
+    fields = {}
+    for line in text.strip().splitlines():
+        if line.startswith(('event:', 'data:')):
+            key, _, val = line.partition(':')
+            fields[key] = val.strip()
+    return fields.get('event'), json.loads(fields['data'])
+
+
+def test_status_stream_sends_snapshot_then_delta(client):
+    client.post('/mock-motion', json={'active': False})
+    rv = client.get('/api/status/stream')
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/event-stream'
+    events = iter(rv.response)
+    event, data = _sse_event(next(events))
+    assert event == 'status'
+    assert data['motion_active'] is False
+    client.post('/mock-motion', json={'active': True})
+    event, data = _sse_event(next(events))
+    assert event == 'delta'
+    assert data['motion_active'] is True
+    assert data['motion_status'] == 'Motion detected'
+    assert 'temp' not in data
+    rv.close()
+
+
+def test_status_etag_and_not_modified(client):
+    rv = client.get('/status')
+    assert rv.status_code == 200
+    etag = rv.headers['ETag']
+    version = rv.get_json()['version']
+    rv = client.get('/api/status', headers={'If-None-Match': etag})
+    assert rv.status_code == 304
+    client.post('/mock-dht', json={'temp': 30.5, 'hum': 41})
+    rv = client.get('/status', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.headers['ETag'] != etag
+    data = rv.get_json()
+    assert data['version'] > version
+    assert data['temp'] == '30.5°C'
+    assert data['temp_c'] == 30.5
+
+
+def test_status_long_poll_since(client):
+    client.post('/mock-motion', json={'active': False})
+    version = client.get('/status').get_json()['version']
+    # Unchanged state: request is held for `wait` and returns the same version.
+    rv = client.get(f'/status?since={version}&wait=0.2')
+    assert rv.get_json()['version'] == version
+    client.post('/mock-motion', json={'active': True})
+    # Stale `since`: answered immediately with the newer state.
+    rv = client.get(f'/status?since={version}&wait=10')
+    data = rv.get_json()
+    assert data['version'] > version
+    assert data['motion_active'] is True
+
+
+def test_sensor_hub_copy_on_write():
+    hub = SensorHub()
+    before = hub.snapshot()
+    after = hub.record_dht(21.0, 50.0, 100.0)
+    assert after is hub.snapshot()
+    assert before.version == 0 and before.temp == '--'
+    assert after.version == 1 and after.temp == '21.0°C' and after.hum_pct == 50.0
+    # Identical state does not produce a new version.
+    assert hub.record_dht(21.0, 50.0, 100.0) is after
+    with pytest.raises(AttributeError):
+        after.temp_c = 0
+
+
+def test_sensor_history_ring_and_downsample():
+    hub = SensorHub(history_size=4)
+    for i, temp in enumerate([10.0, 20.0, 30.0, 40.0, 50.0, 60.0]):
+        hub.record_dht(temp, 50.0, 1000.0 + i * 10)
+    assert len(hub.history) == 4
+    buckets = hub.history.downsample(1000.0, 1060.0, 30.0)
+    # The two oldest samples were overwritten; 1020 is alone in bucket 0.
+    assert [b['t'] for b in buckets] == [1000.0, 1030.0]
+    assert buckets[0]['n'] == 1 and buckets[0]['temp']['avg'] == 30.0
+    assert buckets[1]['n'] == 3
+    assert buckets[1]['temp'] == {'min': 40.0, 'avg': 50.0, 'max': 60.0}
+
+
+def test_sensor_history_keeps_late_samples_in_order():
+    hub = SensorHub(history_size=5)
+    hub.history.append(1000.0, 20.0, 40.0, False)
+    hub.history.append(1020.0, None, None, True)   # motion edge
+    hub.history.append(1010.0, 22.0, None, False)  # DHT read that finished after the edge
+    hub.history.append(1030.0, 24.0, 44.0, False)
+    hub.history.append(1005.0, None, None, True)
+    hub.history.append(1040.0, None, None, False)  # ring full: 1000.0 drops out
+    assert hub.history.oldest() == 1005.0
+    buckets = hub.history.downsample(1000.0, 1040.0, 20.0)
+    assert [(b['t'], b['n']) for b in buckets] == [(1000.0, 2), (1020.0, 2)]
+    assert buckets[0]['temp'] == {'min': 22.0, 'avg': 22.0, 'max': 22.0} and buckets[0]['hum'] is None
+    assert buckets[0]['motion'] == {'avg': 0.5, 'max': 1}
+    assert buckets[1]['temp']['avg'] == 24.0 and buckets[1]['hum']['avg'] == 44.0
+
+
+def test_status_history_endpoint(client):
+    client.post('/mock-dht', json={'temp': 22, 'hum': 45})
+    rv = client.get(f'/api/status/history?from={sensor_hub.history.oldest()}&step=60')
+    assert rv.status_code == 200
+    data = rv.get_json()
+    assert data['source'] == 'memory'
+    assert data['step'] >= 60
+    last = data['buckets'][-1]
+    assert last['temp']['min'] <= 22.0 <= last['temp']['max']
+    assert client.get('/api/status/history?from=10&to=5').status_code == 400
+
+
+def test_sensor_store_batches_and_rollups():
+    init_users_db()
+    sensor_store.flush()
+    with sensor_store._engine.begin() as conn:
+        for name in ('sensor_samples', 'sensor_rollup_1m', 'sensor_rollup_1h'):
+            conn.exec_driver_sql(f'DELETE FROM {name}')
+    base = 3600.0 * 1000
+    for i, temp in enumerate([20.0, 22.0, 24.0]):
+        sensor_store.enqueue(base + i * 20, temp, 50.0, i == 1)
+    assert sensor_store.flush() == 3
+    # A later batch landing in the same minute is merged into the rollup row.
+    sensor_store.enqueue(base + 50, 30.0, None, False)
+    sensor_store.flush()
+    buckets = sensor_store.downsample(base, base + 120, 60)
+    assert len(buckets) == 1
+    b = buckets[0]
+    assert b['n'] == 4
+    assert b['temp'] == {'min': 20.0, 'avg': 24.0, 'max': 30.0}
+    assert b['hum']['avg'] == 50.0
+    assert b['motion'] == {'avg': 0.25, 'max': 1}
+    assert sensor_store.downsample(base, base + 7200, 3600)[0]['n'] == 4
+    sensor_store.apply_retention(now=base + 400 * 86400)
+    assert sensor_store.downsample(base, base + 7200, 3600) == []
+
+
+def test_clearing_mock_motion_restores_real_state(client):
+    client.post('/mock-motion', json={'active': False})
+    app_module._on_motion_change(True, 1, time.time())  # PIR edge while mocked: not applied
+    assert sensor_hub.snapshot().motion_active is False
+    rv = client.post('/mock-motion/clear')
+    assert rv.get_json()['motion_active'] is True
+    app_module._on_motion_change(False, 0, time.time())
+    assert sensor_hub.snapshot().motion_active is False
+
+
+def test_motion_debouncer_with_mock_events():
+    changes = []
+    committed = threading.Event()
+
+    def on_change(is_motion, raw, ts):
+        changes.append((is_motion, raw))
+        committed.set()
+
+    debouncer = MotionDebouncer(on_change, settle_sec=0.05)
+    source = MockEventSource()
+    source.start(debouncer)
+    worker = threading.Thread(target=debouncer.run, daemon=True)
+    worker.start()
+    try:
+        # A glitch shorter than the settle window is ignored.
+        source.emit(0)
+        assert committed.wait(1)
+        committed.clear()
+        source.emit(1)
+        source.emit(0)
+        time.sleep(0.15)
+        assert changes == [(False, 0)]
+        source.emit(1)
+        assert committed.wait(1)
+        assert changes[-1] == (True, 1)
+    finally:
+        debouncer.stop()
+        worker.join(1)
+
+
+def _run_worker(worker, on_reading):
+    t = threading.Thread(target=worker.run, args=(on_reading,), daemon=True)
+    t.start()
+    return t
+
+
+def test_dht_worker_streams_readings_from_child():
+    got = threading.Event()
+    readings = []
+    worker = DHTWorker(MockDHTSensor, interval=0.05)
+    t = _run_worker(worker, lambda r: (readings.append(r), got.set()))
+    try:
+        assert got.wait(20)
+        assert readings[0]['temp'] == 21.5 and readings[0]['hum'] == 55.0
+        assert worker.status()['pid'] not in (None, os.getpid())
+    finally:
+        worker.stop()
+        t.join(10)
+
+
+def test_dht_worker_restarts_wedged_child():
+    # The "driver" hangs while opening, so the child never reports.
+    worker = DHTWorker(functools.partial(time.sleep, 3600), interval=0.05, stall_timeout=0.5)
+    t = _run_worker(worker, lambda r: None)
+    try:
+        deadline = time.time() + 20
+        while worker.restarts < 1 and time.time() < deadline:
+            time.sleep(0.1)
+        assert worker.restarts >= 1
+    finally:
+        worker.stop()
+        t.join(10)
+
+
+def test_dht_worker_backs_off_when_the_driver_cannot_open():
+    # int('no sensor') raises in the child, like a driver that can't find its pin
+    worker = DHTWorker(functools.partial(int, 'no sensor'), interval=0.05, restart_delay=0.2, max_restart_delay=0.4)
+    t = _run_worker(worker, lambda r: None)
+    try:
+        deadline = time.time() + 30
+        while worker.failed_runs < 3 and time.time() < deadline:
+            time.sleep(0.05)
+        status = worker.status()
+        assert status['failed_runs'] >= 3 and status['last_error'].startswith('ValueError')
+        assert status['next_restart_in'] is None or status['next_restart_in'] <= 0.4  # capped
+        assert worker.latest is None
+    finally:
+        worker.stop()
+        t.join(10)
+
+
+def test_dht_sampler_retry_backoff_and_median():
+    sampler = DHTSampler(interval=10.0, min_interval=1.0, quick_retries=2, max_backoff=20.0, window=3)
+    for temp in (21.0, 22.0, 80.0):
+        assert sampler.record(temp, 50.0, 0.01)
+    # The 80.0 spike is rejected by the median of the last three reads.
+    assert sampler.median() == (22.0, 50.0)
+    assert sampler.next_delay() == 10.0
+    delays = []
+    for _ in range(5):
+        sampler.record(None, None, 0.2)
+        delays.append(sampler.next_delay())
+    assert delays == [1.0, 1.0, 10.0, 20.0, 20.0]
+    assert sampler.in_backoff()
+    assert sampler.stats()['failures'] == 5
+    assert sampler.failure_rate() == 5 / 8
+    sampler.record(23.0, 51.0, 0.01)
+    assert sampler.next_delay() == 10.0 and not sampler.in_backoff()
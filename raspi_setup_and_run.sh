@@ -97,9 +97,9 @@ cleanup() {
 }
 trap cleanup EXIT INT TERM
 
-log "Starting Flask backend (backend.app)..."
+log "Starting Flask backend (python -m backend)..."
 source "$VENV_DIR/bin/activate"
-(cd "$ROOT_DIR" && "$PYBIN" -m backend.app) &
+(cd "$ROOT_DIR" && "$PYBIN" -m backend) &
 PIDS+=("$!")
 deactivate || true
 
@@ -133,7 +133,7 @@ class _DashboardAuthGateState extends State<_DashboardAuthGate> {
 class PlaylistItem {
   final String type; // 'video' or 'image'
   final String src; // relative URL from backend
-  final int? durationMs; // for images
+  final int? durationMs; // display time; video length when the server knows it
 
   const PlaylistItem({
     required this.type,
@@ -190,7 +190,9 @@ class _DashboardScreenState extends State<DashboardScreen> {
     motionActive: false,
   );
 
-  Timer? _statusTimer;
+  // Long-poll state: the server holds /status?since=<version> until it changes.
+  int? _statusVersion;
+  bool _disposed = false;
   bool _playing = false;
   bool _motionTriggered = false;
   VideoPlayerController? _videoController;
@@ -199,30 +201,40 @@ class _DashboardScreenState extends State<DashboardScreen> {
   @override
   void initState() {
     super.initState();
-    _startStatusPolling();
+    _watchStatus();
   }
 
   @override
   void dispose() {
-    _statusTimer?.cancel();
+    _disposed = true;
     _videoController?.dispose();
     super.dispose();
   }
 
-  void _startStatusPolling() {
-    // Initial fetch
-    _fetchStatus();
-    _statusTimer?.cancel();
-    _statusTimer = Timer.periodic(const Duration(milliseconds: 1500), (_) {
-      _fetchStatus();
-    });
+  // Status is pushed rather than polled on a timer: each request waits (up
+  // to 25 s) for the next change, so motion shows up as soon as it happens
+  // and an idle dashboard costs one request per 25 s. Long-polling instead
+  // of /api/status/stream because package:http buffers whole responses on
+  // the web build.
+  Future<void> _watchStatus() async {
+    while (!_disposed) {
+      final ok = await _fetchStatus();
+      if (!ok && !_disposed) {
+        await Future<void>.delayed(const Duration(seconds: 2)); // server down: don't spin
+      }
+    }
   }
 
-  Future<void> _fetchStatus() async {
+  Future<bool> _fetchStatus() async {
     try {
-      final resp = await http.get(Uri.parse('$kBackendBaseUrl/status'));
-      if (resp.statusCode != 200) return;
+      final Uri uri = _statusVersion == null
+          ? Uri.parse('$kBackendBaseUrl/status')
+          : Uri.parse('$kBackendBaseUrl/status')
+              .replace(queryParameters: {'since': '$_statusVersion', 'wait': '25'});
+      final resp = await http.get(uri).timeout(const Duration(seconds: 35));
+      if (resp.statusCode != 200 || _disposed) return false;
       final data = json.decode(resp.body) as Map<String, dynamic>;
+      _statusVersion = data['version'] as int?;
       final newStatus = StatusData.fromJson(data);
 
       final bool oldMotion = _status.motionActive;
@@ -234,8 +246,10 @@ class _DashboardScreenState extends State<DashboardScreen> {
       if (newStatus.motionActive && !oldMotion && !_playing && !_motionTriggered) {
         _playPlaylistOnce();
       }
+      return true;
     } catch (_) {
       // ignore errors; keep last known status
+      return false;
     }
   }
 
@@ -295,7 +309,10 @@ class _DashboardScreenState extends State<DashboardScreen> {
       await _videoController!.play();
 
       // Wait until the video ends or a max timeout.
-      final duration = _videoController!.value.duration;
+      var duration = _videoController!.value.duration;
+      if (duration == Duration.zero && item.durationMs != null) {
+        duration = Duration(milliseconds: item.durationMs!);
+      }
       final maxWait = duration == Duration.zero
           ? const Duration(seconds: 45)
           : duration + const Duration(seconds: 3);
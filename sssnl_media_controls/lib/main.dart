@@ -438,13 +438,15 @@ class _MediaFile {
   final String name;
   final String url;
   final String type; // image or video
+  final String? thumb; // small JPEG; null when the server can't make one
 
-  _MediaFile({required this.name, required this.url, required this.type});
+  _MediaFile({required this.name, required this.url, required this.type, this.thumb});
 
   factory _MediaFile.fromJson(Map<String, dynamic> json) => _MediaFile(
         name: json['name'] as String? ?? '',
         url: json['url'] as String? ?? '',
         type: json['type'] as String? ?? 'image',
+        thumb: json['thumb'] as String?,
       );
 }
 
@@ -457,6 +459,9 @@ class _MediaManagerPage extends StatefulWidget {
 
 class _MediaManagerPageState extends State<_MediaManagerPage> {
   List<_MediaFile> _files = const [];
+  String? _nextCursor; // more pages of /api/media/files when non-null
+  int _total = 0;
+  bool _loadingMore = false;
   bool _loading = false;
   bool _authed = false;
   bool _authLoading = false;
@@ -525,26 +530,36 @@ class _MediaManagerPageState extends State<_MediaManagerPage> {
     }
   }
 
+  static const _pageSize = 60;
+
+  Future<Map<String, dynamic>?> _fetchPage(String? cursor) async {
+    final uri = Uri.parse('$kBackendBaseUrl/api/media/files').replace(queryParameters: {
+      'limit': '$_pageSize',
+      if (cursor != null) 'cursor': cursor,
+      if (_deviceMac != null && _deviceMac!.isNotEmpty) 'device_mac': _deviceMac!,
+    });
+    final resp = await _api.get(uri).timeout(const Duration(seconds: 10));
+    if (resp.statusCode != 200) return null;
+    return json.decode(resp.body) as Map<String, dynamic>;
+  }
+
+  List<_MediaFile> _parseFiles(Map<String, dynamic> data) =>
+      (data['files'] as List<dynamic>? ?? [])
+          .whereType<Map<String, dynamic>>()
+          .map(_MediaFile.fromJson)
+          .toList();
+
   Future<void> _refresh() async {
     setState(() => _loading = true);
     try {
-        final prefs = await SharedPreferences.getInstance();
-        _deviceMac = prefs.getString('device_mac');
-        final uri = Uri.parse('$kBackendBaseUrl/api/media/files').replace(queryParameters: {
-          if (_deviceMac != null && _deviceMac!.isNotEmpty) 'device_mac': _deviceMac!,
-        });
-        final resp =
-          await _api.get(uri).timeout(
-        const Duration(seconds: 10),
-      );
-      if (resp.statusCode == 200) {
-        final data = json.decode(resp.body) as Map<String, dynamic>;
-        final list = data['files'] as List<dynamic>? ?? [];
+      final prefs = await SharedPreferences.getInstance();
+      _deviceMac = prefs.getString('device_mac');
+      final data = await _fetchPage(null);
+      if (data != null) {
         setState(() {
-          _files = list
-              .whereType<Map<String, dynamic>>()
-              .map(_MediaFile.fromJson)
-              .toList(growable: false);
+          _files = _parseFiles(data);
+          _nextCursor = data['next_cursor'] as String?;
+          _total = (data['total'] as num?)?.toInt() ?? _files.length;
         });
       }
     } catch (_) {
@@ -554,6 +569,26 @@ class _MediaManagerPageState extends State<_MediaManagerPage> {
     }
   }
 
+  /// Appends the next page; called as the grid nears its end.
+  Future<void> _loadMore() async {
+    final cursor = _nextCursor;
+    if (cursor == null || _loadingMore) return;
+    _loadingMore = true;
+    try {
+      final data = await _fetchPage(cursor);
+      if (data != null && mounted && cursor == _nextCursor) {
+        setState(() {
+          _files = [..._files, ..._parseFiles(data)];
+          _nextCursor = data['next_cursor'] as String?;
+        });
+      }
+    } catch (_) {
+      // ignore; the next scroll retries
+    } finally {
+      _loadingMore = false;
+    }
+  }
+
   Future<void> _pickAndUpload() async {
     final result = await FilePicker.platform.pickFiles(allowMultiple: true, withData: true);
     if (result == null || result.files.isEmpty) return;
@@ -722,6 +757,10 @@ class _MediaManagerPageState extends State<_MediaManagerPage> {
                   icon: const Icon(Icons.logout),
                   label: const Text('Logout'),
                 ),
+                if (_total > 0) ...[
+                  const SizedBox(width: 12),
+                  Text('$_total files', style: const TextStyle(fontSize: 12, color: Colors.white54)),
+                ],
                 if (_loading) ...[
                   const SizedBox(width: 12),
                   const SizedBox(
@@ -750,15 +789,16 @@ class _MediaManagerPageState extends State<_MediaManagerPage> {
                     ),
                     itemCount: _files.length,
                     itemBuilder: (ctx, index) {
+                      if (index >= _files.length - 6) _loadMore();
                       final f = _files[index];
                       return Card(
                         color: const Color(0xFF020617),
                         child: Column(
                           children: [
                             Expanded(
-                              child: f.type == 'image'
+                              child: f.thumb != null || f.type == 'image'
                                   ? Image.network(
-                                      '$kBackendBaseUrl${f.url}',
+                                      '$kBackendBaseUrl${f.thumb ?? f.url}',
                                       fit: BoxFit.cover,
                                       headers: _CookieStore.peekHeader(),
                                       errorBuilder: (_, __, ___) => const Icon(